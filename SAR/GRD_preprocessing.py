@@ -26,6 +26,8 @@ import geopandas as gpd
 from pathlib import Path
 from shapely.geometry import Polygon
 
+from scene_stats import write_scene_stats
+
 import time
 from functools import wraps
 
@@ -274,6 +276,9 @@ def _dpsvi_preprocessing(product, roi_wkt, outpath, date):
 
     ProductIO.writeProduct(S1_Orb_Cal_Spk_Sub, outpath + '/' + 'S0'+'_'+date+'_32723', 'GeoTIFF')
 
+    # Scene statistics sidecar (VV max, moments, histograms) - read later instead of rescanning the scene
+    write_scene_stats(outpath + '/' + 'S0'+'_'+date+'_32723' + '.tif', ['VH', 'VV'])
+
     return print('GRD product preprocessing for DPSVI: Done')
 
 @timing
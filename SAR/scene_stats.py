@@ -0,0 +1,164 @@
+'''
+Per-scene statistics sidecar
+
+Streams a preprocessed raster block by block and stores, per band, min/max, NaN count,
+mean/variance and a fixed-bin histogram in a JSON sidecar. Sidecars live in a sibling folder
+(<raster folder>_stats/<raster name>.stats.json) so the raster folders keep only the rasters.
+'''
+
+import json
+import os
+import numpy as np
+import rasterio as rst
+
+def _merge_moments(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+
+    """
+    Chan et al. parallel update of (count, mean, M2)
+    """
+
+    count = count_a + count_b
+
+    if count == 0:
+        return 0, 0.0, 0.0
+
+    delta = mean_b - mean_a
+
+    mean = mean_a + delta * count_b / count
+    m2 = m2_a + m2_b + delta * delta * count_a * count_b / count
+
+    return count, mean, m2
+
+def scene_statistics(raster_path, band_names, bins=256, hist_range=(0.0, 1.0)):
+
+    """
+    Streaming per-band statistics of a raster (block by block, constant memory)
+
+    Args:
+    raster_path (string) = path to the raster
+    band_names (list) = names of the raster bands (ex. ['VH', 'VV'])
+    bins (int) = number of histogram bins. Default = 256
+    hist_range (tuple) = fixed histogram range. Default = (0, 1) (linear sigma0)
+
+    Returns:
+        statistics (dict) per band name
+    """
+
+    stats = {name: {'count': 0, 'nan_count': 0, 'min': np.inf, 'max': -np.inf, 'mean': 0.0, 'm2': 0.0,
+                    'below': 0, 'above': 0, 'histogram': np.zeros(bins, dtype=np.int64)} for name in band_names}
+
+    with rst.open(raster_path) as src:
+
+        assert src.count == len(band_names), f'Band count does not match band_names! {raster_path}'
+
+        nodata = src.nodata
+
+        for _, window in src.block_windows(1):
+
+            block = src.read(window=window).astype(np.float64)
+
+            for band, name in zip(block, band_names):
+
+                band = band.ravel()
+
+                valid = ~np.isnan(band) if nodata is None or np.isnan(nodata) else (band != nodata) & ~np.isnan(band)
+                values = band[valid]
+
+                band_stats = stats[name]
+                band_stats['nan_count'] += int(band.size - values.size)
+
+                if values.size == 0:
+                    continue
+
+                band_stats['min'] = min(band_stats['min'], float(values.min()))
+                band_stats['max'] = max(band_stats['max'], float(values.max()))
+
+                block_mean = float(values.mean())
+                block_m2 = float(np.square(values - block_mean).sum())
+
+                band_stats['count'], band_stats['mean'], band_stats['m2'] = _merge_moments(band_stats['count'], band_stats['mean'], band_stats['m2'], values.size, block_mean, block_m2)
+
+                band_stats['below'] += int((values < hist_range[0]).sum())
+                band_stats['above'] += int((values > hist_range[1]).sum())
+                band_stats['histogram'] += np.histogram(values, bins=bins, range=hist_range)[0]
+
+    for name, band_stats in stats.items():
+
+        band_stats['variance'] = band_stats.pop('m2') / band_stats['count'] if band_stats['count'] else float('nan')
+        band_stats['histogram'] = band_stats['histogram'].tolist()
+        band_stats['hist_range'] = list(hist_range)
+
+        if band_stats['count'] == 0:
+            band_stats['min'] = band_stats['max'] = band_stats['mean'] = float('nan')
+
+    return stats
+
+def sidecar_path(raster_path):
+
+    stats_dir = os.path.normpath(os.path.dirname(os.path.abspath(raster_path))) + '_stats'
+
+    return os.path.join(stats_dir, os.path.basename(raster_path) + '.stats.json')
+
+def write_scene_stats(raster_path, band_names, bins=256, hist_range=(0.0, 1.0)):
+
+    """
+    Computes the scene statistics of a raster and writes them to its JSON sidecar
+
+    Args:
+    raster_path (string) = path to the raster
+    band_names (list) = names of the raster bands (ex. ['VH', 'VV'])
+    bins (int) = number of histogram bins. Default = 256
+    hist_range (tuple) = fixed histogram range. Default = (0, 1)
+
+    Returns:
+        statistics (dict) per band name
+    """
+
+    stats = scene_statistics(raster_path, band_names, bins, hist_range)
+
+    os.makedirs(os.path.dirname(sidecar_path(raster_path)), exist_ok=True)
+
+    with open(sidecar_path(raster_path), 'w') as sidecar:
+        json.dump(stats, sidecar, indent=4)
+
+    return stats
+
+def read_scene_stats(raster_path):
+
+    """
+    Reads the statistics sidecar of a raster
+
+    Args:
+    raster_path (string) = path to the raster
+
+    Returns:
+        statistics (dict) per band name, or None if the raster has no sidecar
+    """
+
+    if not os.path.exists(sidecar_path(raster_path)):
+        return None
+
+    with open(sidecar_path(raster_path)) as sidecar:
+        return json.load(sidecar)
+
+def load_scene_stats(raster_path, band_names=('VH', 'VV')):
+
+    """
+    Statistics sidecar of a raster, computed and written when the sidecar is missing
+
+    Args:
+    raster_path (string) = path to the raster
+    band_names (list) = names of the raster bands. Default = ('VH', 'VV') (GRD_preprocessing output)
+
+    Returns:
+        statistics (dict) per band name
+    """
+
+    stats = read_scene_stats(raster_path)
+
+    if stats is None:
+
+        print(f'No statistics sidecar for {raster_path}, computing it!')
+        stats = write_scene_stats(raster_path, list(band_names))
+
+    return stats
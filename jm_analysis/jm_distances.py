@@ -2,58 +2,38 @@ import numpy as np
 import pandas as pd
 import os
 
-def jm_distances_normal(set_1, set_2):
-
-    set_1_mean = np.mean(set_1)
-    set_2_mean = np.mean(set_2)
-    
-    set_1_std = np.std(set_1)
-    set_2_std = np.std(set_2)
-
-    sigma_1 = np.power(set_1_std, 2)
-    sigma_2 = np.power(set_2_std, 2)
+from jm_engine import build_moments_cache, jm_table, jm_distance
 
-    # The Bhattacharyya distance between two normal distributions
-    b_dist = 0.25 * np.log(0.25 * (sigma_1/sigma_2) + (sigma_1/sigma_2) + 2) + 0.25 * ((set_1_mean-set_2_mean)**2 / sigma_1 + sigma_2)
-
-    # Jeffries-Matusita distance
-    jm_dist = np.sqrt(2 * (1 - np.exp(-b_dist)))
-    
-    return jm_dist
-
-class1_path = 'D:/thesis_data/VEG_INDICES/samples/fs_dists/'
-class2_path = 'D:/thesis_data/VEG_INDICES/samples/fc_dists/'
+def jm_distances_normal(set_1, set_2):
 
-class1_list= os.listdir(class1_path)
-class2_list= os.listdir(class2_path)
-    
-index_list = ['DpRVI', 'PRVI','DPSVI', 'DPSVIm', 'RVI']
+    set_1 = np.ravel(set_1)
+    set_2 = np.ravel(set_2)
 
-data = {}
+    # Univariate case of the Gaussian JM distance (1 x 1 covariances)
+    return float(jm_distance(np.array([np.mean(set_1)]), np.array([[np.var(set_1)]]),
+                             np.array([np.mean(set_2)]), np.array([[np.var(set_2)]])))
 
-for i in range(len(os.listdir(class1_path))):
+if __name__ == "__main__":
 
-    class1_df = pd.read_csv(class1_path + os.listdir(class1_path)[i])
-    class2_df = pd.read_csv(class2_path + os.listdir(class2_path)[i])
+    class_paths = {'FF': 'D:/thesis_data/VEG_INDICES/samples/ff_dists/',
+                   'FS': 'D:/thesis_data/VEG_INDICES/samples/fs_dists/',
+                   'FC': 'D:/thesis_data/VEG_INDICES/samples/fc_dists/'}
 
-    for index in index_list:
-        
-        class1 = class1_df.filter(regex=f'^{index}', axis=1).values
-        class2 = class2_df.filter(regex=f'^{index}', axis=1).values
+    index_list = ['DpRVI', 'PRVI','DPSVI', 'DPSVIm', 'RVI']
 
-        if index not in data:
-            data[index] = []
+    output_path = 'D:/thesis_data/VEG_INDICES/jm_dists/'
 
-        jm_dist = jm_distances_normal(class1, class2)
+    # Count, mean vector and covariance of every (class, date), computed once
+    cache = build_moments_cache(class_paths, index_list, output_path + 'moments_cache.npz')
 
-        data[index].append(jm_dist)
-    
-    print(f'test {i} done!')
+    # Every class pair and date, each index alone and all the indices together
+    table = jm_table(cache)
 
-result = pd.DataFrame(data)
-    
-output_path = 'D:/thesis_data/VEG_INDICES/jm_dists/'
+    table.to_csv(output_path + 'jm_dists.csv', sep=',', index=False)
 
-result.to_csv(output_path + 'FS_FC_jm_dists.csv', sep=',', index=False)
+    fs_fc = table[(table['pair'] == 'FS_FC') & table['indices'].isin(index_list)]
 
+    result = fs_fc.pivot(index='date', columns='indices', values='jm')[index_list].reset_index(drop=True)
+    result.columns.name = None
 
+    result.to_csv(output_path + 'FS_FC_jm_dists.csv', sep=',', index=False)
@@ -0,0 +1,240 @@
+'''
+Gaussian Jeffries-Matusita distances from sufficient statistics
+
+The samples of each (class, date) are reduced once to (count, mean vector, covariance) of every index
+subset, each on the rows without NaN in its own indices, and cached, or taken from the sampling
+summaries (sampling/summary_store.py). Bhattacharyya and JM distances are then computed from the cache
+for every class pair, date and index subset at once:
+
+    B = 1/8 (m1 - m2)' S^-1 (m1 - m2) + 1/2 ln(det S / sqrt(det S1 det S2)),  S = (S1 + S2) / 2
+    JM = sqrt(2 (1 - exp(-B)))
+'''
+
+import os
+import re
+import sys
+import itertools
+import numpy as np
+import pandas as pd
+
+# Sufficient statistics kept during sampling (sampling/summary_store.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sampling'))
+from summary_store import load_summary, summary_total, summary_moments, summary_covariance
+
+def sample_moments(samples, index_list):
+
+    """
+    Count, mean vector and covariance (ddof = 0) of the index columns of a sample table (rows with NaN
+    in these columns dropped)
+    """
+
+    values = samples[index_list].dropna().to_numpy(dtype=np.float64)
+
+    mean = values.mean(axis=0)
+    centered = values - mean
+
+    return len(values), mean, centered.T @ centered / len(values)
+
+def default_subsets(index_list):
+
+    """
+    Each index alone and all the indices together
+    """
+
+    return [[index] for index in index_list] + ([list(index_list)] if len(index_list) > 1 else [])
+
+def build_moments_cache(class_paths, index_list, cache_path, subsets=None, date_pattern=r'(\d{8})'):
+
+    """
+    Sufficient statistics of every (class, date) sample csv and index subset, cached in a .npz (rebuilt
+    when the classes, indices, subsets or files change)
+
+    The rows dropped for NaN are those of the subset only, so the moments of one index do not lose the
+    pixels that are NaN in another index.
+
+    Args:
+    class_paths (dict) = {class name: folder of the per-date sample csv files}
+    index_list (list) = index columns (ex. ['DpRVI', 'PRVI', 'DPSVI', 'DPSVIm', 'RVI'])
+    cache_path (string) = .npz cache file
+    subsets (list) = index subsets (ex. [['DpRVI'], ['DpRVI', 'RVI']]). Default = None (each index alone and all together)
+    date_pattern (string) = regex that extracts the date from the file names. Default = 8 digits
+
+    Returns:
+        cache (dict) - classes, dates, indices, moments {'+'.join(subset): (count (classes, dates),
+        mean (classes, dates, k), cov (classes, dates, k, k))}
+    """
+
+    files = {class_name: {re.search(date_pattern, file).group(1): os.path.join(path, file)
+                          for file in sorted(os.listdir(path)) if file.endswith('.csv') and re.search(date_pattern, file)}
+             for class_name, path in class_paths.items()}
+
+    classes = list(class_paths)
+    dates = sorted(set.intersection(*(set(class_files) for class_files in files.values())))
+    subsets = default_subsets(index_list) if subsets is None else [list(subset) for subset in subsets]
+    names = ['+'.join(subset) for subset in subsets]
+
+    # Size and modification time: a sample csv regenerated under the same name invalidates the cache
+    key = '|'.join(classes + list(index_list) + names + [f'{files[c][d]}:{os.path.getsize(files[c][d])}:{os.path.getmtime(files[c][d])}'
+                                                         for c in classes for d in dates])
+
+    if os.path.exists(cache_path):
+
+        cached = np.load(cache_path)
+
+        if str(cached['key']) == key:
+            return {'classes': classes, 'dates': dates, 'indices': list(index_list),
+                    'moments': {name: (cached[f'count_{j}'], cached[f'mean_{j}'], cached[f'cov_{j}']) for j, name in enumerate(names)}}
+
+    moments = {name: (np.zeros((len(classes), len(dates))), np.zeros((len(classes), len(dates), len(subset))),
+                      np.zeros((len(classes), len(dates), len(subset), len(subset))))
+               for name, subset in zip(names, subsets)}
+
+    for c, class_name in enumerate(classes):
+        for d, date in enumerate(dates):
+
+            samples = pd.read_csv(files[class_name][date], usecols=index_list)
+
+            for name, subset in zip(names, subsets):
+
+                count, mean, cov = moments[name]
+                count[c, d], mean[c, d], cov[c, d] = sample_moments(samples, subset)
+
+        print(f'{class_name} moments cached!')
+
+    np.savez(cache_path, key=key, **{f'{field}_{j}': moments[name][f] for j, name in enumerate(names)
+                                     for f, field in enumerate(('count', 'mean', 'cov'))})
+
+    return {'classes': classes, 'dates': dates, 'indices': list(index_list), 'moments': moments}
+
+def summary_moments_cache(summary_path, classes, index_list, subsets=None, date_pattern=r'(\d{8})'):
+
+    """
+    Same cache as build_moments_cache, from the summaries saved by the sampling runner (no sample is read)
+
+    Single indices use the per-band moments of the summaries (pixels without NaN in that band); subsets of
+    several indices use the joint moments, kept over the pixels without NaN in any band.
+
+    Args:
+    summary_path (string) = folder of the <class>_<date>_summary.npz files
+    classes (list) = class names
+    index_list (list) = index columns
+    subsets (list) = index subsets. Default = None (each index alone and all together)
+    date_pattern (string) = regex that extracts the date from the file names. Default = 8 digits
+
+    Returns:
+        cache (dict) - see build_moments_cache
+    """
+
+    files = {}
+
+    for file in sorted(os.listdir(summary_path)):
+
+        found = re.search(date_pattern, file)
+
+        for class_name in classes:
+            if found and file.startswith(class_name + '_') and file.endswith('_summary.npz'):
+                files.setdefault(class_name, {})[found.group(1)] = os.path.join(summary_path, file)
+
+    dates = sorted(set.intersection(*(set(files.get(class_name, {})) for class_name in classes)))
+    subsets = default_subsets(index_list) if subsets is None else [list(subset) for subset in subsets]
+
+    moments = {'+'.join(subset): (np.zeros((len(classes), len(dates))), np.zeros((len(classes), len(dates), len(subset))),
+                                  np.zeros((len(classes), len(dates), len(subset), len(subset))))
+               for subset in subsets}
+
+    for c, class_name in enumerate(classes):
+        for d, date in enumerate(dates):
+
+            # Patch summaries are pooled into one class summary
+            summary = summary_total(load_summary(files[class_name][date]))
+
+            band_n, band_mean, band_var = summary_moments(summary)
+            joint_n, joint_mean, joint_cov = summary_covariance(summary)
+
+            for subset in subsets:
+
+                count, mean, cov = moments['+'.join(subset)]
+                k = [summary['band_names'].index(index) for index in subset]
+
+                if len(k) == 1:
+                    count[c, d], mean[c, d], cov[c, d] = band_n[0][k[0]], band_mean[0][k], band_var[0][k][:, None]
+                else:
+                    count[c, d], mean[c, d], cov[c, d] = joint_n[0], joint_mean[0][k], joint_cov[0][np.ix_(k, k)]
+
+    return {'classes': list(classes), 'dates': dates, 'indices': list(index_list), 'moments': moments}
+
+def bhattacharyya(mean_1, cov_1, mean_2, cov_2):
+
+    """
+    Bhattacharyya distance between Gaussians, batched over the leading dimensions
+
+    Args:
+    mean_1, mean_2 (arrays) = (..., k) mean vectors
+    cov_1, cov_2 (arrays) = (..., k, k) covariance matrices
+
+    Returns:
+        distance (array with the leading dimensions)
+    """
+
+    cov = (cov_1 + cov_2) / 2
+    delta = mean_1 - mean_2
+
+    mahalanobis = np.einsum('...i,...i->...', delta, np.linalg.solve(cov, delta[..., None])[..., 0])
+
+    _, logdet = np.linalg.slogdet(cov)
+    _, logdet_1 = np.linalg.slogdet(cov_1)
+    _, logdet_2 = np.linalg.slogdet(cov_2)
+
+    return mahalanobis / 8 + 0.5 * (logdet - 0.5 * (logdet_1 + logdet_2))
+
+def jm_distance(mean_1, cov_1, mean_2, cov_2):
+
+    """
+    Jeffries-Matusita distance between Gaussians (0 to sqrt(2)), batched over the leading dimensions
+    """
+
+    return np.sqrt(2 * (1 - np.exp(-bhattacharyya(mean_1, cov_1, mean_2, cov_2))))
+
+def jm_table(cache, subsets=None, pairs=None):
+
+    """
+    JM and Bhattacharyya distances of every class pair, date and index subset
+
+    Args:
+    cache (dict) = output of build_moments_cache or summary_moments_cache
+    subsets (list) = index subsets, all in the cache. Default = None (each index alone and all together)
+    pairs (list) = class pairs. Default = None (every pair)
+
+    Returns:
+        tidy DataFrame (date, pair, indices, bhattacharyya, jm)
+    """
+
+    classes = cache['classes']
+
+    subsets = default_subsets(cache['indices']) if subsets is None else subsets
+    pairs = list(itertools.combinations(classes, 2)) if pairs is None else pairs
+
+    first = [classes.index(p) for p, _ in pairs]
+    second = [classes.index(q) for _, q in pairs]
+
+    tables = []
+
+    for subset in subsets:
+
+        name = '+'.join(subset)
+
+        assert name in cache['moments'], f'Index subset not in the moments cache! {name}'
+
+        _, mean, cov = cache['moments'][name]
+
+        # (pairs, dates, k) means and (pairs, dates, k, k) covariances
+        mean_1, mean_2 = mean[first], mean[second]
+        cov_1, cov_2 = cov[first], cov[second]
+
+        tables.append(pd.DataFrame({'date': np.tile(cache['dates'], len(pairs)),
+                                    'pair': np.repeat([f'{p}_{q}' for p, q in pairs], len(cache['dates'])),
+                                    'indices': name,
+                                    'bhattacharyya': bhattacharyya(mean_1, cov_1, mean_2, cov_2).ravel(),
+                                    'jm': jm_distance(mean_1, cov_1, mean_2, cov_2).ravel()}))
+
+    return pd.concat(tables, ignore_index=True)
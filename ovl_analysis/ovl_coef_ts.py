@@ -1,53 +1,52 @@
 import pandas as pd
-import os
 import numpy as np
 
+from ovl_engine import build_histogram_cache, ovl_table, pair_ovl_table
+
 def overlap_coefficient(arr1, arr2, number_bins):
     # Determine the range over which the integration will occur
     min_value = min(np.min(arr1), np.min(arr2))
     max_value = max(np.max(arr1), np.max(arr2))
-    
+
     # Calculate the histogram for each array
     hist_arr1, _ = np.histogram(arr1, bins=number_bins, range=(min_value, max_value))
     hist_arr2, _ = np.histogram(arr2, bins=number_bins, range=(min_value, max_value))
 
     normed_hist1 = hist_arr1 / len(arr1)
     normed_hist2 = hist_arr2 / len(arr2)
-    
+
     # Calculate the overlap coefficient
     min_arr = np.minimum(normed_hist1, normed_hist2)
     overlap_coeff = np.sum(min_arr)
-    
+
     return overlap_coeff
 
-class1_path = 'D:/thesis_data/VEG_INDICES/samples/fs_dists/'
-class2_path = 'D:/thesis_data/VEG_INDICES/samples/fc_dists/'
+if __name__ == "__main__":
 
-data = {}
+    class_paths = {'FF': 'D:/thesis_data/VEG_INDICES/samples/ff_dists/',
+                   'FS': 'D:/thesis_data/VEG_INDICES/samples/fs_dists/',
+                   'FC': 'D:/thesis_data/VEG_INDICES/samples/fc_dists/'}
 
-index_list = ['DpRVI', 'PRVI','DPSVI', 'DPSVIm', 'RVI']
+    index_list = ['DpRVI', 'PRVI','DPSVI', 'DPSVIm', 'RVI']
 
-output_path = 'D:/thesis_data/VEG_INDICES/ovl/'
+    output_path = 'D:/thesis_data/VEG_INDICES/ovl/'
 
-for id, _ in enumerate(os.listdir(class1_path)):
+    # Bins between the min and max of each pair and date (original definition)
+    table = pair_ovl_table(class_paths, index_list, bins=500)
 
-    class1_df = pd.read_csv(class1_path + os.listdir(class1_path)[id])
-    class2_df = pd.read_csv(class2_path + os.listdir(class2_path)[id])
+    table.to_csv(output_path + 'OVL_500_bins.csv', sep=',', index=False)
 
-    for index in index_list:
+    out_df = table[table['pair'] == 'FS_FC'].pivot(index='date', columns='index', values='ovl')[index_list].reset_index(drop=True)
+    out_df.columns.name = None
 
-        class1_data = [value[0] for value in class1_df.filter(regex=f'^{index}', axis=1).values]
-        class2_data = [value[0] for value in class2_df.filter(regex=f'^{index}', axis=1).values]
+    out_df.to_csv(output_path + 'FS_FC_OVL_500_bins.csv', sep=',', index=False)
 
-        if index not in data:
-            data[index] = []
+    # One histogram per (class, date, index) on bin edges shared by all the classes and dates (comparable across dates)
+    cache = build_histogram_cache(class_paths, index_list, output_path + 'histograms_500_bins.npz', bins=500)
 
-        results = overlap_coefficient(class1_data, class2_data, 500)
-        
-        data[index].append(results)
+    ovl_table(cache).to_csv(output_path + 'OVL_500_bins_global_edges.csv', sep=',', index=False)
 
-    print(id)
-    
-out_df = pd.DataFrame(data)
+    # Binned KDE (Silverman bandwidth) on a fine grid, independent of the number of histogram bins
+    kde_cache = build_histogram_cache(class_paths, index_list, output_path + 'histograms_2048_bins.npz', bins=2048)
 
-out_df.to_csv(output_path+'FS_FC_OVL_500_bins.csv', sep=',', index=False)
+    ovl_table(kde_cache, method='kde', rule='silverman').to_csv(output_path + 'OVL_kde.csv', sep=',', index=False)
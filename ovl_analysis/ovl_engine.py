@@ -0,0 +1,393 @@
+'''
+Overlap coefficients from shared histograms
+
+Each (class, date) sample set is binned once per index on bin edges shared by every class and date
+(global range of the index), and kept in a histogram cache. The overlap coefficient of two sets is then
+
+    OVL = sum(min(p_k / n_p, q_k / n_q))
+
+computed for every index, date and class pair at once from the cached counts. The cache can also be
+taken from the sampling summaries (sampling/summary_store.py), whose histograms have fixed edges.
+
+pair_ovl_table keeps the original definition instead, with the edges of each pair and date taken from the
+range of its two sets (the samples of a date are read once for all the pairs).
+
+In the KDE mode the cached histograms are used as a fine binning grid (ex. 2048 bins): every histogram
+is convolved with a Gaussian kernel (Silverman or Scott bandwidth) by FFT, which gives the binned KDE
+of the set in O(n + g log g), and the OVL is the integral of the minimum of the two densities.
+'''
+
+import os
+import re
+import sys
+import itertools
+import numpy as np
+import pandas as pd
+
+# Sufficient statistics kept during sampling (sampling/summary_store.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sampling'))
+from summary_store import load_summary
+
+def global_edges(minimum, maximum, bins=500):
+
+    """
+    Equal-width bin edges of each index (indices, bins + 1) between its global minimum and maximum
+    """
+
+    return np.stack([np.linspace(low, high, bins + 1) for low, high in zip(minimum, maximum)])
+
+def histogram_counts(values, edges):
+
+    """
+    Histogram counts of each index on its edges (as np.histogram: last bin closed, values out of range
+    and NaN are not counted)
+
+    Args:
+    values (array) = (indices, samples) values
+    edges (array) = (indices, bins + 1) bin edges
+
+    Returns:
+        counts (indices, bins)
+    """
+
+    k, bins = edges.shape[0], edges.shape[1] - 1
+
+    counts = np.zeros((k, bins), dtype=np.int64)
+
+    for i in range(k):
+
+        band = values[i][~np.isnan(values[i])]
+        band = band[(band >= edges[i, 0]) & (band <= edges[i, -1])]
+
+        b = np.minimum(np.searchsorted(edges[i], band, side='right') - 1, bins - 1)
+
+        counts[i] = np.bincount(b, minlength=bins)
+
+    return counts
+
+def overlap(counts_p, counts_q, n_p=None, n_q=None):
+
+    """
+    Overlap coefficient of histograms with the same edges, batched over the leading dimensions
+
+    Args:
+    counts_p, counts_q (arrays) = (..., bins) histogram counts
+    n_p, n_q (arrays) = sample sizes (...). Default = None (sum of the counts)
+
+    Returns:
+        OVL (array with the leading dimensions)
+    """
+
+    n_p = counts_p.sum(axis=-1) if n_p is None else n_p
+    n_q = counts_q.sum(axis=-1) if n_q is None else n_q
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.minimum(counts_p / np.asarray(n_p)[..., None], counts_q / np.asarray(n_q)[..., None]).sum(axis=-1)
+
+def kde_bandwidth(counts, edges, n=None, rule='silverman'):
+
+    """
+    Gaussian kernel bandwidth of binned samples (standard deviation and IQR from the bin centers)
+
+    silverman - 0.9 min(std, IQR / 1.34) n^(-1/5)
+    scott     - 1.06 std n^(-1/5)
+
+    Args:
+    counts (array) = (..., bins) histogram counts
+    edges (array) = (bins + 1) bin edges, or (..., bins + 1)
+    n (array) = sample sizes (...). Default = None (sum of the counts)
+    rule (string) = 'silverman' or 'scott'. Default = 'silverman'
+
+    Returns:
+        bandwidth (array with the leading dimensions)
+    """
+
+    assert rule in ('silverman', 'scott'), f'Unknown bandwidth rule! {rule}'
+
+    centers = (edges[..., :-1] + edges[..., 1:]) / 2
+    total = counts.sum(axis=-1)
+    n = total if n is None else n
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        mean = (counts * centers).sum(axis=-1) / total
+        std = np.sqrt((counts * np.square(centers - mean[..., None])).sum(axis=-1) / total)
+
+        if rule == 'scott':
+            return 1.06 * std * np.power(n, -0.2)
+
+        cumulative = np.cumsum(counts, axis=-1) / total[..., None]
+        q1 = np.take_along_axis(np.broadcast_to(centers, counts.shape), np.argmax(cumulative >= 0.25, axis=-1)[..., None], axis=-1)[..., 0]
+        q3 = np.take_along_axis(np.broadcast_to(centers, counts.shape), np.argmax(cumulative >= 0.75, axis=-1)[..., None], axis=-1)[..., 0]
+
+        spread = np.where(q3 > q1, np.minimum(std, (q3 - q1) / 1.34), std)
+
+        return 0.9 * spread * np.power(n, -0.2)
+
+def binned_kde(counts, edges, bandwidth, n=None, padding=5.0):
+
+    """
+    Gaussian KDE of binned samples by FFT convolution, batched over the leading dimensions
+
+    The grid is extended by padding bandwidths on both sides, so the density keeps all its mass and the
+    circular convolution does not wrap around.
+
+    Args:
+    counts (array) = (..., bins) histogram counts
+    edges (array) = (bins + 1) equal-width bin edges shared by all the sets
+    bandwidth (array) = kernel bandwidth of each set (...)
+    n (array) = sample sizes (...). Default = None (sum of the counts)
+    padding (float) = bandwidths added on each side of the grid. Default = 5
+
+    Returns:
+        density (..., bins + 2 pad) on the extended grid, grid step
+    """
+
+    step = edges[1] - edges[0]
+    n = counts.sum(axis=-1) if n is None else n
+
+    h = np.nan_to_num(np.asarray(bandwidth, dtype=np.float64) / step)
+    pad = int(np.ceil(padding * max(np.max(h, initial=0.0), 1.0)))
+
+    size = counts.shape[-1] + 2 * pad
+    length = 1 << int(np.ceil(np.log2(size)))
+
+    grid = np.zeros(counts.shape[:-1] + (length,))
+    grid[..., pad:pad + counts.shape[-1]] = counts
+
+    # Fourier transform of a Gaussian with standard deviation h (in bins)
+    frequency = np.fft.rfftfreq(length)
+    kernel = np.exp(-2 * np.square(np.pi * frequency) * np.square(h)[..., None])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        density = np.fft.irfft(np.fft.rfft(grid, axis=-1) * kernel, n=length, axis=-1)[..., :size] / (np.asarray(n)[..., None] * step)
+
+    return np.maximum(density, 0.0), step
+
+def kde_overlap(counts_p, counts_q, edges, n_p=None, n_q=None, rule='silverman'):
+
+    """
+    Overlap coefficient of the binned KDEs of two sets of histograms with the same edges (batched)
+
+    Returns:
+        OVL (array with the leading dimensions)
+    """
+
+    counts = np.stack(np.broadcast_arrays(counts_p, counts_q))
+    n = None if n_p is None else np.stack(np.broadcast_arrays(n_p, n_q))
+
+    density, step = binned_kde(counts, edges, kde_bandwidth(counts, edges, n, rule), n)
+
+    return np.minimum(density[0], density[1]).sum(axis=-1) * step
+
+def _dated_files(class_paths, date_pattern):
+
+    files = {class_name: {re.search(date_pattern, file).group(1): os.path.join(path, file)
+                          for file in sorted(os.listdir(path)) if file.endswith('.csv') and re.search(date_pattern, file)}
+             for class_name, path in class_paths.items()}
+
+    return files, sorted(set.intersection(*(set(class_files) for class_files in files.values())))
+
+def build_histogram_cache(class_paths, index_list, cache_path, bins=500, ranges=None, date_pattern=r'(\d{8})'):
+
+    """
+    Histograms of every (class, date) sample csv on shared edges, cached in a .npz (rebuilt when the
+    classes, indices, files, bins or ranges change)
+
+    Args:
+    class_paths (dict) = {class name: folder of the per-date sample csv files}
+    index_list (list) = index columns (ex. ['DpRVI', 'PRVI', 'DPSVI', 'DPSVIm', 'RVI'])
+    cache_path (string) = .npz cache file
+    bins (int) = histogram bins. Default = 500
+    ranges (dict) = fixed range of each index {name: [min, max]}. Default = None (global min/max of the samples,
+                    one extra pass over the files)
+    date_pattern (string) = regex that extracts the date from the file names. Default = 8 digits
+
+    Returns:
+        cache (dict) - classes, dates, indices, edges (indices, bins + 1), counts (classes, dates, indices, bins),
+        n (classes, dates, indices) sample sizes
+    """
+
+    files, dates = _dated_files(class_paths, date_pattern)
+    classes = list(class_paths)
+
+    # Size and modification time: a sample csv regenerated under the same name invalidates the cache
+    key = '|'.join(classes + list(index_list) + [f'{files[c][d]}:{os.path.getsize(files[c][d])}:{os.path.getmtime(files[c][d])}'
+                                                 for c in classes for d in dates] + [str(bins), str(ranges)])
+
+    if os.path.exists(cache_path):
+
+        cached = np.load(cache_path)
+
+        if str(cached['key']) == key:
+            return {'classes': classes, 'dates': dates, 'indices': list(index_list),
+                    'edges': cached['edges'], 'counts': cached['counts'], 'n': cached['n']}
+
+    if ranges is None:
+
+        minimum, maximum = np.full(len(index_list), np.inf), np.full(len(index_list), -np.inf)
+
+        for class_name in classes:
+            for date in dates:
+
+                samples = pd.read_csv(files[class_name][date], usecols=index_list)[index_list]
+
+                minimum = np.fmin(minimum, samples.min().to_numpy())
+                maximum = np.fmax(maximum, samples.max().to_numpy())
+
+    else:
+
+        minimum, maximum = (np.array([ranges[index][i] for index in index_list]) for i in (0, 1))
+
+    edges = global_edges(minimum, maximum, bins)
+
+    counts = np.zeros((len(classes), len(dates), len(index_list), bins), dtype=np.int64)
+    n = np.zeros((len(classes), len(dates), len(index_list)))
+
+    for c, class_name in enumerate(classes):
+        for d, date in enumerate(dates):
+
+            values = pd.read_csv(files[class_name][date], usecols=index_list)[index_list].to_numpy(dtype=np.float64).T
+
+            counts[c, d] = histogram_counts(values, edges)
+            n[c, d] = (~np.isnan(values)).sum(axis=1)
+
+        print(f'{class_name} histograms cached!')
+
+    np.savez(cache_path, key=key, edges=edges, counts=counts, n=n)
+
+    return {'classes': classes, 'dates': dates, 'indices': list(index_list), 'edges': edges, 'counts': counts, 'n': n}
+
+def summary_histogram_cache(summary_path, classes, index_list, date_pattern=r'(\d{8})'):
+
+    """
+    Same cache as build_histogram_cache, from the summaries saved by the sampling runner (patch histograms
+    are added into one class histogram)
+
+    Args:
+    summary_path (string) = folder of the <class>_<date>_summary.npz files
+    classes (list) = class names
+    index_list (list) = index names
+    date_pattern (string) = regex that extracts the date from the file names. Default = 8 digits
+
+    Returns:
+        cache (dict) - see build_histogram_cache
+    """
+
+    files = {}
+
+    for file in sorted(os.listdir(summary_path)):
+
+        found = re.search(date_pattern, file)
+
+        for class_name in classes:
+            if found and file.startswith(class_name + '_') and file.endswith('_summary.npz'):
+                files.setdefault(class_name, {})[found.group(1)] = os.path.join(summary_path, file)
+
+    dates = sorted(set.intersection(*(set(files.get(class_name, {})) for class_name in classes)))
+
+    counts, n, edges = [], [], None
+
+    for class_name in classes:
+        for date in dates:
+
+            summary = load_summary(files[class_name][date])
+            k = [summary['band_names'].index(index) for index in index_list]
+
+            edges = summary['edges'][k] if edges is None else edges
+            assert np.array_equal(summary['edges'][k], edges), f'Summary histogram edges do not match! {files[class_name][date]}'
+
+            counts.append(summary['histogram'][:, k].sum(axis=0))
+            n.append(summary['count'][:, k].sum(axis=0))
+
+    shape = (len(classes), len(dates), len(index_list))
+
+    return {'classes': list(classes), 'dates': dates, 'indices': list(index_list), 'edges': edges,
+            'counts': np.array(counts).reshape(shape + (-1,)), 'n': np.array(n).reshape(shape)}
+
+def pair_ovl_table(class_paths, index_list, pairs=None, bins=500, date_pattern=r'(\d{8})'):
+
+    """
+    Overlap coefficients of every class pair, date and index on the edges of each pair and date
+    (bins between the min and max of the two sets, as the original overlap_coefficient)
+
+    Args:
+    class_paths (dict) = {class name: folder of the per-date sample csv files}
+    index_list (list) = index columns (ex. ['DpRVI', 'PRVI', 'DPSVI', 'DPSVIm', 'RVI'])
+    pairs (list) = class pairs. Default = None (every pair)
+    bins (int) = histogram bins. Default = 500
+    date_pattern (string) = regex that extracts the date from the file names. Default = 8 digits
+
+    Returns:
+        tidy DataFrame (date, pair, index, ovl)
+    """
+
+    files, dates = _dated_files(class_paths, date_pattern)
+    pairs = list(itertools.combinations(class_paths, 2)) if pairs is None else pairs
+
+    ovl = np.zeros((len(pairs), len(dates), len(index_list)))
+
+    for d, date in enumerate(dates):
+
+        values = {class_name: pd.read_csv(files[class_name][date], usecols=index_list)[index_list].to_numpy(dtype=np.float64).T
+                  for class_name in set(itertools.chain(*pairs))}
+
+        for j, (p, q) in enumerate(pairs):
+
+            edges = global_edges(np.fmin(np.nanmin(values[p], axis=1), np.nanmin(values[q], axis=1)),
+                                 np.fmax(np.nanmax(values[p], axis=1), np.nanmax(values[q], axis=1)), bins)
+
+            ovl[j, d] = overlap(histogram_counts(values[p], edges), histogram_counts(values[q], edges),
+                                (~np.isnan(values[p])).sum(axis=1), (~np.isnan(values[q])).sum(axis=1))
+
+    return _ovl_frame(dates, pairs, list(index_list), ovl)
+
+def _ovl_frame(dates, pairs, indices, ovl):
+
+    return pd.DataFrame({'date': np.tile(np.repeat(dates, len(indices)), len(pairs)),
+                         'pair': np.repeat([f'{p}_{q}' for p, q in pairs], len(dates) * len(indices)),
+                         'index': np.tile(indices, len(pairs) * len(dates)),
+                         'ovl': ovl.ravel()})
+
+def ovl_table(cache, pairs=None, method='histogram', rule='silverman'):
+
+    """
+    Overlap coefficients of every class pair, date and index
+
+    Args:
+    cache (dict) = output of build_histogram_cache or summary_histogram_cache
+    pairs (list) = class pairs. Default = None (every pair)
+    method (string) = 'histogram' or 'kde' (binned KDE of the cached histograms). Default = 'histogram'
+    rule (string) = KDE bandwidth rule, 'silverman' or 'scott'. Default = 'silverman'
+
+    Returns:
+        tidy DataFrame (date, pair, index, ovl)
+    """
+
+    classes = cache['classes']
+    pairs = list(itertools.combinations(classes, 2)) if pairs is None else pairs
+
+    first = [classes.index(p) for p, _ in pairs]
+    second = [classes.index(q) for _, q in pairs]
+
+    assert method in ('histogram', 'kde'), f'Unknown OVL method! {method}'
+
+    if method == 'histogram':
+
+        # (pairs, dates, indices)
+        ovl = overlap(cache['counts'][first], cache['counts'][second], cache['n'][first], cache['n'][second])
+
+    else:
+
+        # The densities of each class are computed once per index (each index has its own grid)
+        ovl = np.zeros((len(pairs), len(cache['dates']), len(cache['indices'])))
+
+        for i in range(len(cache['indices'])):
+
+            counts, edges = cache['counts'][:, :, i], cache['edges'][i]
+
+            density, step = binned_kde(counts, edges, kde_bandwidth(counts, edges, cache['n'][:, :, i], rule), cache['n'][:, :, i])
+
+            ovl[:, :, i] = np.minimum(density[first], density[second]).sum(axis=-1) * step
+
+    return _ovl_frame(cache['dates'], pairs, cache['indices'], ovl)
@@ -0,0 +1,181 @@
+'''
+Bounded-memory raster reductions
+
+Scene-level statistics (nanmax/nanmin, moments, histograms, counts) computed block by block:
+the raster is read in row strips sized to a memory budget, an optional ROI is rasterized for each strip
+only (kept inside, or outside with invert=True, as rasterio.mask), and the partial results of the strips
+are merged. Strips are split between worker threads (one dataset handle per worker), and rasters of a
+date stack can be reduced in parallel.
+'''
+
+import os
+import sys
+import numpy as np
+import rasterio as rst
+from concurrent.futures import ThreadPoolExecutor
+from rasterio.features import geometry_mask
+from rasterio.windows import Window, transform as window_transform
+
+# Chan merge of (count, mean, M2) (SAR/scene_stats.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SAR'))
+from scene_stats import _merge_moments
+
+# Reducers - init(params), update(state, values, params), merge(state_a, state_b), finalize(state, params)
+
+def _extreme(function, start):
+
+    def update(state, values, params):
+        return state if values.size == 0 else function(state, float(function.reduce(values)))
+
+    return (lambda params: start, update, function, lambda state, params: float(state) if np.isfinite(state) else np.nan)
+
+def _moments_update(state, values, params):
+
+    if values.size == 0:
+        return state
+
+    mean = float(values.mean())
+
+    return _merge_moments(*state, values.size, mean, float(np.square(values - mean).sum()))
+
+def _moments_finalize(state, params):
+
+    count, mean, m2 = state
+
+    return {'count': int(count), 'mean': mean if count else np.nan, 'variance': m2 / count if count else np.nan}
+
+def _histogram_init(params):
+
+    return np.zeros(params.get('bins', 256), dtype=np.int64)
+
+def _histogram_update(state, values, params):
+
+    return state + np.histogram(values, bins=params.get('bins', 256), range=tuple(params.get('range', (0.0, 1.0))))[0]
+
+REDUCERS = {'max': _extreme(np.maximum, -np.inf),
+            'min': _extreme(np.minimum, np.inf),
+            'count': (lambda params: 0, lambda state, values, params: state + values.size, lambda a, b: a + b, lambda state, params: int(state)),
+            'sum': (lambda params: 0.0, lambda state, values, params: state + float(values.sum()), lambda a, b: a + b, lambda state, params: state),
+            'moments': (lambda params: (0, 0.0, 0.0), _moments_update, lambda a, b: _merge_moments(*a, *b), _moments_finalize),
+            'histogram': (_histogram_init, _histogram_update, lambda a, b: a + b, lambda state, params: state)}
+
+def _reduction_params(reductions):
+
+    reductions = {name: {} for name in reductions} if isinstance(reductions, (list, tuple)) else dict(reductions)
+
+    for name in reductions:
+        assert name in REDUCERS, f'Unknown reduction! {name}'
+
+    return reductions
+
+def strip_windows(src, bands, memory_mb=256):
+
+    """
+    Full-width row strips whose float64 read of the selected bands fits the memory budget
+    (aligned to the raster block height when the budget allows)
+    """
+
+    row_bytes = src.width * len(bands) * 8
+
+    rows = max(int(memory_mb * 2 ** 20 // row_bytes), 1)
+
+    block_rows = src.block_shapes[0][0]
+
+    if rows >= block_rows:
+        rows -= rows % block_rows
+
+    return [Window(0, row_off, src.width, min(rows, src.height - row_off)) for row_off in range(0, src.height, rows)]
+
+def _reduce_windows(raster_path, windows, bands, reductions, roi, invert):
+
+    states = {name: [REDUCERS[name][0](params) for _ in bands] for name, params in reductions.items()}
+
+    with rst.open(raster_path) as src:
+
+        for window in windows:
+
+            block = src.read(bands, window=window, masked=True).astype(np.float64).filled(np.nan)
+
+            keep = ~np.isnan(block)
+
+            if roi is not None:
+                inside = geometry_mask(roi, out_shape=block.shape[1:], transform=window_transform(window, src.transform), invert=True)
+                keep &= (inside != invert)[None]
+
+            for k in range(len(bands)):
+
+                values = block[k][keep[k]]
+
+                for name, params in reductions.items():
+                    states[name][k] = REDUCERS[name][1](states[name][k], values, params)
+
+    return states
+
+def reduce_raster(raster_path, reductions, bands=None, band_names=None, roi=None, invert=False, memory_mb=256, workers=1):
+
+    """
+    Block-wise reductions of a raster with bounded memory (NaN and nodata ignored)
+
+    Args:
+    raster_path (string) = raster file
+    reductions (list or dict) = reduction names ('max', 'min', 'count', 'sum', 'moments', 'histogram'),
+                                or {name: params} (ex. {'histogram': {'bins': 256, 'range': [0, 1]}})
+    bands (list) = 1-based band indexes. Default = None (all bands)
+    band_names (list) = names of the selected bands. Default = None (band indexes)
+    roi (list) = ROI geometries in the raster CRS. Default = None (whole scene)
+    invert (bool) = reduce the pixels outside the ROI instead of inside. Default = False
+    memory_mb (float) = memory budget of one strip read, per worker. Default = 256
+    workers (int) = threads reducing the strips. Default = 1
+
+    Returns:
+        dict {reduction: {band name: result}}
+    """
+
+    reductions = _reduction_params(reductions)
+
+    with rst.open(raster_path) as src:
+
+        bands = list(range(1, src.count + 1)) if bands is None else list(bands)
+        windows = strip_windows(src, bands, memory_mb)
+
+    band_names = bands if band_names is None else band_names
+
+    chunks = [chunk for chunk in np.array_split(np.arange(len(windows)), max(min(workers, len(windows)), 1)) if chunk.size]
+
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        partials = list(executor.map(lambda chunk: _reduce_windows(raster_path, [windows[i] for i in chunk], bands, reductions, roi, invert), chunks))
+
+    result = {}
+
+    for name, params in reductions.items():
+
+        _, _, merge, finalize = REDUCERS[name]
+
+        merged = partials[0][name]
+
+        for partial in partials[1:]:
+            merged = [merge(a, b) for a, b in zip(merged, partial[name])]
+
+        result[name] = {band_name: finalize(state, params) for band_name, state in zip(band_names, merged)}
+
+    return result
+
+def reduce_rasters(raster_paths, reductions, bands=None, band_names=None, roi=None, invert=False, memory_mb=256, workers=4):
+
+    """
+    Block-wise reductions of every raster of a date stack, with the rasters reduced in parallel
+
+    Args:
+    raster_paths (dict) = {date: raster file}
+    workers (int) = rasters reduced at the same time (memory = workers x memory_mb). Default = 4
+    other args = see reduce_raster
+
+    Returns:
+        dict {date: reduce_raster result}
+    """
+
+    def _reduce(date):
+        return date, reduce_raster(raster_paths[date], reductions, bands, band_names, roi, invert, memory_mb)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(_reduce, raster_paths))
@@ -1,10 +1,12 @@
 import numpy as np
 import geopandas as gpd
 import rasterio as rst
-from rasterio.mask import mask
 import pandas as pd
 import os
 
+from zone_index import load_zone_index
+from static_layers import load_static_layers, layer_values
+
 # from rasterstats import point_query
 
 form_florestal = gpd.read_file('D:/thesis_data/ROI/sampling/FF_sampling_grid_25m_32723.GEOJSON')
@@ -18,57 +20,39 @@ campestre_geom = [geom for geom in form_campestre.geometry]
 
 indices_path = os.listdir('D:/thesis_data/VEG_INDICES/raster')
 
-for index, image in enumerate(indices_path):
-
-    date = indices_path[index].split('T')[0]
-
-    with rst.open('D:/thesis_data/VEG_INDICES/raster/' + str(image)) as raster:
-        indices_clipped, indices_transform = mask(raster, florestal_geom, crop=True, nodata=np.nan)
+# Polygon -> pixel indices, built once per (geometry set, raster grid) and cached on disk
+zone_index_path = 'D:/thesis_data/VEG_INDICES/zone_index/'
+os.makedirs(zone_index_path, exist_ok=True)
 
-        dprvi = indices_clipped[0]
-        prvi = indices_clipped[1]
-        dpsvi = indices_clipped[2]
-        dpsvim = indices_clipped[3]
-        rvi = indices_clipped[4]
+class_geoms = {'florestal': florestal_geom, 'savanica': savanica_geom, 'campestre': campestre_geom}
 
-    df_florestal = pd.DataFrame({'DpRVI': dprvi.flatten(), 'PRVI': prvi.flatten(), 'DPSVI': dpsvi.flatten(), 'DPSVIm': dpsvim.flatten(), 'RVI': rvi.flatten()})
-    df_florestal.dropna(inplace=True)
+# Static layers warped once onto the index grid (memory-mapped) and attached to every sampled pixel
+static_layers = load_static_layers({'slope': 'D:/thesis_data/TOPOGRAPHY/slope_32723.tif'},
+                                   'D:/thesis_data/VEG_INDICES/raster/' + str(indices_path[0]), 'D:/thesis_data/VEG_INDICES/static_layers/')
 
-    df_florestal.to_csv('D:/thesis_data/VEG_INDICES/samples/' + 'florestal_' + date + '_distribution' + '.csv', sep=',')
+for index, image in enumerate(indices_path):
 
-    print(f'Florestal data of {date} collected!')
+    date = indices_path[index].split('T')[0]
 
     with rst.open('D:/thesis_data/VEG_INDICES/raster/' + str(image)) as raster:
-        indices_clipped, indices_transform = mask(raster, savanica_geom, crop=True, nodata=np.nan)
-
-        dprvi = indices_clipped[0]
-        prvi = indices_clipped[1]
-        dpsvi = indices_clipped[2]
-        dpsvim = indices_clipped[3]
-        rvi = indices_clipped[4]
+        indices = raster.read(masked=True).astype(np.float32).filled(np.nan)
+        indices_transform = raster.transform
 
-    df_savanica = pd.DataFrame({'DpRVI': dprvi.flatten(), 'PRVI': prvi.flatten(), 'DPSVI': dpsvi.flatten(), 'DPSVIm': dpsvim.flatten(), 'RVI': rvi.flatten()})
-    df_savanica.dropna(inplace=True)
+    for class_name, geoms in class_geoms.items():
 
-    df_savanica.to_csv('D:/thesis_data/VEG_INDICES/samples/' + 'savanica_' + date + '_distribution' + '.csv', sep=',')
+        zones = load_zone_index(zone_index_path + class_name + '_sampling_grid_25m.npz', geoms, indices.shape[1:], indices_transform)
 
-    print(f'Savanica data of {date} collected!')
-
-    with rst.open('D:/thesis_data/VEG_INDICES/raster/' + str(image)) as raster:
-        indices_clipped, indices_transform = mask(raster, campestre_geom, crop=True, nodata=np.nan)
+        # Union of the class polygons (flat pixel indices, row-major as in the cropped mask)
+        pixels = np.unique(zones.indices)
 
-        dprvi = indices_clipped[0]
-        prvi = indices_clipped[1]
-        dpsvi = indices_clipped[2]
-        dpsvim = indices_clipped[3]
-        rvi = indices_clipped[4]
+        dprvi, prvi, dpsvi, dpsvim, rvi = indices.reshape(indices.shape[0], -1)[:5, pixels]
 
-    df_campestre = pd.DataFrame({'DpRVI': dprvi.flatten(), 'PRVI': prvi.flatten(), 'DPSVI': dpsvi.flatten(), 'DPSVIm': dpsvim.flatten(), 'RVI': rvi.flatten()})
-    df_campestre.dropna(inplace=True)
+        df_class = pd.DataFrame({'DpRVI': dprvi, 'PRVI': prvi, 'DPSVI': dpsvi, 'DPSVIm': dpsvim, 'RVI': rvi, **layer_values(static_layers, pixels)}, index=pixels)
+        df_class.dropna(subset=['DpRVI', 'PRVI', 'DPSVI', 'DPSVIm', 'RVI'], inplace=True)
 
-    df_campestre.to_csv('D:/thesis_data/VEG_INDICES/samples/' + 'campestre_' + date + '_distribution' + '.csv', sep=',')
+        df_class.to_csv('D:/thesis_data/VEG_INDICES/samples/' + class_name + '_' + date + '_distribution' + '.csv', sep=',')
 
-    print(f'Campestre data of {date} collected!')
+        print(f'{class_name.capitalize()} data of {date} collected!')
 
 
 
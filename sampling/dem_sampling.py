@@ -1,21 +1,28 @@
 import numpy as np
 import geopandas as gpd
 import rasterio as rst
-from rasterio.mask import mask
 import pandas as pd
 import os
 
+from zone_index import load_zone_index
+from static_layers import load_static_layers, layer_values
+
 pnb = gpd.read_file('D:/thesis_data/ROI/classes/form_campestre_10m_32723.GEOJSON')
 pnb_geom = [geom for geom in pnb.geometry]
 
-raster_path = 'D:/thesis_data/TOPOGRAPHY/slope_32723.tif'
+reference_path = 'D:/thesis_data/VEG_INDICES/raster/' + str(os.listdir('D:/thesis_data/VEG_INDICES/raster')[0])
+
+with rst.open(reference_path) as raster:
+    out_shape, raster_transform = (raster.height, raster.width), raster.transform
+
+# Slope warped once onto the index grid, so the samples share the pixel ids (csv index) of the index samples
+static_layers = load_static_layers({'slope': 'D:/thesis_data/TOPOGRAPHY/slope_32723.tif'}, reference_path, 'D:/thesis_data/VEG_INDICES/static_layers/')
 
-with rst.open(raster_path) as raster:
-    raster_clipped, raster_transform = mask(raster, pnb_geom, crop=True, nodata=-1)
+zones = load_zone_index('D:/thesis_data/VEG_INDICES/zone_index/campestre_10m.npz', pnb_geom, out_shape, raster_transform)
 
-    dem = raster_clipped[0]
+pixels = np.unique(zones.indices)
 
-df_dem = pd.DataFrame({'slope': dem.flatten()})
+df_dem = pd.DataFrame(layer_values(static_layers, pixels), index=pixels)
 df_dem.dropna(inplace=True)
 
-df_dem.to_csv('D:/thesis_data/TOPOGRAPHY/slope_fc_samples.csv', sep=',', index=False)
+df_dem.to_csv('D:/thesis_data/TOPOGRAPHY/slope_fc_samples.csv', sep=',')
\ No newline at end of file
@@ -1,10 +1,12 @@
 import numpy as np
 import geopandas as gpd
 import rasterio as rst
-from rasterio.mask import mask
 import pandas as pd
 import os
 
+from patch_windows import sample_patches
+from sample_store import write_samples
+
 
 form_florestal = gpd.read_file('D:/thesis_data/ROI/sampling/sample_grid_mapbiomas/FF_mapbiomas_50_sampling_grids_20m_32723.GEOJSON')
 florestal_geom = [geom for geom in form_florestal.geometry]
@@ -19,68 +21,24 @@ raster_path = 'D:/thesis_data/VEG_INDICES/dpsvi_parameters/raster/'
 
 indices_list = os.listdir(raster_path)
 
+class_patches = {'FF': florestal_geom, 'FS': savanica_geom, 'FC': campestre_geom}
 
-# Gallery Forests
-for index, image in enumerate(indices_list):
-
-    date = indices_list[index].split('_')[2].split('.')[0]
-
-    df_ff = pd.DataFrame()
-
-    for (i, _) in enumerate(florestal_geom):
-
-        with rst.open(raster_path + str(image)) as raster:
-            indices_clipped, indices_transform = mask(raster, [florestal_geom[i]], crop=True, nodata=np.nan)
-
-            dpsvi = indices_clipped[2]
-
-        df_ff[f'dpsvi_patch_{i}'] = pd.Series(dpsvi.flatten())
-        df_ff.dropna(inplace=True)
-
-    df_ff.to_csv('D:/thesis_data/VEG_INDICES/dpsvi_parameters/samples/' + 'FF_' + date + '_20m_patches' + '.csv', sep=',', index=False)
-
-    print(f'Forest data patches of {date} collected!')
-
+class_labels = {'FF': 'Forest', 'FS': 'Savanna', 'FC': 'Grasslands'}
 
-# Savanna
-for index, image in enumerate(indices_list):
-
-    date = indices_list[index].split('_')[2].split('.')[0]
-
-    df_fs = pd.DataFrame()
-
-    for (i, _) in enumerate(savanica_geom):
-
-        with rst.open(raster_path + str(image)) as raster:
-            indices_clipped, indices_transform = mask(raster, [savanica_geom[i]], crop=True, nodata=np.nan)
+# Long-format Parquet sample store (partitioned by class and date)
+sample_store_path = 'D:/thesis_data/VEG_INDICES/dpsvi_parameters/samples/store/20m/'
 
 
-            dpsvi = indices_clipped[2]
-
-        df_fs[f'dpsvi_patch_{i}'] = pd.Series(dpsvi.flatten())
-        df_fs.dropna(inplace=True)
-
-    df_fs.to_csv('D:/thesis_data/VEG_INDICES/dpsvi_parameters/samples/' + 'FS_' + date + '_20m_patches' + '.csv', sep=',', index=False)
-
-    print(f'Savanna data patches of {date} collected!')
-
-
-# Grasslands
+# Gallery Forests, Savanna and Grasslands - each raster is opened once and every patch is read in one sweep
 for index, image in enumerate(indices_list):
 
     date = indices_list[index].split('_')[2].split('.')[0]
 
-    df_fc = pd.DataFrame()
-
-    for (i, _) in enumerate(campestre_geom):
+    with rst.open(raster_path + str(image)) as raster:
+        patches = sample_patches(raster, class_patches, bands=[3]) # DPSVI
 
-        with rst.open(raster_path + str(image)) as raster:
-            indices_clipped, indices_transform = mask(raster, [campestre_geom[i]], crop=True, nodata=np.nan)
+    for class_name, class_samples in patches.items():
 
-            dpsvi = indices_clipped[2]
-        
-        df_fc[f'dpsvi_patch_{i}'] = pd.Series(dpsvi.flatten())
-        df_fc.dropna(inplace=True)
+        write_samples(sample_store_path, date, class_name, class_samples, ['dpsvi'])
 
-    df_fc.to_csv('D:/thesis_data/VEG_INDICES/dpsvi_parameters/samples/' + 'FC_' + date + '_20m_patches' + '.csv', sep=',', index=False)
-    print(f'Grasslands data patches of {date} collected!')
\ No newline at end of file
+        print(f'{class_labels[class_name]} data patches of {date} collected!')
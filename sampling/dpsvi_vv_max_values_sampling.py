@@ -3,8 +3,13 @@ import geopandas as gpd
 import pandas as pd
 import os
 
-import rasterio as rst
-from rasterio.mask import mask
+import sys
+
+# Scene statistics sidecars (SAR/scene_stats.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SAR'))
+from scene_stats import read_scene_stats
+
+from block_reductions import reduce_raster
 
 bnp = gpd.read_file('D:/thesis_data/ROI/ROI_PNB_32723.geojson')
 bnp = [geom for geom in bnp.geometry]
@@ -12,35 +17,35 @@ bnp = [geom for geom in bnp.geometry]
 images_path = 'D:/thesis_data/SAR/preprocessed/GRD/'
 image_list = os.listdir(images_path)
 
-id = 1
-
 vv_max_stats = []
+vv_max_scene_stats = []
 dates = []
 
 for index, image in enumerate(image_list):
 
     date = image_list[index].split('_')[1].split('T')[0]
 
-    with rst.open(images_path + image) as raster:
-        image, _ = mask(raster, bnp, invert=True, nodata=np.nan)
+    # Block-wise nanmax outside the ROI (same pixels as mask(invert=True)), without loading the scene
+    # VV is band 2 of the GRD_preprocessing output (Sigma0_VH, Sigma0_VV)
+    vv_max = reduce_raster(images_path + image, ['max'], bands=[2], band_names=['VV'], roi=bnp, invert=True)['max']['VV']
 
-        vv = image[0]
-        vh = image[1]
+    # Full-scene VV max of the statistics sidecar (the vv_max = 'scene' value of the index scripts), when present
+    scene_stats = read_scene_stats(images_path + image)
 
-    
-    vv_max = np.nanmax(vv)
+    vv_max_scene = np.nan if scene_stats is None else scene_stats['VV']['max']
 
     #idpdd = ((vv_max - vv) + vh) / 1.4142
 
     #vddpi = (vv + vh) / vv
 
     vv_max_stats.append(vv_max)
+    vv_max_scene_stats.append(vv_max_scene)
 
     dates.append(pd.to_datetime(int(date), format='%Y%m%d'))
 
     print(f'{date} VV max collected')
 
-df_vv_max_stats = pd.DataFrame({'date': dates, 'vv_max': vv_max_stats})
+df_vv_max_stats = pd.DataFrame({'date': dates, 'vv_max': vv_max_stats, 'vv_max_scene': vv_max_scene_stats})
 
 df_vv_max_stats.to_csv('D:/thesis_data/VEG_INDICES/VV_max.csv', sep=',', index=False)
 print('VV max csv file saved!')
@@ -0,0 +1,186 @@
+'''
+Batched lognormal fitting
+
+Fits lognorm (scipy parametrization: shape = sigma, loc, scale = exp(mu)) to many sample sets at once,
+stored as a (sets x samples) matrix padded with NaN:
+
+fixed   - closed-form MLE with loc = 0 (log-mean / log-std), same as lognorm.fit(x, floc=0)
+profile - 3-parameter MLE: for a loc below the sample minimum, mu and sigma have closed forms, so the
+          profile likelihood of loc is maximized for every set at once (grid search + golden section)
+scipy   - lognorm.fit of every set in a process pool (same results as the per-set loop)
+'''
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import lognorm
+
+METHODS = ('fixed', 'profile', 'scipy')
+
+def sample_matrix(samples):
+
+    """
+    (sets x samples) float64 matrix from a list of 1-D sample arrays, padded with NaN
+    """
+
+    samples = [np.asarray(s, dtype=np.float64).ravel() for s in samples]
+
+    matrix = np.full((len(samples), max((s.size for s in samples), default=0)), np.nan)
+
+    for i, s in enumerate(samples):
+        matrix[i, :s.size] = s
+
+    return matrix
+
+def fit_lognorm_fixed(matrix):
+
+    """
+    Closed-form lognormal MLE with loc = 0 for every row (NaN ignored)
+
+    Returns:
+        shape, loc, scale (1-D arrays) - NaN for rows with non-positive values or fewer than 2 samples
+    """
+
+    valid = ~np.isnan(matrix)
+    count = valid.sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        logs = np.log(np.where(valid, matrix, 1.0))
+        mu = np.where(valid, logs, 0.0).sum(axis=1) / count
+        sigma = np.sqrt(np.where(valid, np.square(logs - mu[:, None]), 0.0).sum(axis=1) / count)
+
+    bad = (count < 2) | np.any(valid & (matrix <= 0), axis=1)
+
+    return np.where(bad, np.nan, sigma), np.zeros(len(matrix)), np.where(bad, np.nan, np.exp(mu))
+
+def _profile_loglik(matrix, valid, count, loc):
+
+    """
+    Profile log-likelihood of loc (mu and sigma at their MLE) for every row, up to a constant
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        logs = np.log(np.where(valid, matrix - loc[:, None], 1.0))
+        logs = np.where(valid, logs, 0.0)
+
+        mu = logs.sum(axis=1) / count
+        sigma2 = np.where(valid, np.square(logs - mu[:, None]), 0.0).sum(axis=1) / count
+
+        return -0.5 * count * np.log(sigma2) - logs.sum(axis=1), mu, np.sqrt(sigma2)
+
+def fit_lognorm_profile(matrix, grid=64, iterations=60, span=(-4.0, 4.0)):
+
+    """
+    3-parameter lognormal MLE for every row by maximizing the profile likelihood of loc
+
+    loc is searched as loc = min(x) - range(x) * 10**u, u in span: a grid search picks the best u and a
+    golden-section search refines it between the neighbouring grid points. The likelihood grows without
+    bound as loc -> min(x), so only interior maxima of the grid are used (the best grid point above the
+    lower end of span).
+
+    Args:
+    matrix (array) = (sets x samples) NaN-padded matrix
+    grid (int) = grid points in span. Default = 64
+    iterations (int) = golden-section iterations. Default = 60
+    span (tuple) = search range of u. Default = (-4, 4)
+
+    Returns:
+        shape, loc, scale (1-D arrays) - NaN for rows with fewer than 3 samples or constant samples
+    """
+
+    valid = ~np.isnan(matrix)
+    count = valid.sum(axis=1)
+
+    low = np.nanmin(np.where(valid, matrix, np.inf), axis=1)
+    width = np.nanmax(np.where(valid, matrix, -np.inf), axis=1) - low
+
+    bad = (count < 3) | ~(width > 0)
+    width = np.where(bad, 1.0, width)
+    low = np.where(bad, 0.0, low)
+
+    def loglik(u):
+        return _profile_loglik(matrix, valid, count, low - width * np.power(10.0, u))
+
+    grid_u = np.linspace(span[0], span[1], grid)
+    values = np.stack([loglik(np.full(len(matrix), u))[0] for u in grid_u], axis=1)
+
+    # Skip the lower end (singularity at loc -> min(x))
+    values[:, 0] = -np.inf
+    best = np.argmax(np.where(np.isnan(values), -np.inf, values), axis=1)
+
+    a = grid_u[np.maximum(best - 1, 0)]
+    b = grid_u[np.minimum(best + 1, grid - 1)]
+
+    ratio = (np.sqrt(5) - 1) / 2
+
+    def objective(u):
+        value = loglik(u)[0]
+        return np.where(np.isnan(value), -np.inf, value)
+
+    c, d = b - ratio * (b - a), a + ratio * (b - a)
+    fc, fd = objective(c), objective(d)
+
+    for _ in range(iterations):
+
+        # Maximum in [a, d] (left) or in [c, b]
+        left = fc >= fd
+
+        a, b = np.where(left, a, c), np.where(left, d, b)
+        c, d = np.where(left, b - ratio * (b - a), d), np.where(left, c, a + ratio * (b - a))
+
+        f = objective(np.where(left, c, d))
+        fc, fd = np.where(left, f, fd), np.where(left, fc, f)
+
+    u = (a + b) / 2
+    loc = low - width * np.power(10.0, u)
+    _, mu, sigma = _profile_loglik(matrix, valid, count, loc)
+
+    return np.where(bad, np.nan, sigma), np.where(bad, np.nan, loc), np.where(bad, np.nan, np.exp(mu))
+
+def _scipy_fit(samples):
+
+    return lognorm.fit(samples)
+
+def fit_lognorm_scipy(samples, workers=4):
+
+    """
+    lognorm.fit of every sample set in a process pool (identical to the per-set loop), in this process when workers <= 1
+
+    Returns:
+        shape, loc, scale (1-D arrays)
+    """
+
+    if workers <= 1:
+
+        params = [_scipy_fit(s) for s in samples]
+
+    else:
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            params = list(executor.map(_scipy_fit, samples, chunksize=max(len(samples) // (4 * workers), 1)))
+
+    return tuple(np.array(p) for p in zip(*params)) if params else (np.zeros(0),) * 3
+
+def fit_lognorm(samples, method='fixed', workers=4):
+
+    """
+    Lognormal parameters of many sample sets
+
+    Args:
+    samples (list) = 1-D sample arrays (NaN are dropped)
+    method (string) = 'fixed' (loc = 0), 'profile' (3-parameter) or 'scipy'. Default = 'fixed'
+    workers (int) = processes of the scipy method (1 = in this process). Default = 4
+
+    Returns:
+        shape, loc, scale (1-D arrays, one value per sample set)
+    """
+
+    assert method in METHODS, f'Unknown lognormal fit method! {method}'
+
+    if method == 'scipy':
+        return fit_lognorm_scipy([np.asarray(s)[~np.isnan(s)] for s in samples], workers)
+
+    matrix = sample_matrix(samples)
+
+    return fit_lognorm_fixed(matrix) if method == 'fixed' else fit_lognorm_profile(matrix)
@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sample_store import read_samples, stored_dates, patch_arrays
+from lognorm_fit import fit_lognorm
+
+def _get_args():
+
+    '''
+    Input parameters parser
+    '''
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-j', '--json',
+    help='The input json file cotaining the lognormal fitting settings',
+    type=str)
+
+    args = parser.parse_args()
+
+    return args
+
+def _unit_path(checkpoint_path, class_name, resolution, date):
+
+    return os.path.join(checkpoint_path, class_name, resolution, date)
+
+def _clear_unit(unit_path):
+
+    for file in os.listdir(unit_path):
+        if file.endswith('.parquet') or file.endswith('.tmp') or file == 'done':
+            os.remove(os.path.join(unit_path, file))
+
+def fit_unit(unit):
+
+    """
+    Lognormal parameters of every patch of one (class, resolution, date) unit
+
+    The patches of each index are fitted in chunks and every chunk is checkpointed as a small Parquet
+    file (written to a temporary file and renamed), so an interrupted run resumes from the missing chunks.
+    A manifest records the method, chunk size and number of patches of each index: the checkpoints of a
+    unit are discarded when it does not match the run. A 'done' marker skips the finished units.
+
+    Args:
+    unit (dict) = class_name, resolution, date, store_path, checkpoint_path, indices, method, chunk_size
+
+    Returns:
+        unit key (class, resolution, date) and number of chunks fitted in this run
+    """
+
+    key = (unit['class_name'], unit['resolution'], unit['date'])
+    unit_path = _unit_path(unit['checkpoint_path'], *key)
+
+    os.makedirs(unit_path, exist_ok=True)
+
+    samples = read_samples(unit['store_path'], classes=[key[0]], dates=[key[2]], indices=unit['indices'])
+
+    patches = {index: patch_arrays(samples, index) for index in unit['indices']}
+
+    manifest = {'method': unit['method'], 'chunk_size': unit['chunk_size'],
+                'patches': {index: len(patches[index]) for index in unit['indices']}}
+
+    manifest_path = os.path.join(unit_path, 'manifest.json')
+
+    stored = None
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            stored = json.load(file)
+
+    if stored == manifest and os.path.exists(os.path.join(unit_path, 'done')):
+        return key, 0
+
+    if stored != manifest:
+
+        _clear_unit(unit_path)
+
+        with open(manifest_path, 'w') as file:
+            json.dump(manifest, file)
+
+    fitted = 0
+
+    for index in unit['indices']:
+
+        patch_ids = list(patches[index])
+
+        for chunk, start in enumerate(range(0, len(patch_ids), unit['chunk_size'])):
+
+            path = os.path.join(unit_path, f'{index}_{chunk:04d}.parquet')
+
+            if os.path.exists(path):
+                continue
+
+            chunk_ids = patch_ids[start:start + unit['chunk_size']]
+
+            shape, loc, scale = fit_lognorm([patches[index][patch_id] for patch_id in chunk_ids], unit['method'], workers=1)
+
+            table = pd.DataFrame({'patch_id': np.array(chunk_ids, dtype=np.int32), 'index': index, 'shape': shape, 'loc': loc, 'scale': scale})
+            table.to_parquet(path + '.tmp', index=False)
+            os.replace(path + '.tmp', path)
+
+            fitted += 1
+
+    open(os.path.join(unit_path, 'done'), 'w').close()
+
+    return key, fitted
+
+def class_table(checkpoint_path, class_name):
+
+    """
+    One parameter table per class from the checkpoints of all its resolutions and dates
+
+    Returns:
+        DataFrame (resolution, date, patch_id, <index>_shape, <index>_loc, <index>_scale...), one row per
+        fitted patch - None when the class has no checkpoint
+    """
+
+    class_path = os.path.join(checkpoint_path, class_name)
+
+    if not os.path.isdir(class_path):
+        return None
+
+    tables = []
+
+    for resolution in sorted(os.listdir(class_path)):
+        for date in sorted(os.listdir(os.path.join(class_path, resolution))):
+
+            unit_path = _unit_path(checkpoint_path, class_name, resolution, date)
+
+            for file in sorted(os.listdir(unit_path)):
+
+                if file.endswith('.parquet'):
+
+                    table = pd.read_parquet(os.path.join(unit_path, file))
+                    table.insert(0, 'date', date)
+                    table.insert(0, 'resolution', resolution)
+
+                    tables.append(table)
+
+    if not tables:
+        return None
+
+    table = pd.concat(tables, ignore_index=True)
+
+    # No aggregation and no cartesian fill: only the (resolution, date, patch) rows that were fitted
+    wide = table.pivot(index=['resolution', 'date', 'patch_id'], columns='index', values=['shape', 'loc', 'scale'])
+    wide.columns = [f'{index}_{param}' for param, index in wide.columns]
+    wide = wide[[f'{index}_{param}' for index in table['index'].unique() for param in ('shape', 'loc', 'scale')]]
+
+    return wide.reset_index()
+
+def run_lognorm_jobs(settings):
+
+    """
+    Fits the lognormal parameters of every (class, resolution, date) unit of the sample stores in a process pool
+
+    Args:
+    settings (dict) = stores {resolution: sample store path}, classes, indices, checkpoint_path, output_path,
+                      method ('scipy', 'profile' or 'fixed'), chunk_size (patches per checkpoint) and workers
+    """
+
+    units = []
+
+    for resolution, store_path in settings['stores'].items():
+        for class_name in settings['classes']:
+            for date in stored_dates(store_path, class_name):
+
+                units.append({'class_name': class_name, 'resolution': resolution, 'date': date, 'store_path': store_path,
+                              'checkpoint_path': settings['checkpoint_path'], 'indices': settings['indices'],
+                              'method': settings.get('method', 'scipy'), 'chunk_size': settings.get('chunk_size', 50)})
+
+    with ProcessPoolExecutor(max_workers=settings.get('workers', 4)) as executor:
+
+        for future in as_completed([executor.submit(fit_unit, unit) for unit in units]):
+
+            (class_name, resolution, date), fitted = future.result()
+
+            print(f'{class_name} {resolution} {date} fitted ({fitted} new chunks)!')
+
+    os.makedirs(settings['output_path'], exist_ok=True)
+
+    for class_name in settings['classes']:
+
+        table = class_table(settings['checkpoint_path'], class_name)
+
+        if table is None:
+
+            print(f'{class_name} has no fitted patches!')
+            continue
+
+        table.to_csv(os.path.join(settings['output_path'], class_name + '_ln_params.csv'), sep=',', index=False)
+
+        print(f'{class_name} parameter table saved!')
+
+def _main(settings):
+
+    run_lognorm_jobs(settings)
+
+if __name__ == "__main__":
+
+    args = _get_args()
+
+    file = open(args.json)
+
+    params = json.load(file)
+
+    _main(params)
@@ -1,54 +1,50 @@
-from scipy.stats import lognorm
 import pandas as pd
 import os
 
-files_path = 'D:/thesis_data/VEG_INDICES/samples/stratified/savanica/100m/'
+from sample_store import read_samples, stored_dates, patch_arrays
+from lognorm_fit import fit_lognorm
 
-output_path = 'D:/thesis_data/VEG_INDICES/lognorm_params/savanica/100m/'
+store_path = 'D:/thesis_data/VEG_INDICES/samples/store/100m/'
 
-files_list = os.listdir(files_path)
+class_name = 'FS'
 
-for index, file in enumerate(files_list):
+output_path = 'D:/thesis_data/VEG_INDICES/lognorm_params/savanica/100m/'
 
-    date = files_list[index].split('_')[1]
+index_list = ['dprvi', 'rvi', 'prvi', 'dpsvi', 'dpsvim']
 
-    if os.path.exists(output_path + 'FS_' + date + '_ln_params.csv'):
-        print('file already exists!')
-        continue
+# 'scipy' (lognorm.fit in a process pool, same values as before), 'profile' (batched 3-parameter MLE) or 'fixed' (loc = 0, closed form)
+fit_method = 'scipy'
 
-    samples_file = pd.read_csv(files_path + file)
+def _main():
 
-    dprvi_patches = samples_file.filter(regex='^dprvi_patch', axis=1)
-    rvi_patches = samples_file.filter(regex='^rvi_patch', axis=1)
-    prvi_patches = samples_file.filter(regex='^prvi_patch', axis=1)
-    dpsvi_patches = samples_file.filter(regex='^dpsvi_patch', axis=1)
-    dpsvim_patches = samples_file.filter(regex='^dpsvim_patch', axis=1)
-    
-    index_dict = {'dprvi': dprvi_patches, 'rvi': rvi_patches, 'prvi': prvi_patches, 'dpsvi': dpsvi_patches, 'dpsvim': dpsvim_patches}
+    for date in stored_dates(store_path, class_name):
 
-    data = {}
+        if os.path.exists(output_path + class_name + '_' + date + '_ln_params.csv'):
+            print('file already exists!')
+            continue
 
-    for index, df in index_dict.items():
+        # Only this class, date and these indices are read from the store
+        samples_file = read_samples(store_path, classes=[class_name], dates=[date], indices=index_list)
 
-        for column in df.columns:
+        data = {}
 
-            samples = df[column]
+        for index in index_list:
 
-            shape,_,scale = lognorm.fit(samples)
+            # All the patches of the index are fitted at once
+            patches = patch_arrays(samples_file, index)
 
-            shape_col = f'{index}_shape'
-            scale_col = f'{index}_scale'
+            shape, _, scale = fit_lognorm(list(patches.values()), fit_method)
 
-            if shape_col not in data:
-                data[shape_col] = []
+            # Keyed on patch_id: a patch with no valid pixel in one index is missing only from that index
+            data[f'{index}_shape'] = pd.Series(shape, index=list(patches))
+            data[f'{index}_scale'] = pd.Series(scale, index=list(patches))
 
-            if scale_col not in data:
-                data[scale_col] = []
+        # Every index is reindexed to the union of the patch ids
+        result = pd.DataFrame(data).sort_index().rename_axis('patch_id').reset_index()
 
-            data[shape_col].append(shape)
-            data[scale_col].append(scale)
+        result.to_csv(output_path + class_name + '_' + date + '_ln_params.csv', sep=',', index=False)
+        print(f'{date} csv file saved!')
 
-    result = pd.DataFrame(data)
+if __name__ == "__main__":
 
-    result.to_csv(output_path + 'FS_' + date + '_ln_params.csv', sep=',', index=False)
-    print(f'{date} csv file saved!')
\ No newline at end of file
+    _main()
\ No newline at end of file
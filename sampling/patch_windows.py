@@ -0,0 +1,149 @@
+import numpy as np
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.windows import Window, transform as window_transform
+
+from zone_index import geometry_set_key
+
+# Patch layouts (pixel windows + in-polygon masks), cached per (geometry set, raster grid)
+_layout_cache = {}
+
+def patch_layout(src, geometries):
+
+    """
+    Pixel window and in-polygon mask of each patch polygon, computed from the affine transform
+
+    The windows are the same that rasterio.mask.mask(crop=True) would read, so the sampled pixels
+    match the previous per-patch mask() calls.
+
+    Args:
+    src (DatasetReader) = opened raster (only its grid is used)
+    geometries (list) = patch polygons in the raster CRS
+
+    Returns:
+        list of (window, mask) - mask is True for the pixels inside the polygon
+    """
+
+    t = src.transform
+
+    # Keyed on the geometry content (WKB hash), not the list object, whose id may be reused
+    key = (geometry_set_key(geometries), src.width, src.height, (t.a, t.b, t.c, t.d, t.e, t.f))
+
+    if key not in _layout_cache:
+
+        layout = []
+
+        for geom in geometries:
+
+            window = geometry_window(src, [geom])
+            window = Window(int(window.col_off), int(window.row_off), int(window.width), int(window.height))
+
+            inside = geometry_mask([geom], out_shape=(window.height, window.width), transform=window_transform(window, src.transform), invert=True)
+
+            layout.append((window, inside))
+
+        _layout_cache[key] = layout
+
+    return _layout_cache[key]
+
+def merge_windows(windows, max_waste=2.0):
+
+    """
+    Merges overlapping or adjacent windows into larger reads (sorted sweep)
+
+    Two windows are merged when they overlap or touch and the merged read is at most
+    max_waste times the pixels of the windows it covers.
+
+    Args:
+    windows (list) = pixel windows
+    max_waste (float) = maximum ratio between the merged read and the covered pixels. Default = 2
+
+    Returns:
+        list of (merged window, list of member positions)
+    """
+
+    order = sorted(range(len(windows)), key=lambda k: (windows[k].row_off, windows[k].col_off))
+
+    groups = []
+
+    for k in order:
+
+        w = windows[k]
+        r0, c0, r1, c1 = w.row_off, w.col_off, w.row_off + w.height, w.col_off + w.width
+
+        if groups:
+
+            g = groups[-1]
+            gr0, gc0, gr1, gc1 = g['bounds']
+
+            touches = r0 <= gr1 and gr0 <= r1 and c0 <= gc1 and gc0 <= c1
+
+            mr0, mc0, mr1, mc1 = min(gr0, r0), min(gc0, c0), max(gr1, r1), max(gc1, c1)
+
+            if touches and (mr1 - mr0) * (mc1 - mc0) <= max_waste * (g['pixels'] + w.height * w.width):
+
+                g['bounds'] = (mr0, mc0, mr1, mc1)
+                g['pixels'] += w.height * w.width
+                g['members'].append(k)
+
+                continue
+
+        groups.append({'bounds': (r0, c0, r1, c1), 'pixels': w.height * w.width, 'members': [k]})
+
+    return [(Window(g['bounds'][1], g['bounds'][0], g['bounds'][3] - g['bounds'][1], g['bounds'][2] - g['bounds'][0]), g['members']) for g in groups]
+
+def cut_patch(block, window, inside, row_off=0, col_off=0):
+
+    """
+    Patch pixels from an array already read - (bands, pixels) float32, NaN outside the polygon
+
+    Args:
+    block (array) = (bands, rows, cols) float array covering the patch window
+    window, inside = patch window and in-polygon mask (see patch_layout)
+    row_off, col_off (int) = offset of the block on the raster grid. Default = 0
+    """
+
+    r0 = window.row_off - row_off
+    c0 = window.col_off - col_off
+
+    patch = block[:, r0:r0 + window.height, c0:c0 + window.width].astype(np.float32)
+    patch[:, ~inside] = np.nan
+
+    return patch.reshape(block.shape[0], -1)
+
+def sample_patches(src, class_patches, bands=None, max_waste=2.0):
+
+    """
+    Samples every patch of every class from an opened raster in one sorted sweep of window reads
+
+    Args:
+    src (DatasetReader) = opened raster
+    class_patches (dict) = {class name: list of patch polygons}
+    bands (list) = 1-based band indexes to read. Default = None (all bands)
+    max_waste (float) = see merge_windows. Default = 2
+
+    Returns:
+        dict {class name: list of (bands, pixels) float32 arrays}, one per patch -
+        pixels outside the polygon are NaN, as in mask(crop=True, nodata=np.nan).flatten()
+    """
+
+    bands = list(range(1, src.count + 1)) if bands is None else list(bands)
+
+    entries = []
+
+    for class_name, geometries in class_patches.items():
+        for i, (window, inside) in enumerate(patch_layout(src, geometries)):
+            entries.append((class_name, i, window, inside))
+
+    samples = {class_name: [None] * len(geometries) for class_name, geometries in class_patches.items()}
+
+    for merged, members in merge_windows([entry[2] for entry in entries], max_waste):
+
+        block = src.read(bands, window=merged, masked=True).astype(np.float32).filled(np.nan)
+
+        for k in members:
+
+            class_name, i, window, inside = entries[k]
+
+            samples[class_name][i] = cut_patch(block, window, inside, merged.row_off, merged.col_off)
+
+    return samples
@@ -0,0 +1,209 @@
+import os
+import numpy as np
+import pandas as pd
+import rasterio as rst
+import shapely
+from concurrent.futures import ThreadPoolExecutor
+from rasterio.windows import Window
+
+from zone_index import geometry_set_key, _grid_coefs
+
+def geometry_points(geometries):
+
+    """
+    Vertices of the geometries (points, lines and polygon rings), in the order used by rasterstats.point_query
+
+    Args:
+    geometries (list) = shapely geometries in the raster CRS
+
+    Returns:
+        x, y (1-D arrays) and feature (1-D array with the geometry of each vertex)
+    """
+
+    coords, feature = shapely.get_coordinates(np.asarray(geometries, dtype=object), return_index=True)
+
+    return coords[:, 0], coords[:, 1], feature
+
+def point_pixels(x, y, out_shape, transform, interpolate='bilinear'):
+
+    """
+    Pixel indices and weights of each point on a raster grid
+
+    nearest: the pixel that contains the point. bilinear: the 2 x 2 pixels whose centers surround the
+    point, with the bilinear weights (same unit square as rasterstats.point_query).
+
+    Args:
+    x, y (arrays) = point coordinates in the raster CRS
+    out_shape (tuple) = (rows, cols) of the raster grid
+    transform (Affine) = affine transform of the raster grid
+    interpolate (string) = 'nearest' or 'bilinear'. Default = 'bilinear'
+
+    Returns:
+        rows, cols (int arrays, points x k) and weights (float array, points x k) - k = 1 (nearest) or 4 (bilinear),
+        pixels outside the grid have row = -1
+    """
+
+    assert interpolate in ('nearest', 'bilinear'), f'Unknown interpolation! {interpolate}'
+
+    inverse = ~transform
+    fcol = inverse.a * x + inverse.b * y + inverse.c
+    frow = inverse.d * x + inverse.e * y + inverse.f
+
+    if interpolate == 'nearest':
+
+        rows, cols = np.floor(frow)[:, None].astype(np.int64), np.floor(fcol)[:, None].astype(np.int64)
+        weights = np.ones(rows.shape)
+
+    else:
+
+        r, c = np.round(frow).astype(np.int64), np.round(fcol).astype(np.int64)
+        unit_x, unit_y = 0.5 - (c - fcol), 0.5 + (r - frow)
+
+        # upper left, upper right, lower left, lower right
+        rows = np.stack([r - 1, r - 1, r, r], axis=1)
+        cols = np.stack([c - 1, c, c - 1, c], axis=1)
+        weights = np.stack([(1 - unit_x) * unit_y, unit_x * unit_y, (1 - unit_x) * (1 - unit_y), unit_x * (1 - unit_y)], axis=1)
+
+    outside = (rows < 0) | (rows >= out_shape[0]) | (cols < 0) | (cols >= out_shape[1])
+
+    return np.where(outside, -1, rows), np.where(outside, -1, cols), weights
+
+def load_point_pixels(cache_path, geometries, out_shape, transform, interpolate='bilinear'):
+
+    """
+    Loads the cached point pixels of a geometry set, computing and saving them when missing or stale
+
+    Returns:
+        dict (rows, cols, weights, feature) - see point_pixels and geometry_points
+    """
+
+    key = geometry_set_key(geometries)
+    coefs = _grid_coefs(transform)
+
+    if cache_path is not None and os.path.exists(cache_path):
+
+        cached = np.load(cache_path)
+
+        if (str(cached['key']) == key and tuple(cached['shape']) == tuple(out_shape) and np.allclose(cached['transform'], coefs)
+                and str(cached['interpolate']) == interpolate):
+            return {name: cached[name] for name in ('rows', 'cols', 'weights', 'feature')}
+
+    x, y, feature = geometry_points(geometries)
+    rows, cols, weights = point_pixels(x, y, out_shape, transform, interpolate)
+
+    pixels = {'rows': rows, 'cols': cols, 'weights': weights, 'feature': feature}
+
+    if cache_path is not None:
+        np.savez(cache_path, key=key, shape=np.array(out_shape), transform=coefs, interpolate=interpolate, **pixels)
+
+    return pixels
+
+def point_values(block, pixels, row_off=0, col_off=0):
+
+    """
+    Values of all bands at all points from an array already read (the full raster or a window of it)
+
+    A point with one of its 2 x 2 bilinear pixels outside the raster falls back to the nearest pixel,
+    as rasterstats.point_query does (boundless read); NaN pixels propagate to the interpolated value.
+
+    Args:
+    block (array) = (bands, rows, cols) float array, NaN as nodata, covering every point pixel
+    pixels (dict) = output of load_point_pixels
+    row_off, col_off (int) = offset of the block on the raster grid. Default = 0
+
+    Returns:
+        array (bands, points) float32, NaN outside the raster or over nodata
+    """
+
+    rows, cols, weights = pixels['rows'], pixels['cols'], pixels['weights']
+    inside = rows >= 0
+
+    values = np.where(inside, block[:, np.where(inside, rows - row_off, 0), np.where(inside, cols - col_off, 0)], np.nan)
+
+    if rows.shape[1] == 1:
+        return values[:, :, 0].astype(np.float32)
+
+    interpolated = np.sum(values * weights, axis=2)
+
+    # Nearest of the 2 x 2 pixels (rasterstats: arr[round(1 - y), round(x)])
+    unit_x = weights[:, 1] + weights[:, 3]
+    unit_y = weights[:, 0] + weights[:, 1]
+    nearest = np.round(1 - unit_y).astype(np.int64) * 2 + np.round(unit_x).astype(np.int64)
+
+    fallback = np.take_along_axis(values, np.broadcast_to(nearest[None, :, None], (block.shape[0], len(nearest), 1)), axis=2)[:, :, 0]
+
+    return np.where((rows < 0).any(axis=1), fallback, interpolated).astype(np.float32)
+
+def point_window(pixels):
+
+    """
+    Pixel window (row_off, col_off, height, width) spanned by the points inside the raster, None if there are none
+    """
+
+    rows, cols = pixels['rows'], pixels['cols']
+    inside = rows >= 0
+
+    if not inside.any():
+        return None
+
+    r0, c0 = rows[inside].min(), cols[inside].min()
+
+    return Window(c0, r0, cols[inside].max() + 1 - c0, rows[inside].max() + 1 - r0)
+
+def sample_points(src, pixels, bands=None):
+
+    """
+    Values of all bands at all points - one windowed read over the rows/cols spanned by the points
+
+    Args:
+    src (DatasetReader) = opened raster
+    pixels (dict) = output of load_point_pixels
+    bands (list) = 1-based band indexes to read. Default = None (all bands)
+
+    Returns:
+        array (bands, points) float32 (see point_values)
+    """
+
+    bands = list(range(1, src.count + 1)) if bands is None else list(bands)
+
+    window = point_window(pixels)
+
+    if window is None:
+        return np.full((len(bands), len(pixels['rows'])), np.nan, dtype=np.float32)
+
+    block = src.read(bands, window=window, masked=True).astype(np.float32).filled(np.nan)
+
+    return point_values(block, pixels, window.row_off, window.col_off)
+
+def sample_points_run(raster_paths, geometries, band_names, cache_path=None, interpolate='bilinear', workers=4):
+
+    """
+    Samples all bands at the geometry vertices of every raster, with the rasters read in parallel
+
+    Args:
+    raster_paths (dict) = {date: raster file}, all on the same grid
+    geometries (list) = shapely geometries in the raster CRS
+    band_names (list) = name of each raster band
+    cache_path (string) = .npz file of the cached point pixels. Default = None (not cached)
+    interpolate (string) = 'nearest' or 'bilinear'. Default = 'bilinear'
+    workers (int) = rasters read at the same time. Default = 4
+
+    Returns:
+        dict {date: DataFrame (feature, band columns...)}
+    """
+
+    with rst.open(next(iter(raster_paths.values()))) as src:
+        pixels = load_point_pixels(cache_path, geometries, (src.height, src.width), src.transform, interpolate)
+
+    def _sample(date):
+
+        with rst.open(raster_paths[date]) as src:
+            values = sample_points(src, pixels)
+
+        table = pd.DataFrame(dict(zip(band_names, values)))
+        table.insert(0, 'feature', pixels['feature'])
+
+        return date, table
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(_sample, raster_paths))
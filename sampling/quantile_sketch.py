@@ -0,0 +1,173 @@
+'''
+Mergeable quantile sketches
+
+Relative-error log-bucket sketches (DDSketch layout): a value x is counted in the bucket
+k = ceil(log(|x| / min_value) / log(gamma)), gamma = (1 + alpha) / (1 - alpha), with separate
+buckets for negative values and for |x| < min_value. Any quantile returned by the sketch is within
+a relative error alpha of the exact (lower rank) quantile for min_value <= |x| <= max_value.
+
+A sketch holds the bucket counts of many zones at once (zones x buckets), so one update is a
+single bincount, and two sketches with the same parameters are merged by adding their counts
+(tiles, workers, dates or seasons).
+'''
+
+import numpy as np
+
+def new_sketch(n_zones, alpha=0.01, min_value=1e-6, max_value=1e3):
+
+    """
+    Empty sketch of n_zones zones
+
+    Args:
+    n_zones (int) = number of zones
+    alpha (float) = relative error bound of the quantiles. Default = 0.01
+    min_value (float) = smallest |value| with bounded error, smaller values count as zero. Default = 1e-6
+    max_value (float) = largest |value| with bounded error, larger values go to the last bucket. Default = 1e3
+
+    Returns:
+        sketch (dict)
+    """
+
+    gamma = (1 + alpha) / (1 - alpha)
+    n_keys = int(np.ceil(np.log(max_value / min_value) / np.log(gamma))) + 1
+
+    return {'alpha': alpha, 'min_value': min_value, 'max_value': max_value,
+            'counts': np.zeros((n_zones, 2 * n_keys + 1), dtype=np.int64)}
+
+def _n_keys(sketch):
+
+    return (sketch['counts'].shape[1] - 1) // 2
+
+def _gamma(sketch):
+
+    return (1 + sketch['alpha']) / (1 - sketch['alpha'])
+
+def sketch_buckets(sketch, values):
+
+    """
+    Bucket of each value (buckets are sorted by value: negatives, zero, positives)
+    """
+
+    n_keys = _n_keys(sketch)
+
+    magnitude = np.abs(values)
+    small = magnitude < sketch['min_value']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        keys = np.ceil(np.log(np.where(small, sketch['min_value'], magnitude) / sketch['min_value']) / np.log(_gamma(sketch)))
+
+    keys = np.clip(keys, 0, n_keys - 1).astype(np.int64)
+
+    return np.where(small, n_keys, np.where(values > 0, n_keys + 1 + keys, n_keys - 1 - keys))
+
+def sketch_update(sketch, values, zone):
+
+    """
+    Adds values to the sketch (in place) - NaN values are ignored
+
+    Args:
+    sketch (dict) = sketch to update
+    values (array) = values of all zones
+    zone (array) = zone of each value
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+
+    counts = sketch['counts']
+    n_zones, n_buckets = counts.shape
+
+    flat = zone[valid].astype(np.int64) * n_buckets + sketch_buckets(sketch, values[valid])
+
+    counts += np.bincount(flat, minlength=n_zones * n_buckets).reshape(n_zones, n_buckets)
+
+def sketch_merge(sketches):
+
+    """
+    Merges sketches with the same parameters and zones (sum of the bucket counts)
+    """
+
+    merged = dict(sketches[0])
+    merged['counts'] = sketches[0]['counts'].copy()
+
+    for sketch in sketches[1:]:
+
+        assert (sketch['alpha'], sketch['min_value'], sketch['max_value']) == (merged['alpha'], merged['min_value'], merged['max_value']), 'Sketch parameters do not match!'
+        assert sketch['counts'].shape == merged['counts'].shape, 'Sketch zones do not match!'
+
+        merged['counts'] += sketch['counts']
+
+    return merged
+
+def sketch_quantiles(sketch, quantiles):
+
+    """
+    Quantiles of every zone
+
+    Args:
+    sketch (dict) = sketch
+    quantiles (list) = quantiles in [0, 1]
+
+    Returns:
+        array (zones, quantiles) - NaN for empty zones
+    """
+
+    n_keys = _n_keys(sketch)
+    gamma = _gamma(sketch)
+
+    # Bucket value: the point with the same relative error to both bucket bounds
+    keys = np.arange(n_keys)
+    magnitude = sketch['min_value'] * np.power(gamma, keys) * 2 / (gamma + 1)
+    bucket_values = np.concatenate([-magnitude[::-1], [0.0], magnitude])
+
+    cumulative = np.cumsum(sketch['counts'], axis=1)
+    count = cumulative[:, -1]
+
+    result = np.full((len(count), len(quantiles)), np.nan)
+
+    for j, q in enumerate(quantiles):
+
+        rank = np.floor(q * (count - 1))
+        bucket = np.argmax(cumulative > rank[:, None], axis=1)
+
+        result[:, j] = np.where(count > 0, bucket_values[bucket], np.nan)
+
+    return result
+
+def sketch_count(sketch):
+
+    return sketch['counts'].sum(axis=1)
+
+def save_sketches(path, sketches):
+
+    """
+    Saves named sketches (ex. one per band) to a compressed .npz
+    """
+
+    arrays = {}
+
+    for name, sketch in sketches.items():
+        arrays[name] = sketch['counts']
+        arrays[name + '__params'] = np.array([sketch['alpha'], sketch['min_value'], sketch['max_value']])
+
+    np.savez_compressed(path, **arrays)
+
+def load_sketches(path):
+
+    """
+    Loads the named sketches saved by save_sketches
+    """
+
+    stored = np.load(path)
+
+    sketches = {}
+
+    for name in stored.files:
+
+        if name.endswith('__params'):
+            continue
+
+        alpha, min_value, max_value = stored[name + '__params']
+        sketches[name] = {'alpha': float(alpha), 'min_value': float(min_value), 'max_value': float(max_value), 'counts': stored[name]}
+
+    return sketches
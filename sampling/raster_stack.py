@@ -0,0 +1,177 @@
+import argparse
+import os
+import re
+import numpy as np
+import rasterio as rst
+from xml.sax.saxutils import escape
+
+# numpy -> GDAL data type names used in the VRT
+_GDAL_TYPES = {'uint8': 'Byte', 'int16': 'Int16', 'uint16': 'UInt16', 'int32': 'Int32', 'uint32': 'UInt32', 'float32': 'Float32', 'float64': 'Float64'}
+
+def _get_args():
+
+    '''
+    Input parameters parser
+    '''
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-j', '--json',
+    help='The input json file cotaining the time stack settings',
+    type=str)
+
+    args = parser.parse_args()
+
+    return args
+
+def list_dated_rasters(images_path, date_pattern):
+
+    """
+    Lists the GeoTIFFs of a folder with the date found in their names, sorted by date
+    """
+
+    rasters = []
+
+    for image in os.listdir(images_path):
+
+        found = re.search(date_pattern, image)
+
+        if image.endswith('.tif') and found:
+            rasters.append((found.group(1), os.path.join(images_path, image)))
+
+    return sorted(rasters)
+
+def build_time_stack(images_path, vrt_path, band_names, date_pattern=r'(\d{8})'):
+
+    """
+    Virtual time stack - GDAL VRT over the existing per-date rasters (zero-copy)
+
+    Band k of date t is exposed as VRT band t * len(band_names) + k + 1 and described as 'date:band_name'.
+    All the rasters must share the same grid (size, transform and CRS) and have distinct dates. The nodata
+    value of each source band is kept.
+
+    Args:
+    images_path (string) = folder with the per-date index/parameter GeoTIFFs
+    vrt_path (string) = output .vrt file
+    band_names (list) = names of the bands of each raster (ex. ['DpRVI', 'DOP', 'Lambda1', 'Lambda2', 'Beta'])
+    date_pattern (string) = regex with one group that extracts the date from the file name. Default = 8 digits
+
+    Returns:
+        dates (list) stacked in the VRT
+    """
+
+    rasters = list_dated_rasters(images_path, date_pattern)
+
+    assert rasters, f'No dated rasters found in {images_path}'
+
+    dates = [date for date, _ in rasters]
+    assert len(set(dates)) == len(dates), f'More than one raster per date in {images_path}! {sorted({d for d in dates if dates.count(d) > 1})}'
+
+    with rst.open(rasters[0][1]) as ref:
+        width, height, transform, crs = ref.width, ref.height, ref.transform, ref.crs
+
+    lines = [f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">',
+             f'  <SRS>{escape(crs.to_wkt())}</SRS>',
+             f'  <GeoTransform>{transform.c}, {transform.a}, {transform.b}, {transform.f}, {transform.d}, {transform.e}</GeoTransform>']
+
+    vrt_band = 1
+
+    for date, path in rasters:
+
+        with rst.open(path) as src:
+
+            assert (src.width, src.height) == (width, height) and src.transform.almost_equals(transform) and src.crs == crs, f'Raster grid does not match the stack! {path}'
+            assert src.count == len(band_names), f'Band count does not match band_names! {path}'
+
+            dtypes, nodatas = src.dtypes, src.nodatavals
+
+        for k, name in enumerate(band_names):
+
+            lines += [f'  <VRTRasterBand dataType="{_GDAL_TYPES[dtypes[k]]}" band="{vrt_band}">',
+                      f'    <Description>{date}:{name}</Description>']
+
+            if nodatas[k] is not None:
+                lines.append(f'    <NoDataValue>{nodatas[k]!r}</NoDataValue>')
+
+            lines += ['    <SimpleSource>',
+                      f'      <SourceFilename relativeToVRT="0">{escape(os.path.abspath(path))}</SourceFilename>',
+                      f'      <SourceBand>{k + 1}</SourceBand>',
+                      f'      <SrcRect xOff="0" yOff="0" xSize="{width}" ySize="{height}"/>',
+                      f'      <DstRect xOff="0" yOff="0" xSize="{width}" ySize="{height}"/>',
+                      '    </SimpleSource>',
+                      '  </VRTRasterBand>']
+
+            vrt_band += 1
+
+    lines.append('</VRTDataset>')
+
+    with open(vrt_path, 'w') as vrt:
+        vrt.write('\n'.join(lines))
+
+    return dates
+
+def stack_layout(src):
+
+    """
+    Dates and band names of an opened time stack, read back from the VRT band descriptions
+
+    Args:
+    src (DatasetReader) = opened time stack
+
+    Returns:
+        dates (list), band_names (list)
+    """
+
+    keys = [description.split(':') for description in src.descriptions]
+
+    dates = list(dict.fromkeys(date for date, _ in keys))
+    band_names = list(dict.fromkeys(name for _, name in keys))
+
+    return dates, band_names
+
+def read_time_window(src, window=None, bands=None, dates=None, masked=False):
+
+    """
+    Reads a (time, band, rows, cols) block of an opened time stack with a single read() call
+
+    Args:
+    src (DatasetReader) = opened time stack
+    window (Window) = pixel window to read. Default = None (full grid)
+    bands (list) = band names to read. Default = None (all bands)
+    dates (list) = dates to read. Default = None (all dates)
+    masked (bool) = masked array of the nodata pixels. Default = False
+
+    Returns:
+        block (4-D array), dates (list), band_names (list)
+    """
+
+    stack_dates, band_names = stack_layout(src)
+
+    bands = band_names if bands is None else list(bands)
+    dates = stack_dates if dates is None else list(dates)
+
+    indexes = [stack_dates.index(date) * len(band_names) + band_names.index(name) + 1 for date in dates for name in bands]
+
+    block = src.read(indexes, window=window, masked=masked)
+
+    return block.reshape(len(dates), len(bands), block.shape[1], block.shape[2]), dates, bands
+
+def _main(settings):
+
+    for stack in settings['stacks']:
+
+        dates = build_time_stack(stack['images_path'], stack['vrt_path'], stack['band_names'], stack.get('date_pattern', r'(\d{8})'))
+
+        print(f"{stack['vrt_path']} built with {len(dates)} dates!")
+
+if __name__ == "__main__":
+
+    import json
+
+    args = _get_args()
+
+    file = open(args.json)
+
+    params = json.load(file)
+
+    _main(params)
@@ -0,0 +1,127 @@
+'''
+Columnar sample store
+
+Patch samples are stored in long format (date, class, patch_id, index, value) as float32 Parquet,
+partitioned by class and date (hive layout: <store>/class=FS/date=20210105/part-0.parquet).
+Reads push the class/date/index/patch filters down to the partitions and row groups, so the
+statistics scripts load only the samples they need.
+'''
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+PARTITIONING = ds.partitioning(pa.schema([('class', pa.string()), ('date', pa.string())]), flavor='hive')
+
+SCHEMA = pa.schema([('patch_id', pa.int32()), ('index', pa.string()), ('value', pa.float32()),
+                    ('class', pa.string()), ('date', pa.string())])
+
+def samples_table(date, class_name, patches, band_names):
+
+    """
+    Long-format table of the patch samples of one (date, class) - NaN pixels are dropped
+
+    Args:
+    date (string) = image date (YYYYMMDD)
+    class_name (string) = class code (ex. 'FF', 'FS', 'FC')
+    patches (list) = (bands, pixels) arrays, one per patch
+    band_names (list) = index name of each band (ex. ['dprvi', 'prvi', 'dpsvi', 'dpsvim', 'rvi'])
+
+    Returns:
+        pyarrow Table sorted by (index, patch_id)
+    """
+
+    patch_ids, indices, values = [], [], []
+
+    for k, band_name in enumerate(band_names):
+        for patch_id, patch in enumerate(patches):
+
+            band = np.asarray(patch[k], dtype=np.float32)
+            band = band[~np.isnan(band)]
+
+            patch_ids.append(np.full(band.size, patch_id, dtype=np.int32))
+            indices.append(np.full(band.size, k, dtype=np.int8))
+            values.append(band)
+
+    indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int8)
+
+    return pa.table({'patch_id': np.concatenate(patch_ids) if patch_ids else np.zeros(0, dtype=np.int32),
+                     'index': pa.DictionaryArray.from_arrays(indices, band_names).cast(pa.string()),
+                     'value': np.concatenate(values) if values else np.zeros(0, dtype=np.float32),
+                     'class': pa.array([class_name] * len(indices), pa.string()),
+                     'date': pa.array([date] * len(indices), pa.string())}, schema=SCHEMA)
+
+def write_samples(store_path, date, class_name, patches, band_names):
+
+    """
+    Writes (or replaces) the patch samples of one (date, class) partition of the store
+
+    Args:
+    store_path (string) = root folder of the sample store
+    date, class_name, patches, band_names = see samples_table
+    """
+
+    table = samples_table(date, class_name, patches, band_names)
+
+    ds.write_dataset(table, store_path, format='parquet', partitioning=PARTITIONING,
+                     basename_template='part-{i}.parquet', existing_data_behavior='delete_matching')
+
+def read_samples(store_path, classes=None, dates=None, indices=None, patch_ids=None):
+
+    """
+    Reads samples from the store, loading only the selected classes, dates, indices and patches
+
+    Args:
+    store_path (string) = root folder of the sample store
+    classes (list) = class codes. Default = None (all)
+    dates (list) = dates (YYYYMMDD). Default = None (all)
+    indices (list) = index names. Default = None (all)
+    patch_ids (list) = patch ids. Default = None (all)
+
+    Returns:
+        long-format DataFrame (date, class, patch_id, index, value)
+    """
+
+    dataset = ds.dataset(store_path, format='parquet', partitioning=PARTITIONING)
+
+    filters = [ds.field(name).isin(list(values)) for name, values in
+               (('class', classes), ('date', dates), ('index', indices), ('patch_id', patch_ids)) if values is not None]
+
+    expression = None
+
+    for condition in filters:
+        expression = condition if expression is None else expression & condition
+
+    table = dataset.to_table(columns=['date', 'class', 'patch_id', 'index', 'value'], filter=expression)
+
+    return table.to_pandas()
+
+def stored_dates(store_path, class_name):
+
+    """
+    Dates stored for one class (from the partition folders, no data is read)
+    """
+
+    dataset = ds.dataset(store_path, format='parquet', partitioning=PARTITIONING)
+
+    fragments = dataset.get_fragments(filter=ds.field('class') == class_name)
+
+    return sorted({ds.get_partition_keys(fragment.partition_expression)['date'] for fragment in fragments})
+
+def patch_arrays(samples, index):
+
+    """
+    Per-patch sample arrays of one index from a long-format DataFrame
+
+    Args:
+    samples (DataFrame) = output of read_samples
+    index (string) = index name
+
+    Returns:
+        dict {patch_id: 1-D float32 array}
+    """
+
+    selected = samples[samples['index'] == index]
+
+    return {patch_id: group['value'].to_numpy() for patch_id, group in selected.groupby('patch_id', sort=True)}
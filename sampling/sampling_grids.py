@@ -0,0 +1,255 @@
+import argparse
+import os
+import numpy as np
+import geopandas as gpd
+import rasterio as rst
+import shapely
+from affine import Affine
+from rasterio.features import geometry_mask
+from shapely.strtree import STRtree
+
+from raster_stack import list_dated_rasters
+
+def _get_args():
+
+    '''
+    Input parameters parser
+    '''
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-j', '--json',
+    help='The input json file cotaining the sampling grid settings',
+    type=str)
+
+    args = parser.parse_args()
+
+    return args
+
+def candidate_cells(polygons, transform, cell_size):
+
+    """
+    Cells of cell_size x cell_size m aligned to the raster grid whose center falls inside the polygons
+    (one rasterization at the cell resolution)
+
+    Args:
+    polygons (list) = class polygons in the raster CRS
+    transform (Affine) = affine transform of the raster grid (north-up)
+    cell_size (float) = cell side in meters, a multiple of the pixel size
+
+    Returns:
+        row_off, col_off (pixel offsets of each cell on the raster grid) and cell side in pixels
+    """
+
+    pixels = cell_size / transform.a
+
+    assert transform.b == 0 and transform.d == 0, 'Raster grid must be north-up!'
+    assert abs(pixels - round(pixels)) < 1e-6, f'Cell size must be a multiple of the pixel size! {cell_size}'
+
+    pixels = int(round(pixels))
+
+    minx, miny, maxx, maxy = shapely.total_bounds(np.asarray(polygons, dtype=object))
+
+    # Cell grid snapped to the raster pixels
+    col0 = int(np.floor((minx - transform.c) / transform.a))
+    row0 = int(np.floor((maxy - transform.f) / transform.e))
+    cols = int(np.ceil((maxx - transform.c) / transform.a)) - col0
+    rows = int(np.ceil((miny - transform.f) / transform.e)) - row0
+
+    cell_transform = Affine(transform.a * pixels, 0, transform.c + col0 * transform.a, 0, transform.e * pixels, transform.f + row0 * transform.e)
+
+    centers = geometry_mask(polygons, out_shape=(-(-rows // pixels), -(-cols // pixels)), transform=cell_transform, invert=True)
+
+    r, c = np.nonzero(centers)
+
+    return row0 + r * pixels, col0 + c * pixels, pixels
+
+def cell_boxes(transform, row_off, col_off, pixels):
+
+    """
+    Cell polygons from their pixel offsets on the raster grid
+    """
+
+    x0, y0 = transform.c + col_off * transform.a, transform.f + row_off * transform.e
+
+    return shapely.box(x0, y0 + pixels * transform.e, x0 + pixels * transform.a, y0)
+
+def stratified_draw(polygons, transform, row_off, col_off, pixels, n_cells=None, strata_size=None, seed=0):
+
+    """
+    Reproducible stratified random draw of cells fully inside one of the polygons
+
+    The candidate cells are grouped in strata_size x strata_size m blocks and each block gets a share of
+    n_cells proportional to its candidates (largest remainder). The candidates are visited in a seeded random
+    order within each block and tested for full containment with an STRtree over the polygons, in batches,
+    until every share is filled - only the visited cells are tested. A block with fewer contained cells than
+    its share gives all it has and the shortfall is moved to the blocks with spare candidates; a draw still
+    short of n_cells is reported.
+
+    Args:
+    polygons (list) = class polygons in the raster CRS
+    transform (Affine) = affine transform of the raster grid
+    row_off, col_off, pixels = output of candidate_cells
+    n_cells (int) = cells to draw. Default = None (every contained cell)
+    strata_size (float) = side of the spatial strata in meters. Default = None (one stratum)
+    seed (int) = random seed. Default = 0
+
+    Returns:
+        positions (sorted int array) of the drawn candidates
+    """
+
+    rng = np.random.default_rng(seed)
+
+    n = len(row_off)
+
+    if strata_size is None:
+        stratum = np.zeros(n, dtype=np.int64)
+    else:
+        sx = np.floor((transform.c + col_off * transform.a) / strata_size).astype(np.int64)
+        sy = np.floor((transform.f + row_off * transform.e) / strata_size).astype(np.int64)
+        _, stratum = np.unique((sx - sx.min()) * (sy.max() - sy.min() + 1) + (sy - sy.min()), return_inverse=True)
+
+    sizes = np.bincount(stratum, minlength=1)
+
+    if n_cells is None or n_cells >= n:
+        quota = sizes.copy()
+    else:
+        share = sizes * n_cells / n
+        quota = np.floor(share).astype(np.int64)
+        quota[np.argsort(quota - share, kind='stable')[:n_cells - quota.sum()]] += 1
+
+    # Seeded random rank of each candidate within its stratum
+    order = np.argsort(stratum + rng.random(n))
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - (np.cumsum(sizes) - sizes)[stratum[order]]
+
+    tree = STRtree(np.asarray(polygons, dtype=object))
+
+    tested = np.zeros(n, dtype=bool)
+    contained = np.zeros(n, dtype=bool)
+    limit = quota.copy()
+
+    while True:
+
+        batch = np.flatnonzero(~tested & (rank < limit[stratum]))
+
+        if batch.size == 0:
+            break
+
+        cells = cell_boxes(transform, row_off[batch], col_off[batch], pixels)
+
+        tested[batch] = True
+        contained[batch[np.unique(tree.query(cells, predicate='within')[0])]] = True
+
+        count = np.bincount(stratum[contained], minlength=len(sizes))
+        exhausted = (count < quota) & (limit >= sizes)
+
+        if n_cells is not None and exhausted.any():
+
+            # Shortfall of the fully visited strata moved to the strata with spare candidates (largest remainder)
+            deficit = (quota - count)[exhausted].sum()
+            quota[exhausted] = count[exhausted]
+
+            spare = np.where(limit < sizes, sizes - quota, np.maximum(count - quota, 0))
+            moved = min(deficit, spare.sum())
+
+            if moved > 0:
+                share = spare * moved / spare.sum()
+                extra = np.floor(share).astype(np.int64)
+                extra[np.argsort(extra - share, kind='stable')[:moved - extra.sum()]] += 1
+                quota += extra
+
+        short = (count < quota) & (limit < sizes)
+
+        if not short.any():
+            break
+
+        limit[short] = np.minimum(2 * limit[short] + 16, sizes[short])
+
+    # First quota contained cells of each stratum, in rank order
+    drawn = np.flatnonzero(contained)
+    drawn = drawn[np.lexsort((rank[drawn], stratum[drawn]))]
+
+    position = np.arange(len(drawn)) - np.searchsorted(stratum[drawn], stratum[drawn])
+
+    drawn = np.sort(drawn[position < quota[stratum[drawn]]])
+
+    if n_cells is not None and len(drawn) < min(n_cells, n):
+        print(f'Only {len(drawn)} of {n_cells} cells fully inside the polygons!')
+
+    return drawn
+
+def build_sampling_grid(polygons, reference_path, cell_size, n_cells=None, strata_size=None, seed=0):
+
+    """
+    Stratified sampling grid of one class
+
+    Args:
+    polygons (list) = class polygons in the raster CRS
+    reference_path (string) = raster with the target grid
+    cell_size, n_cells, strata_size, seed = see candidate_cells and stratified_draw
+
+    Returns:
+        GeoDataFrame (cell_id, row_off, col_off, height, width, geometry)
+    """
+
+    with rst.open(reference_path) as reference:
+        transform, crs = reference.transform, reference.crs
+
+    row_off, col_off, pixels = candidate_cells(polygons, transform, cell_size)
+
+    drawn = stratified_draw(polygons, transform, row_off, col_off, pixels, n_cells, strata_size, seed)
+
+    return gpd.GeoDataFrame({'cell_id': np.arange(len(drawn)), 'row_off': row_off[drawn], 'col_off': col_off[drawn],
+                             'height': pixels, 'width': pixels},
+                            geometry=cell_boxes(transform, row_off[drawn], col_off[drawn], pixels), crs=crs)
+
+def write_sampling_grid(grid, output_path, name):
+
+    """
+    Writes the sampling grid as GeoParquet and its pixel-window index (.npz: row_off, col_off, height, width)
+    """
+
+    os.makedirs(output_path, exist_ok=True)
+
+    grid.to_parquet(os.path.join(output_path, name + '.parquet'))
+
+    np.savez(os.path.join(output_path, name + '_windows.npz'),
+             **{column: grid[column].to_numpy() for column in ('row_off', 'col_off', 'height', 'width')})
+
+def _main(settings):
+
+    # Any raster of the index grid (a folder means its first dated raster)
+    reference_path = settings['reference_path']
+
+    if os.path.isdir(reference_path):
+        reference_path = list_dated_rasters(reference_path, settings.get('date_pattern', r'(\d{8})'))[0][1]
+
+    for class_name, path in settings['classes'].items():
+
+        polygons = [geom for geom in gpd.read_file(path).geometry]
+
+        for cell_size in settings['cell_sizes']:
+
+            n_cells = settings['n_cells'][class_name] if isinstance(settings.get('n_cells'), dict) else settings.get('n_cells')
+
+            grid = build_sampling_grid(polygons, reference_path, cell_size, n_cells,
+                                       settings.get('strata_size'), settings.get('seed', 0))
+
+            name = f'{class_name}_{len(grid)}_sampling_grids_{cell_size}m'
+
+            write_sampling_grid(grid, settings['output_path'], name)
+
+            print(f'{name} saved!')
+
+if __name__ == "__main__":
+
+    import json
+
+    args = _get_args()
+
+    file = open(args.json)
+
+    params = json.load(file)
+
+    _main(params)
@@ -0,0 +1,256 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio as rst
+from rasterio.windows import Window
+
+from raster_stack import build_time_stack, read_time_window
+from zone_index import load_zone_index
+from patch_windows import patch_layout, cut_patch
+from point_sampler import load_point_pixels, point_window, point_values
+from sample_store import write_samples
+from zonal_engine import STATS, segment_statistics, write_class_tables
+from summary_store import new_summary, summarize, save_summary, summary_path
+
+def _get_args():
+
+    '''
+    Input parameters parser
+    '''
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-j', '--json',
+    help='The input json file cotaining the sampling jobs settings',
+    type=str)
+
+    args = parser.parse_args()
+
+    return args
+
+def _read_geometries(path):
+
+    return [geom for geom in gpd.read_file(path).geometry]
+
+def _flat_window(flat, width):
+
+    if flat.size == 0:
+        return None
+
+    rows, cols = flat // width, flat % width
+
+    return Window(cols.min(), rows.min(), cols.max() + 1 - cols.min(), rows.max() + 1 - rows.min())
+
+def _union_window(windows):
+
+    windows = [w for w in windows if w is not None]
+
+    if not windows:
+        return None
+
+    r0, c0 = min(w.row_off for w in windows), min(w.col_off for w in windows)
+    r1, c1 = max(w.row_off + w.height for w in windows), max(w.col_off + w.width for w in windows)
+
+    return Window(c0, r0, c1 - c0, r1 - r0)
+
+def _block_values(block, window, flat, width):
+
+    """
+    Values of all bands at flat pixel indices of the raster grid, from the block read over window
+    """
+
+    return block[:, flat // width - window.row_off, flat % width - window.col_off]
+
+# Jobs - prepare(job, src, settings) -> state with the job 'window', run(job, state, block, window, date, width), finish(job, state)
+
+def _prepare_zones(job, src, settings):
+
+    zones = {class_name: load_zone_index(os.path.join(settings['zone_index_path'], job['name'] + '_' + class_name + '.npz'),
+                                         _read_geometries(path), (src.height, src.width), src.transform)
+             for class_name, path in job['classes'].items()}
+
+    return {'zones': zones, 'window': _union_window([_flat_window(np.unique(z.indices), src.width) for z in zones.values()]), 'tables': []}
+
+def _run_pixels(job, state, block, window, date, width):
+
+    band_names = job.get('columns', job['band_names'])
+
+    for class_name, zones in state['zones'].items():
+
+        # Union of the class polygons (flat pixel indices, as in data_sampling)
+        pixels = np.unique(zones.indices)
+
+        df_class = pd.DataFrame(dict(zip(band_names, _block_values(block, window, pixels, width))), index=pixels)
+        df_class.dropna(inplace=True)
+
+        df_class.to_csv(job['output_path'] + class_name + '_' + date + '_distribution' + '.csv', sep=',')
+
+        print(f'{job["name"]}: {class_name} data of {date} collected!')
+
+def _run_zonal(job, state, block, window, date, width):
+
+    stats = job.get('stats', STATS)
+
+    for class_name, zones in state['zones'].items():
+
+        values = _block_values(block, window, zones.indices, width)
+        zone = np.repeat(np.arange(zones.shape[0]), np.diff(zones.indptr))
+
+        for band, band_name in zip(values, job['band_names']):
+
+            table = pd.DataFrame({'zone': np.arange(zones.shape[0]), 'index': band_name, **segment_statistics(band, zone, zones.shape[0], stats)})
+            table.insert(0, 'class', class_name)
+            table.insert(0, 'date', pd.to_datetime(date, format='%Y%m%d'))
+
+            state['tables'].append(table)
+
+    print(f'{job["name"]}: {date} zonal statistics collected!')
+
+def _finish_zonal(job, state):
+
+    table = pd.concat(state['tables'], ignore_index=True)
+
+    table.to_csv(job['table_path'], sep=',', index=False)
+    print(f"{job['table_path']} saved!")
+
+    if job.get('class_tables_path'):
+        write_class_tables(table, job['class_tables_path'], job.get('stats', STATS))
+
+def _prepare_patches(job, src, settings):
+
+    layouts = {class_name: patch_layout(src, _read_geometries(path)) for class_name, path in job['classes'].items()}
+
+    return {'layouts': layouts, 'window': _union_window([w for layout in layouts.values() for w, _ in layout])}
+
+def _run_patches(job, state, block, window, date, width):
+
+    for class_name, layout in state['layouts'].items():
+
+        patches = [cut_patch(block, w, inside, window.row_off, window.col_off) for w, inside in layout]
+
+        write_samples(job['store_path'], date, class_name, patches, job.get('columns', job['band_names']))
+
+        print(f'{job["name"]}: {class_name} data patches of {date} collected!')
+
+def _prepare_points(job, src, settings):
+
+    pixels = load_point_pixels(os.path.join(settings['zone_index_path'], job['name'] + '_points.npz'), _read_geometries(job['geometries']),
+                               (src.height, src.width), src.transform, job.get('interpolate', 'bilinear'))
+
+    return {'pixels': pixels, 'window': point_window(pixels)}
+
+def _run_points(job, state, block, window, date, width):
+
+    values = point_values(block, state['pixels'], window.row_off, window.col_off)
+
+    df_points = pd.DataFrame(dict(zip(job.get('columns', job['band_names']), values)))
+    df_points.dropna(inplace=True)
+
+    df_points.to_csv(job['output_path'] + job['name'] + '_' + date + '_samples' + '.csv', sep=',', index=False)
+
+    print(f'{job["name"]}: point data of {date} collected!')
+
+def _run_summaries(job, state, block, window, date, width):
+
+    band_names = job.get('columns', job['band_names'])
+
+    for class_name, zones in state['zones'].items():
+
+        if job.get('level', 'patches') == 'class':
+
+            # One zone: the union of the class polygons, as the pixels job samples it
+            pixels = np.unique(zones.indices)
+            zone, n_zones = np.zeros(pixels.size, dtype=np.int64), 1
+
+        else:
+
+            pixels = zones.indices
+            zone, n_zones = np.repeat(np.arange(zones.shape[0]), np.diff(zones.indptr)), zones.shape[0]
+
+        edges = new_summary(0, band_names, job['ranges'], job.get('bins', 200))['edges']
+
+        summary = summarize(_block_values(block, window, pixels, width), zone, n_zones, band_names, edges)
+
+        save_summary(summary_path(job['summary_path'], class_name, date), summary)
+
+        print(f'{job["name"]}: {class_name} summary of {date} collected!')
+
+JOB_TYPES = {'pixels': (_prepare_zones, _run_pixels, None),
+             'zonal': (_prepare_zones, _run_zonal, _finish_zonal),
+             'patches': (_prepare_patches, _run_patches, None),
+             'points': (_prepare_points, _run_points, None),
+             'summaries': (_prepare_zones, _run_summaries, None)}
+
+def run_jobs(settings):
+
+    """
+    Runs several sampling jobs over a raster set, reading each raster once
+
+    The rasters are opened as one virtual time stack (raster_stack.build_time_stack), which checks their
+    grid and dates once. The footprint of every job (zone pixels, patch windows, point pixels) is planned
+    on the stack grid before the first read; each date is then read once over the union window of the
+    footprints and the block is handed to every job. Jobs may read a subset of the bands (job 'bands', 1-based).
+
+    Args:
+    settings (dict) = images_path, band_names, zone_index_path, date_pattern (optional), stack_path (optional,
+                      .vrt file. Default = time_stack.vrt in zone_index_path) and jobs -
+                      list of {name, type ('pixels', 'zonal', 'patches', 'points', 'summaries'), ...job settings}
+    """
+
+    os.makedirs(settings['zone_index_path'], exist_ok=True)
+
+    stack_path = settings.get('stack_path', os.path.join(settings['zone_index_path'], 'time_stack.vrt'))
+
+    dates = build_time_stack(settings['images_path'], stack_path, settings['band_names'], settings.get('date_pattern', r'(\d{8})'))
+
+    jobs = []
+
+    with rst.open(stack_path) as src:
+
+        for job in settings['jobs']:
+
+            assert job['type'] in JOB_TYPES, f'Unknown sampling job type! {job["type"]}'
+
+            job = dict(job)
+            bands = job.get('bands', list(range(1, len(settings['band_names']) + 1)))
+            job['band_positions'] = [b - 1 for b in bands]
+            job['band_names'] = [settings['band_names'][b - 1] for b in bands]
+
+            prepare, run, finish = JOB_TYPES[job['type']]
+
+            jobs.append((job, prepare(job, src, settings), run, finish))
+
+            print(f'{job["name"]} job planned!')
+
+        window = _union_window([state['window'] for _, state, _, _ in jobs])
+
+        assert window is not None, 'No job footprint falls inside the raster grid!'
+
+        for date in dates:
+
+            block = read_time_window(src, window, dates=[date], masked=True)[0][0].astype(np.float32).filled(np.nan)
+
+            for job, state, run, _ in jobs:
+                run(job, state, block[job['band_positions']], window, date, src.width)
+
+    for job, state, _, finish in jobs:
+        if finish is not None:
+            finish(job, state)
+
+def _main(settings):
+
+    run_jobs(settings)
+
+if __name__ == "__main__":
+
+    import json
+
+    args = _get_args()
+
+    file = open(args.json)
+
+    params = json.load(file)
+
+    _main(params)
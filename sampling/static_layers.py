@@ -0,0 +1,118 @@
+'''
+Aligned static layers
+
+Auxiliary rasters that do not change between dates (slope, DEM, class maps) are warped once onto
+the index raster grid and cached as float32 .npy files (NaN as nodata). They are opened memory-mapped,
+so any sampler can attach their values to the sampled pixels with the same flat pixel indices used
+for the index bands, with no extra raster read per date.
+'''
+
+import os
+import numpy as np
+import rasterio as rst
+from rasterio.warp import reproject, Resampling
+
+from zone_index import _grid_coefs
+
+def _layer_files(cache_path, name):
+
+    return os.path.join(cache_path, name + '.npy'), os.path.join(cache_path, name + '.grid.npz')
+
+def _is_current(grid_file, source_path, out_shape, transform, crs, resampling):
+
+    if not os.path.exists(grid_file):
+        return False
+
+    grid = np.load(grid_file)
+
+    return (tuple(grid['shape']) == tuple(out_shape) and np.allclose(grid['transform'], _grid_coefs(transform))
+            and str(grid['crs']) == crs.to_wkt() and str(grid['source']) == os.path.abspath(source_path)
+            and float(grid['mtime']) == os.path.getmtime(source_path) and str(grid['resampling']) == resampling)
+
+def align_layer(source_path, cache_path, name, out_shape, transform, crs, resampling='bilinear', band=1):
+
+    """
+    Warps one band of an auxiliary raster onto a raster grid and caches it (skipped when the cache is current)
+
+    Args:
+    source_path (string) = auxiliary raster (ex. slope_32723.tif)
+    cache_path (string) = folder of the aligned layers
+    name (string) = layer name (ex. 'slope')
+    out_shape (tuple) = (rows, cols) of the target grid
+    transform (Affine) = affine transform of the target grid
+    crs (CRS) = CRS of the target grid
+    resampling (string) = rasterio resampling method ('nearest' for class maps). Default = 'bilinear'
+    band (int) = band of the auxiliary raster. Default = 1
+
+    Returns:
+        aligned layer (2-D float32 memmap, read-only)
+    """
+
+    os.makedirs(cache_path, exist_ok=True)
+
+    layer_file, grid_file = _layer_files(cache_path, name)
+
+    if not _is_current(grid_file, source_path, out_shape, transform, crs, resampling):
+
+        layer = np.lib.format.open_memmap(layer_file, mode='w+', dtype=np.float32, shape=tuple(out_shape))
+        layer[:] = np.nan
+
+        with rst.open(source_path) as src:
+
+            reproject(source=rst.band(src, band), destination=layer,
+                      src_transform=src.transform, src_crs=src.crs, src_nodata=src.nodata,
+                      dst_transform=transform, dst_crs=crs, dst_nodata=np.nan,
+                      resampling=getattr(Resampling, resampling))
+
+        layer.flush()
+        del layer
+
+        np.savez(grid_file, shape=np.array(out_shape), transform=_grid_coefs(transform), crs=crs.to_wkt(),
+                 source=os.path.abspath(source_path), mtime=os.path.getmtime(source_path), resampling=resampling)
+
+        print(f'{name} aligned to the index grid!')
+
+    return np.load(layer_file, mmap_mode='r')
+
+def load_static_layers(layers, reference_path, cache_path):
+
+    """
+    Aligned static layers on the grid of a reference (index) raster
+
+    Args:
+    layers (dict) = {name: auxiliary raster path} or {name: {'path': ..., 'resampling': ..., 'band': ...}}
+    reference_path (string) = raster with the target grid (any date of the index rasters)
+    cache_path (string) = folder of the aligned layers
+
+    Returns:
+        dict {name: 2-D float32 memmap}
+    """
+
+    with rst.open(reference_path) as reference:
+        out_shape, transform, crs = (reference.height, reference.width), reference.transform, reference.crs
+
+    aligned = {}
+
+    for name, layer in layers.items():
+
+        layer = {'path': layer} if isinstance(layer, str) else layer
+
+        aligned[name] = align_layer(layer['path'], cache_path, name, out_shape, transform, crs,
+                                    layer.get('resampling', 'bilinear'), layer.get('band', 1))
+
+    return aligned
+
+def layer_values(layers, pixels):
+
+    """
+    Static layer values at flat pixel indices of the index grid
+
+    Args:
+    layers (dict) = output of load_static_layers
+    pixels (array) = flat pixel indices (ex. zone index indices)
+
+    Returns:
+        dict {name: 1-D float32 array}
+    """
+
+    return {name: np.asarray(layer.reshape(-1)[pixels]) for name, layer in layers.items()}
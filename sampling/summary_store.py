@@ -0,0 +1,287 @@
+'''
+Mergeable sufficient statistics
+
+Per-zone (patch or class) summaries of the sampled indices, kept during sampling so the statistics
+scripts do not need to re-read the per-pixel samples. For every zone and index a summary holds
+
+count, mean, m2             - moments of the values (m2 = sum of squared deviations)
+log_count, log_mean, log_m2 - moments of the log of the positive values
+joint_count, joint_mean,
+comoment                    - mean vector and cross-products (sum of deviation products) of the pixels
+                              valid in every index
+histogram                   - counts on fixed bin edges per index (out of range values in the end bins)
+
+The moments are kept centered and merged with the Chan et al. parallel update, so summaries of batches,
+tiles or workers are combined exactly. Sums of values, squares and logs are derived from them.
+'''
+
+import os
+import numpy as np
+
+def new_summary(n_zones, band_names, ranges, bins=200):
+
+    """
+    Empty summary of n_zones zones
+
+    Args:
+    n_zones (int) = number of zones
+    band_names (list) = index names (ex. ['DpRVI', 'PRVI', 'DPSVI', 'DPSVIm', 'RVI'])
+    ranges (dict) = histogram range of each index {name: [min, max]}
+    bins (int) = histogram bins. Default = 200
+
+    Returns:
+        summary (dict)
+    """
+
+    k = len(band_names)
+
+    return {'band_names': list(band_names),
+            'edges': np.stack([np.linspace(ranges[name][0], ranges[name][1], bins + 1) for name in band_names]),
+            'count': np.zeros((n_zones, k)), 'mean': np.zeros((n_zones, k)), 'm2': np.zeros((n_zones, k)),
+            'log_count': np.zeros((n_zones, k)), 'log_mean': np.zeros((n_zones, k)), 'log_m2': np.zeros((n_zones, k)),
+            'joint_count': np.zeros(n_zones), 'joint_mean': np.zeros((n_zones, k)), 'comoment': np.zeros((n_zones, k, k)),
+            'histogram': np.zeros((n_zones, k, bins), dtype=np.int64)}
+
+def _zone_moments(values, zone, n_zones):
+
+    """
+    Count, mean and m2 of each zone (two passes over the batch)
+    """
+
+    count = np.bincount(zone, minlength=n_zones).astype(np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(count > 0, np.bincount(zone, weights=values, minlength=n_zones) / count, 0.0)
+
+    return count, mean, np.bincount(zone, weights=np.square(values - mean[zone]), minlength=n_zones)
+
+def _chan_merge(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+
+    """
+    Chan et al. parallel update of (count, mean, m2), elementwise (m2 may carry trailing cross-product dimensions)
+    """
+
+    count = count_a + count_b
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(count > 0, count_b / count, 0.0)
+        factor = np.where(count > 0, count_a * count_b / count, 0.0)
+
+    delta = mean_b - mean_a
+
+    if m2_a.ndim > delta.ndim:
+        m2 = m2_a + m2_b + delta[..., :, None] * delta[..., None, :] * factor[..., None, None]
+        mean = mean_a + delta * weight[..., None]
+    else:
+        m2 = m2_a + m2_b + delta * delta * factor
+        mean = mean_a + delta * weight
+
+    return count, mean, m2
+
+def summarize(values, zone, n_zones, band_names, edges):
+
+    """
+    Summary of one batch of values
+
+    Args:
+    values (array) = (indices, pixels) values - NaN are ignored (per index for the moments and histograms,
+                     per pixel for the cross-products)
+    zone (array) = zone of each pixel
+    n_zones (int) = number of zones
+    band_names (list) = index names
+    edges (array) = (indices, bins + 1) histogram edges
+
+    Returns:
+        summary (dict)
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    zone = np.asarray(zone, dtype=np.int64)
+
+    k, bins = len(values), edges.shape[1] - 1
+
+    summary = {'band_names': list(band_names), 'edges': edges}
+
+    for name in ('count', 'mean', 'm2', 'log_count', 'log_mean', 'log_m2'):
+        summary[name] = np.zeros((n_zones, k))
+
+    summary['histogram'] = np.zeros((n_zones, k, bins), dtype=np.int64)
+
+    for i, band in enumerate(values):
+
+        valid = ~np.isnan(band)
+        summary['count'][:, i], summary['mean'][:, i], summary['m2'][:, i] = _zone_moments(band[valid], zone[valid], n_zones)
+
+        positive = valid & (band > 0)
+        summary['log_count'][:, i], summary['log_mean'][:, i], summary['log_m2'][:, i] = _zone_moments(np.log(band[positive]), zone[positive], n_zones)
+
+        b = np.clip(np.searchsorted(edges[i], band[valid], side='right') - 1, 0, bins - 1)
+        summary['histogram'][:, i] = np.bincount(zone[valid] * bins + b, minlength=n_zones * bins).reshape(n_zones, bins)
+
+    # Cross-products of the pixels valid in every index
+    joint = ~np.isnan(values).any(axis=0)
+    joint_values, joint_zone = values[:, joint], zone[joint]
+
+    summary['joint_count'] = np.bincount(joint_zone, minlength=n_zones).astype(np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary['joint_mean'] = np.stack([np.bincount(joint_zone, weights=band, minlength=n_zones) for band in joint_values], axis=1) / summary['joint_count'][:, None]
+
+    summary['joint_mean'] = np.nan_to_num(summary['joint_mean'])
+
+    deviations = joint_values - summary['joint_mean'][joint_zone].T
+    summary['comoment'] = np.zeros((n_zones, k, k))
+
+    for i in range(k):
+        for j in range(i, k):
+            summary['comoment'][:, i, j] = summary['comoment'][:, j, i] = np.bincount(joint_zone, weights=deviations[i] * deviations[j], minlength=n_zones)
+
+    return summary
+
+def summary_merge(summaries):
+
+    """
+    Merges summaries with the same zones, indices and histogram edges
+    """
+
+    merged = dict(summaries[0])
+
+    for summary in summaries[1:]:
+
+        assert summary['band_names'] == merged['band_names'], 'Summary indices do not match!'
+        assert np.array_equal(summary['edges'], merged['edges']), 'Summary histogram edges do not match!'
+        assert summary['count'].shape == merged['count'].shape, 'Summary zones do not match!'
+
+        for prefix in ('', 'log_'):
+            merged[prefix + 'count'], merged[prefix + 'mean'], merged[prefix + 'm2'] = _chan_merge(
+                merged[prefix + 'count'], merged[prefix + 'mean'], merged[prefix + 'm2'],
+                summary[prefix + 'count'], summary[prefix + 'mean'], summary[prefix + 'm2'])
+
+        merged['joint_count'], merged['joint_mean'], merged['comoment'] = _chan_merge(
+            merged['joint_count'], merged['joint_mean'], merged['comoment'],
+            summary['joint_count'], summary['joint_mean'], summary['comoment'])
+
+        merged['histogram'] = merged['histogram'] + summary['histogram']
+
+    return merged
+
+def summary_update(summary, values, zone):
+
+    """
+    Summary with a new batch of values added
+    """
+
+    return summary_merge([summary, summarize(values, zone, len(summary['count']), summary['band_names'], summary['edges'])])
+
+def summary_total(summary):
+
+    """
+    One-zone summary of all the zones together (ex. class summary from its patch summaries)
+    """
+
+    total = {'band_names': summary['band_names'], 'edges': summary['edges'], 'histogram': summary['histogram'].sum(axis=0, keepdims=True)}
+
+    # Pooled moments: m2 = sum(m2_z) + sum(count_z (mean_z - mean)^2)
+    for count, mean, m2 in (('count', 'mean', 'm2'), ('log_count', 'log_mean', 'log_m2'), ('joint_count', 'joint_mean', 'comoment')):
+
+        n = summary[count].sum(axis=0, keepdims=True)
+        weights = summary[count] if summary[count].ndim == summary[mean].ndim else summary[count][:, None]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pooled = np.nan_to_num((weights * summary[mean]).sum(axis=0, keepdims=True) / (n if n.ndim == summary[mean].ndim else n[:, None]))
+
+        delta = summary[mean] - pooled
+
+        if summary[m2].ndim > delta.ndim:
+            spread = (weights[:, :, None] * delta[:, :, None] * delta[:, None, :]).sum(axis=0, keepdims=True)
+        else:
+            spread = (weights * delta * delta).sum(axis=0, keepdims=True)
+
+        total[count], total[mean], total[m2] = n, pooled, summary[m2].sum(axis=0, keepdims=True) + spread
+
+    return total
+
+def summary_sums(summary):
+
+    """
+    Raw sums of each zone and index
+
+    Returns:
+        dict - count, sum, sumsq, log_count, sum_log, sumsq_log (zones, indices) and cross (zones, indices, indices) -
+        the sum of value products of the pixels valid in every index
+    """
+
+    count, mean, log_count, log_mean = summary['count'], summary['mean'], summary['log_count'], summary['log_mean']
+
+    return {'count': count, 'sum': count * mean, 'sumsq': summary['m2'] + count * np.square(mean),
+            'log_count': log_count, 'sum_log': log_count * log_mean, 'sumsq_log': summary['log_m2'] + log_count * np.square(log_mean),
+            'cross': summary['comoment'] + summary['joint_count'][:, None, None] * summary['joint_mean'][:, :, None] * summary['joint_mean'][:, None, :]}
+
+def summary_moments(summary, ddof=0):
+
+    """
+    Count, mean and variance of each zone and index (NaN for empty zones)
+    """
+
+    count = summary['count']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return count, np.where(count > 0, summary['mean'], np.nan), summary['m2'] / (count - ddof)
+
+def summary_covariance(summary, ddof=0):
+
+    """
+    Joint count, mean vector and covariance matrix of each zone (pixels valid in every index)
+    """
+
+    count = summary['joint_count']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return count, np.where(count[:, None] > 0, summary['joint_mean'], np.nan), summary['comoment'] / (count - ddof)[:, None, None]
+
+def summary_lognorm(summary):
+
+    """
+    Lognormal parameters with loc = 0 of each zone and index (as lognorm_fit.fit_lognorm_fixed)
+
+    Returns:
+        shape, loc, scale (zones, indices) - NaN for zones with non-positive values or fewer than 2 values
+    """
+
+    count, log_count = summary['count'], summary['log_count']
+
+    bad = (count < 2) | (log_count < count)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shape = np.sqrt(summary['log_m2'] / log_count)
+
+    return np.where(bad, np.nan, shape), np.zeros(count.shape), np.where(bad, np.nan, np.exp(summary['log_mean']))
+
+def save_summary(path, summary):
+
+    """
+    Saves a summary to a compressed .npz
+    """
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    arrays = {name: value for name, value in summary.items() if name != 'band_names'}
+
+    np.savez_compressed(path, band_names=np.array(summary['band_names']), **arrays)
+
+def load_summary(path):
+
+    """
+    Loads a summary saved by save_summary
+    """
+
+    stored = np.load(path)
+
+    summary = {name: stored[name] for name in stored.files}
+    summary['band_names'] = [str(name) for name in stored['band_names']]
+
+    return summary
+
+def summary_path(store_path, class_name, date):
+
+    return os.path.join(store_path, f'{class_name}_{date}_summary.npz')
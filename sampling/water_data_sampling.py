@@ -3,37 +3,23 @@ import geopandas as gpd
 import pandas as pd
 import os
 
-from rasterstats import point_query
+from point_sampler import sample_points_run
 
 water_mask = gpd.read_file('D:/thesis_data/ROI/classes/form_florestal_10m_32723.GEOJSON')
 
-indices = os.listdir('D:/thesis_data/VEG_INDICES/dprvi_parameters/')
+images_path = 'D:/thesis_data/VEG_INDICES/dprvi_parameters/'
 
-for index, image in enumerate(indices):
+indices = os.listdir(images_path)
 
-    date = indices[index].split('.')[0]
+raster_paths = {image.split('.')[0]: images_path + str(image) for image in indices}
 
-    dprvi = point_query(water_mask, 'D:/thesis_data/VEG_INDICES/dprvi_parameters/' + str(image), band=1, nodata=np.nan)
-    dprvi = np.array(dprvi)
-    print(f'DpRVI data collected!')
+# Point pixels are computed once (cached) and each raster is read once for all the bands, with the dates read in parallel
+samples = sample_points_run(raster_paths, [geom for geom in water_mask.geometry], ['DpRVI', 'DOP', 'Lambda1', 'Lambda2', 'Beta'],
+                            cache_path='D:/thesis_data/VEG_INDICES/zone_index/water_points.npz', workers=4)
 
-    dop = point_query(water_mask, 'D:/thesis_data/VEG_INDICES/dprvi_parameters/' + str(image), band=2, nodata=np.nan)
-    dop = np.array(dop)
-    print(f'DOP data collected!')
+for date, df_water in samples.items():
 
-    lambda1 = point_query(water_mask, 'D:/thesis_data/VEG_INDICES/dprvi_parameters/' + str(image), band=3, nodata=np.nan)
-    lambda1 = np.array(lambda1)
-    print(f'Lambda1 data collected!')
-
-    lambda2 = point_query(water_mask, 'D:/thesis_data/VEG_INDICES/dprvi_parameters/' + str(image), band=4, nodata=np.nan)
-    lambda2 = np.array(lambda2)
-    print(f'Lambda2 data collected!')
-
-    beta = point_query(water_mask, 'D:/thesis_data/VEG_INDICES/dprvi_parameters/' + str(image), band=5, nodata=np.nan)
-    beta = np.array(beta)
-    print(f'Beta data collected!')
-
-    df_water = pd.DataFrame({'DpRVI': dprvi.flatten(), 'DOP': dop.flatten(), 'Lambda1': lambda1.flatten(), 'Lambda2': lambda2.flatten(), 'Beta': beta.flatten()})
+    df_water = df_water.drop(columns='feature')
     df_water.dropna(inplace=True)
 
     df_water.to_csv('D:/thesis_data/VEG_INDICES/samples/water/' + 'florestal_' + date + '_samples' + '.csv', sep=',', index=False)
@@ -0,0 +1,333 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio as rst
+from rasterio.windows import Window
+
+from raster_stack import list_dated_rasters
+from zone_index import load_zone_index, zone_samples, grid_key
+from quantile_sketch import new_sketch, sketch_update, sketch_quantiles, save_sketches
+
+# Same statistics (and names) as rasterstats.zonal_stats
+STATS = ['mean', 'median', 'percentile_25', 'percentile_75', 'std']
+
+def _get_args():
+
+    '''
+    Input parameters parser
+    '''
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-j', '--json',
+    help='The input json file cotaining the zonal statistics settings',
+    type=str)
+
+    args = parser.parse_args()
+
+    return args
+
+def _percentile_q(stat):
+
+    return {'median': 50.0}.get(stat, float(stat.split('_')[-1]) if stat.startswith('percentile_') else None)
+
+def segment_statistics(values, zone, n_zones, stats=STATS):
+
+    """
+    Statistics of every zone at once from the concatenated zone values (NaN ignored)
+
+    Percentiles use linear interpolation and std uses ddof=0, as numpy/rasterstats do.
+
+    Args:
+    values (array) = pixel values of all zones
+    zone (array) = zone of each value
+    n_zones (int) = number of zones
+    stats (list) = statistics to compute (mean, std, median, percentile_<q>). Default = STATS
+
+    Returns:
+        dict {statistic: 1-D array with one value per zone} (plus 'count')
+    """
+
+    valid = ~np.isnan(values)
+    values, zone = values[valid].astype(np.float64), zone[valid]
+
+    order = np.lexsort((values, zone))
+    values, zone = values[order], zone[order]
+
+    count = np.bincount(zone, minlength=n_zones)
+    start = np.cumsum(count) - count
+    empty = count == 0
+
+    result = {'count': count}
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+
+        mean = np.bincount(zone, weights=values, minlength=n_zones) / count
+
+        for stat in stats:
+
+            q = _percentile_q(stat)
+
+            if stat == 'mean':
+
+                result[stat] = mean
+
+            elif stat == 'std':
+
+                result[stat] = np.sqrt(np.bincount(zone, weights=np.square(values - mean[zone]), minlength=n_zones) / count)
+
+            elif q is not None:
+
+                if values.size == 0:
+                    result[stat] = np.full(n_zones, np.nan)
+                    continue
+
+                position = start + (np.maximum(count, 1) - 1) * q / 100.0
+                low = np.minimum(np.floor(position).astype(np.int64), values.size - 1)
+                high = np.minimum(np.ceil(position).astype(np.int64), values.size - 1)
+
+                result[stat] = np.where(empty, np.nan, values[low] + (values[high] - values[low]) * (position - low))
+
+            else:
+
+                raise ValueError(f'Unknown statistic! {stat}')
+
+    return result
+
+def zonal_statistics(bands, band_names, zones, stats=STATS):
+
+    """
+    Statistics of every band for every zone of one raster
+
+    Args:
+    bands (array) = (bands, rows, cols) raster, NaN as nodata
+    band_names (list) = name of each band
+    zones (csr_matrix) = zone index of the raster grid (see zone_index)
+    stats (list) = statistics to compute. Default = STATS
+
+    Returns:
+        tidy DataFrame (zone, index, count, statistics...)
+    """
+
+    tables = []
+
+    for band, band_name in zip(bands, band_names):
+
+        values, zone = zone_samples(zones, band)
+
+        result = segment_statistics(values, zone, zones.shape[0], stats)
+
+        table = pd.DataFrame({'zone': np.arange(zones.shape[0]), 'index': band_name, **result})
+        tables.append(table)
+
+    return pd.concat(tables, ignore_index=True)
+
+def zonal_sketches(raster_path, band_names, class_zones, alpha=0.01, min_value=1e-6, max_value=1e3, rows=512):
+
+    """
+    Streams a raster in row strips and accumulates, for every class polygon and band, a quantile
+    sketch and the moments (count, sum, sum of squares) - only one strip is in memory at a time
+
+    Args:
+    raster_path (string) = raster file
+    band_names (list) = name of each raster band
+    class_zones (dict) = {class name: zone index of the raster grid}
+    alpha, min_value, max_value = sketch parameters (see quantile_sketch.new_sketch)
+    rows (int) = rows of each strip. Default = 512
+
+    Returns:
+        sketches {class: {band: sketch}} and moments {class: {band: (count, sum, sum of squares)}}
+    """
+
+    sketches = {class_name: {band_name: new_sketch(zones.shape[0], alpha, min_value, max_value) for band_name in band_names}
+                for class_name, zones in class_zones.items()}
+
+    moments = {class_name: {band_name: np.zeros((3, zones.shape[0])) for band_name in band_names}
+               for class_name, zones in class_zones.items()}
+
+    entry_zones = {class_name: np.repeat(np.arange(zones.shape[0]), np.diff(zones.indptr)) for class_name, zones in class_zones.items()}
+
+    with rst.open(raster_path) as raster:
+
+        for row_off in range(0, raster.height, rows):
+
+            window = Window(0, row_off, raster.width, min(rows, raster.height - row_off))
+            strip = raster.read(window=window, masked=True).astype(np.float32).filled(np.nan).reshape(raster.count, -1)
+
+            first = row_off * raster.width
+
+            for class_name, zones in class_zones.items():
+
+                inside = (zones.indices >= first) & (zones.indices < first + strip.shape[1])
+                pixels, zone = zones.indices[inside] - first, entry_zones[class_name][inside]
+
+                for band, band_name in zip(strip, band_names):
+
+                    values = band[pixels].astype(np.float64)
+                    valid = ~np.isnan(values)
+
+                    sketch_update(sketches[class_name][band_name], values[valid], zone[valid])
+
+                    n_zones = zones.shape[0]
+                    moments[class_name][band_name] += [np.bincount(zone[valid], minlength=n_zones),
+                                                       np.bincount(zone[valid], weights=values[valid], minlength=n_zones),
+                                                       np.bincount(zone[valid], weights=np.square(values[valid]), minlength=n_zones)]
+
+    return sketches, moments
+
+def sketch_statistics(sketches, moments, band_names, stats=STATS):
+
+    """
+    Zonal statistics from the sketches and moments of zonal_sketches (percentiles are approximate,
+    within the sketch relative error)
+
+    Returns:
+        tidy DataFrame (zone, index, count, statistics...)
+    """
+
+    tables = []
+
+    for band_name in band_names:
+
+        count, total, squares = moments[band_name]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            std = np.sqrt(np.maximum(squares / count - mean * mean, 0.0))
+
+        quantile_stats = [stat for stat in stats if _percentile_q(stat) is not None]
+        quantiles = sketch_quantiles(sketches[band_name], [_percentile_q(stat) / 100.0 for stat in quantile_stats])
+
+        result = {'count': count.astype(np.int64)}
+
+        for stat in stats:
+
+            if stat == 'mean':
+                result[stat] = mean
+            elif stat == 'std':
+                result[stat] = std
+            elif stat in quantile_stats:
+                result[stat] = quantiles[:, quantile_stats.index(stat)]
+            else:
+                raise ValueError(f'Unknown statistic! {stat}')
+
+        tables.append(pd.DataFrame({'zone': np.arange(len(count)), 'index': band_name, **result}))
+
+    return pd.concat(tables, ignore_index=True)
+
+def _zone_index_file(zone_index_path, class_name, out_shape, transform):
+
+    # One cache per class and raster grid: scripts sharing the folder on different grids do not overwrite each other
+    return os.path.join(zone_index_path, f'{class_name}_{grid_key(out_shape, transform)}.npz')
+
+def zonal_statistics_run(images_path, band_names, class_geometries, zone_index_path, stats=STATS, date_pattern=r'(\d{8})', sketch=None, sketch_path=None):
+
+    """
+    Zonal statistics of every band, class polygon and date - each raster is read once
+
+    With sketch, the rasters are streamed in row strips and the percentiles come from quantile
+    sketches (bounded memory, approximate percentiles). The sketches of each (class, date) can be
+    saved to sketch_path (<class>/<date>.npz, one sketch per band) to be merged later across dates.
+
+    Args:
+    images_path (string) = folder with the per-date rasters
+    band_names (list) = name of each raster band
+    class_geometries (dict) = {class name: list of polygons}
+    zone_index_path (string) = folder of the cached zone indices (<class>_<grid hash>.npz)
+    stats (list) = statistics to compute. Default = STATS
+    date_pattern (string) = regex that extracts the date from the file names. Default = 8 digits
+    sketch (dict) = zonal_sketches parameters (alpha, min_value, max_value, rows). Default = None (exact statistics)
+    sketch_path (string) = folder of the saved sketches. Default = None (not saved)
+
+    Returns:
+        tidy DataFrame (date, class, zone, index, count, statistics...)
+    """
+
+    os.makedirs(zone_index_path, exist_ok=True)
+
+    tables = []
+
+    for date, path in list_dated_rasters(images_path, date_pattern):
+
+        if sketch is not None:
+
+            with rst.open(path) as raster:
+                out_shape, transform = (raster.height, raster.width), raster.transform
+
+            class_zones = {class_name: load_zone_index(_zone_index_file(zone_index_path, class_name, out_shape, transform), geometries, out_shape, transform)
+                           for class_name, geometries in class_geometries.items()}
+
+            sketches, moments = zonal_sketches(path, band_names, class_zones, **sketch)
+
+        else:
+
+            with rst.open(path) as raster:
+                bands = raster.read(masked=True).astype(np.float32).filled(np.nan)
+                transform = raster.transform
+
+        for class_name, geometries in class_geometries.items():
+
+            if sketch is not None:
+
+                table = sketch_statistics(sketches[class_name], moments[class_name], band_names, stats)
+
+                if sketch_path is not None:
+                    os.makedirs(os.path.join(sketch_path, class_name), exist_ok=True)
+                    save_sketches(os.path.join(sketch_path, class_name, date + '.npz'), sketches[class_name])
+
+            else:
+
+                zones = load_zone_index(_zone_index_file(zone_index_path, class_name, bands.shape[1:], transform), geometries, bands.shape[1:], transform)
+
+                table = zonal_statistics(bands, band_names, zones, stats)
+
+            table.insert(0, 'class', class_name)
+            table.insert(0, 'date', pd.to_datetime(date, format='%Y%m%d'))
+
+            tables.append(table)
+
+        print(f'{date} zonal statistics collected!')
+
+    return pd.concat(tables, ignore_index=True)
+
+def write_class_tables(table, output_path, stats=STATS):
+
+    """
+    Splits the tidy table into the per-class, per-index csv files used by the plots (<class>_<index>.csv)
+    """
+
+    for (class_name, band_name), group in table.groupby(['class', 'index'], sort=False):
+
+        group = group.sort_values(['date', 'zone'])[stats + ['date']]
+        group.to_csv(output_path + class_name + '_' + band_name + '.csv', sep=',', index=False)
+
+        print(f'{band_name} {class_name} csv file saved!')
+
+def _main(settings):
+
+    class_geometries = {class_name: [geom for geom in gpd.read_file(path).geometry] for class_name, path in settings['classes'].items()}
+
+    stats = settings.get('stats', STATS)
+
+    table = zonal_statistics_run(settings['images_path'], settings['band_names'], class_geometries, settings['zone_index_path'], stats,
+                                 settings.get('date_pattern', r'(\d{8})'), settings.get('sketch'), settings.get('sketch_path'))
+
+    table.to_csv(settings['table_path'], sep=',', index=False)
+    print(f"{settings['table_path']} saved!")
+
+    if settings.get('class_tables_path'):
+        write_class_tables(table, settings['class_tables_path'], stats)
+
+if __name__ == "__main__":
+
+    import json
+
+    args = _get_args()
+
+    file = open(args.json)
+
+    params = json.load(file)
+
+    _main(params)
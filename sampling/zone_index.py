@@ -0,0 +1,175 @@
+import hashlib
+import os
+import numpy as np
+from affine import Affine
+from rasterio.features import geometry_mask
+from rasterio.windows import Window, transform as window_transform
+from scipy import sparse
+
+def geometry_set_key(geometries):
+
+    """
+    Hash of a geometry set (WKB), used to validate cached zone indices
+    """
+
+    digest = hashlib.sha1()
+
+    for geom in geometries:
+        digest.update(geom.wkb)
+
+    return digest.hexdigest()
+
+def grid_key(out_shape, transform):
+
+    """
+    Short hash of a raster grid (shape and transform), used to keep the zone indices of different grids apart
+    """
+
+    return hashlib.sha1(repr((tuple(int(n) for n in out_shape), tuple(float(c) for c in transform[:6]))).encode()).hexdigest()[:12]
+
+def _grid_coefs(transform):
+
+    return np.array([transform.a, transform.b, transform.c, transform.d, transform.e, transform.f])
+
+def build_zone_index(geometries, out_shape, transform, coverage=False, supersample=4):
+
+    """
+    Sparse polygon -> pixel index (CSR, polygons x flat pixels)
+
+    Row p holds the flat pixel indices covered by polygon p. Binary weights select the pixels whose
+    center falls inside the polygon (same as rasterio mask); coverage weights hold the covered
+    fraction of each touched pixel, estimated on a supersample x supersample sub-grid.
+
+    Args:
+    geometries (list) = polygons in the raster CRS
+    out_shape (tuple) = (rows, cols) of the raster grid
+    transform (Affine) = affine transform of the raster grid
+    coverage (bool) = fractional coverage weights instead of binary. Default = False
+    supersample (int) = sub-pixels per pixel side for the coverage weights. Default = 4
+
+    Returns:
+        zone index (scipy.sparse.csr_matrix, float32)
+    """
+
+    height, width = out_shape
+
+    indptr = [0]
+    indices = []
+    weights = []
+
+    for geom in geometries:
+
+        # Pixel window of the polygon bounds, clipped to the grid
+        minx, miny, maxx, maxy = geom.bounds
+        cols_f, rows_f = zip(*[~transform * corner for corner in ((minx, miny), (minx, maxy), (maxx, miny), (maxx, maxy))])
+
+        c0, c1 = max(int(np.floor(min(cols_f))), 0), min(int(np.ceil(max(cols_f))), width)
+        r0, r1 = max(int(np.floor(min(rows_f))), 0), min(int(np.ceil(max(rows_f))), height)
+
+        if r1 <= r0 or c1 <= c0:
+            indptr.append(indptr[-1])
+            continue
+
+        window = Window(c0, r0, c1 - c0, r1 - r0)
+
+        rows, cols = int(window.height), int(window.width)
+
+        if coverage:
+
+            sub_transform = window_transform(window, transform) * Affine.scale(1 / supersample)
+            inside = geometry_mask([geom], out_shape=(rows * supersample, cols * supersample), transform=sub_transform, invert=True)
+            fraction = inside.reshape(rows, supersample, cols, supersample).mean(axis=(1, 3))
+
+        else:
+
+            fraction = geometry_mask([geom], out_shape=(rows, cols), transform=window_transform(window, transform), invert=True).astype(np.float32)
+
+        r, c = np.nonzero(fraction)
+
+        indices.append((r + int(window.row_off)) * width + (c + int(window.col_off)))
+        weights.append(fraction[r, c])
+
+        indptr.append(indptr[-1] + len(r))
+
+    indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+    weights = np.concatenate(weights).astype(np.float32) if weights else np.zeros(0, dtype=np.float32)
+
+    return sparse.csr_matrix((weights, indices, np.array(indptr)), shape=(len(geometries), height * width))
+
+def load_zone_index(cache_path, geometries, out_shape, transform, coverage=False, supersample=4):
+
+    """
+    Loads a cached zone index, building and saving it when missing or stale
+
+    The cache is valid for one (geometry set, raster grid, weighting, supersample) combination.
+
+    Args:
+    cache_path (string) = .npz file of the cached index
+    geometries, out_shape, transform, coverage, supersample = see build_zone_index
+
+    Returns:
+        zone index (scipy.sparse.csr_matrix, float32)
+    """
+
+    key = geometry_set_key(geometries)
+    coefs = _grid_coefs(transform)
+
+    if os.path.exists(cache_path):
+
+        cached = np.load(cache_path)
+
+        if (str(cached['key']) == key and tuple(cached['shape']) == tuple(out_shape) and np.allclose(cached['transform'], coefs)
+                and bool(cached['coverage']) == coverage
+                # The supersample only changes the coverage weights
+                and (not coverage or ('supersample' in cached.files and int(cached['supersample']) == supersample))):
+            return sparse.csr_matrix((cached['data'], cached['indices'], cached['indptr']), shape=(len(geometries), out_shape[0] * out_shape[1]))
+
+    index = build_zone_index(geometries, out_shape, transform, coverage, supersample)
+
+    np.savez(cache_path, data=index.data, indices=index.indices, indptr=index.indptr,
+             key=key, shape=np.array(out_shape), transform=coefs, coverage=coverage, supersample=supersample)
+
+    return index
+
+def zone_samples(index, band):
+
+    """
+    Pixel values of each polygon - a single fancy index over the flattened band
+
+    Args:
+    index (csr_matrix) = zone index
+    band (array) = 2-D raster band on the index grid
+
+    Returns:
+        values (1-D array) of all polygons, concatenated, and zone (1-D array) with the polygon of each value
+    """
+
+    values = band.reshape(-1)[index.indices]
+    zone = np.repeat(np.arange(index.shape[0]), np.diff(index.indptr))
+
+    return values, zone
+
+def zone_moments(index, band):
+
+    """
+    Weighted count, mean and variance of each polygon - sparse mat-vecs, NaN pixels ignored
+
+    Args:
+    index (csr_matrix) = zone index
+    band (array) = 2-D raster band on the index grid
+
+    Returns:
+        count, mean, variance (1-D arrays, one value per polygon)
+    """
+
+    values = band.reshape(-1).astype(np.float64)
+    valid = ~np.isnan(values)
+    values = np.where(valid, values, 0.0)
+
+    count = index @ valid.astype(np.float64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (index @ values) / count
+        variance = (index @ (values * values)) / count - mean * mean
+
+    return count, mean, np.maximum(variance, 0.0)
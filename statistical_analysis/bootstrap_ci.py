@@ -0,0 +1,445 @@
+'''
+Bootstrap confidence intervals of the separability metrics
+
+A block of B bootstrap replicates of a sample set is drawn as a (B, n) array of resample indices and
+turned into (B, n) multiplicity weights, so every replicate statistic is a weighted statistic of the
+original sample computed in array form:
+
+JM    - weighted means and variances (matrix products), Gaussian JM of each index
+OVL   - weighted histograms on the shared edges (one bincount), histogram or binned KDE overlap
+rates - the symmetric KL rejection matrix of the patch pairs is computed once, and the rejection rate
+        of a replicate is w_p' R w_q over the resampled patches
+
+Dates are bootstrapped in a process pool, each with its own generator spawned from one seed, so the
+intervals are reproducible whatever the number of workers. JM and rejection-rate intervals are
+percentile intervals. OVL intervals are basic (pivot) intervals: binning a resample always lowers the
+histogram overlap, so the replicates sit below the estimate and their percentiles can exclude it. The
+bootstrap bias (replicate mean - estimate) is reported with every interval, and the OVL tables also give
+the bias-corrected estimate (estimate - bias), which is the one checked against the basic interval.
+'''
+
+import argparse
+import os
+import re
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy.stats import chi2
+
+from skl_tests import skl_statistic, lognorm_params
+
+# Gaussian JM (jm_analysis/jm_engine.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'jm_analysis'))
+from jm_engine import jm_distance
+
+# Overlap coefficients (ovl_analysis/ovl_engine.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ovl_analysis'))
+from ovl_engine import overlap, binned_kde, kde_bandwidth, build_histogram_cache
+
+def _get_args():
+
+    '''
+    Input parameters parser
+    '''
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-j', '--json',
+    help='The input json file cotaining the bootstrap settings',
+    type=str)
+
+    args = parser.parse_args()
+
+    return args
+
+def resample_weights(rng, n, replicates):
+
+    """
+    Multiplicity of each sample in each replicate, from a (replicates, n) array of resample indices
+
+    Returns:
+        weights (replicates, n) float64, every row sums to n
+    """
+
+    indices = rng.integers(0, n, size=(replicates, n)) + np.arange(replicates)[:, None] * n
+
+    return np.bincount(indices.ravel(), minlength=replicates * n).reshape(replicates, n).astype(np.float64)
+
+def _blocks(rng, n, replicates, block_size):
+
+    """
+    Weights of all the replicates, in blocks of at most block_size resampled values
+    """
+
+    step = max(block_size // max(n, 1), 1)
+
+    for start in range(0, replicates, step):
+        yield resample_weights(rng, n, min(step, replicates - start))
+
+def weighted_moments(values, weights):
+
+    """
+    Weighted mean and variance of each column (values (n, k), weights (B, n)) - (B, k) arrays
+    """
+
+    # Centered on the sample mean to avoid cancellation in the second moment
+    center = values.mean(axis=0)
+    centered = values - center
+
+    total = weights.sum(axis=1)[:, None]
+
+    mean = weights @ centered / total
+
+    return mean + center, weights @ np.square(centered) / total - np.square(mean)
+
+def bin_ids(values, edges):
+
+    """
+    Bin of each value of each column on the index edges (values (n, k), edges (k, bins + 1)) - out of
+    range values get the extra bin 'bins', which is dropped from the histograms
+    """
+
+    bins = edges.shape[1] - 1
+
+    ids = np.empty(values.shape, dtype=np.int64)
+
+    for i in range(values.shape[1]):
+
+        column = values[:, i]
+        ids[:, i] = np.minimum(np.searchsorted(edges[i], column, side='right') - 1, bins - 1)
+        ids[(column < edges[i, 0]) | (column > edges[i, -1]), i] = bins
+
+    return ids
+
+def weighted_histograms(ids, weights, bins):
+
+    """
+    Weighted histogram of each replicate and column (ids (n, k), weights (B, n)) - (B, k, bins) array
+    """
+
+    replicates = len(weights)
+    offsets = np.arange(replicates)[:, None] * (bins + 1)
+
+    counts = [np.bincount((offsets + ids[:, i][None, :]).ravel(), weights=weights.ravel(), minlength=replicates * (bins + 1))
+              .reshape(replicates, bins + 1)[:, :bins] for i in range(ids.shape[1])]
+
+    return np.stack(counts, axis=1)
+
+def bootstrap_jm(values_p, values_q, replicates=1000, rng=None, block_size=20_000_000):
+
+    """
+    Bootstrap replicates of the univariate Gaussian JM distance of each index
+
+    Args:
+    values_p, values_q (arrays) = (samples, indices) values of the two classes
+    replicates (int) = bootstrap replicates. Default = 1000
+    rng (Generator) = random generator. Default = None (fresh generator)
+    block_size (int) = resampled values held in memory at once. Default = 20 000 000
+
+    Returns:
+        estimate (indices), replicates (replicates, indices)
+    """
+
+    rng = np.random.default_rng() if rng is None else rng
+
+    def jm(mean_p, var_p, mean_q, var_q):
+        return jm_distance(mean_p[..., None], var_p[..., None, None], mean_q[..., None], var_q[..., None, None])
+
+    estimate = jm(*weighted_moments(values_p, np.ones((1, len(values_p)))), *weighted_moments(values_q, np.ones((1, len(values_q)))))[0]
+
+    moments_p = [weighted_moments(values_p, w) for w in _blocks(rng, len(values_p), replicates, block_size)]
+    moments_q = [weighted_moments(values_q, w) for w in _blocks(rng, len(values_q), replicates, block_size)]
+
+    mean_p, var_p = (np.concatenate([m[i] for m in moments_p]) for i in (0, 1))
+    mean_q, var_q = (np.concatenate([m[i] for m in moments_q]) for i in (0, 1))
+
+    return estimate, jm(mean_p, var_p, mean_q, var_q)
+
+def bootstrap_ovl(values_p, values_q, edges, replicates=1000, rng=None, method='histogram', rule='silverman', block_size=20_000_000):
+
+    """
+    Bootstrap replicates of the overlap coefficient of each index
+
+    Args:
+    values_p, values_q (arrays) = (samples, indices) values of the two classes
+    edges (array) = (indices, bins + 1) shared bin edges (fine grid for the KDE method)
+    replicates, rng, block_size = see bootstrap_jm
+    method (string) = 'histogram' or 'kde'. Default = 'histogram'
+    rule (string) = KDE bandwidth rule. Default = 'silverman'
+
+    Returns:
+        estimate (indices), replicates (replicates, indices)
+    """
+
+    rng = np.random.default_rng() if rng is None else rng
+    bins = edges.shape[1] - 1
+
+    ids_p, ids_q = bin_ids(values_p, edges), bin_ids(values_q, edges)
+
+    def ovl(hist_p, hist_q, n_p, n_q):
+
+        if method == 'histogram':
+            return overlap(hist_p, hist_q, np.full(hist_p.shape[:-1], n_p), np.full(hist_q.shape[:-1], n_q))
+
+        result = np.zeros(hist_p.shape[:-1])
+
+        for i in range(hist_p.shape[1]):
+
+            counts = np.stack([hist_p[:, i], hist_q[:, i]])
+            n = np.stack([np.full(len(hist_p), n_p), np.full(len(hist_q), n_q)]).astype(np.float64)
+
+            density, step = binned_kde(counts, edges[i], kde_bandwidth(counts, edges[i], n, rule), n)
+            result[:, i] = np.minimum(density[0], density[1]).sum(axis=-1) * step
+
+        return result
+
+    n_p, n_q = len(values_p), len(values_q)
+
+    estimate = ovl(weighted_histograms(ids_p, np.ones((1, n_p)), bins), weighted_histograms(ids_q, np.ones((1, n_q)), bins), n_p, n_q)[0]
+
+    hist_p = np.concatenate([weighted_histograms(ids_p, w, bins) for w in _blocks(rng, n_p, replicates, block_size)])
+    hist_q = np.concatenate([weighted_histograms(ids_q, w, bins) for w in _blocks(rng, n_q, replicates, block_size)])
+
+    return estimate, ovl(hist_p, hist_q, n_p, n_q)
+
+def bootstrap_rejection_rate(params_p, params_q=None, replicates=1000, rng=None, alpha=0.05, m=400, n=400):
+
+    """
+    Bootstrap replicates of the symmetric KL rejection rate of each index, resampling the patches
+
+    Args:
+    params_p (tuple) = (shape, scale) arrays (indices x patches) of the first class
+    params_q (tuple) = same for the second class. Default = None (intra-class, one resample of the patch set)
+    replicates, rng = see bootstrap_jm
+    alpha, m, n = see skl_tests.rejection_rate
+
+    Returns:
+        estimate (indices), replicates (replicates, indices)
+    """
+
+    rng = np.random.default_rng() if rng is None else rng
+    intra = params_q is None
+    params_q = params_p if intra else params_q
+
+    critical = chi2.isf(alpha, df=2)
+
+    (shape_p, scale_p), (shape_q, scale_q) = params_p, params_q
+    P, Q = shape_p.shape[-1], shape_q.shape[-1]
+
+    weights_p = resample_weights(rng, P, replicates)
+    weights_q = weights_p if intra else resample_weights(rng, Q, replicates)
+
+    # The i = j pairs and the pairs with a NaN statistic are excluded as in skl_tests.rejection_rate. The pair
+    # count of each replicate is weighted like the rejections, so two draws of the same patch are never counted
+    diagonal = np.arange(min(P, Q))
+
+    estimate, result = np.zeros(len(shape_p)), np.zeros((replicates, len(shape_p)))
+
+    for i in range(len(shape_p)):
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            statistic = skl_statistic(shape_p[i], scale_p[i], shape_q[i], scale_q[i], m, n)
+
+        valid = ~np.isnan(statistic)
+        rejected = (statistic >= critical).astype(np.float64)
+
+        valid[diagonal, diagonal] = False
+        rejected[diagonal, diagonal] = 0.0
+
+        valid = valid.astype(np.float64)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            estimate[i] = rejected.sum() / valid.sum()
+            result[:, i] = np.einsum('bp,bp->b', weights_p @ rejected, weights_q) / np.einsum('bp,bp->b', weights_p @ valid, weights_q)
+
+    return estimate, result
+
+def percentile_ci(replicates, level=0.95):
+
+    """
+    Percentile confidence interval (low, high) of each column of the replicates
+    """
+
+    tail = (1 - level) / 2 * 100
+
+    return np.nanpercentile(replicates, tail, axis=0), np.nanpercentile(replicates, 100 - tail, axis=0)
+
+def basic_ci(estimate, replicates, level=0.95):
+
+    """
+    Basic (pivot) confidence interval (low, high) of each column of the replicates, 2 estimate - percentiles
+
+    Corrects a replicate distribution shifted from the estimate (ex. the downward bias of the histogram OVL).
+    """
+
+    low, high = percentile_ci(replicates, level)
+
+    return 2 * estimate - high, 2 * estimate - low
+
+def _interval_table(date, pair, index_list, metric, estimate, replicates, level, interval='percentile'):
+
+    bias = np.nanmean(replicates, axis=0) - estimate
+
+    if interval == 'basic':
+        low, high = basic_ci(estimate, replicates, level)
+        centre = estimate - bias
+    else:
+        low, high = percentile_ci(replicates, level)
+        centre = estimate
+
+    # The (bias-corrected) point estimate must fall inside its own interval
+    outside = (centre < low) | (centre > high)
+
+    if outside.any():
+        print(f'{pair} {date} {metric} estimate outside its {interval} interval! {list(np.asarray(index_list)[outside])}')
+
+    return pd.DataFrame({'date': date, 'pair': pair, 'index': index_list, 'metric': metric, 'estimate': estimate, 'bias': bias,
+                         'estimate_bc': estimate - bias if interval == 'basic' else np.nan, 'ci_low': low, 'ci_high': high})
+
+def _bootstrap_samples(task):
+
+    date, pair, paths, index_list, edges, settings, seed = task
+
+    rng = np.random.default_rng(seed)
+
+    # Rows with a NaN index are dropped (the replicates resample whole rows of all the indices)
+    values_p, values_q = (pd.read_csv(path, usecols=index_list)[index_list].dropna().to_numpy(dtype=np.float64) for path in paths)
+
+    replicates, level = settings.get('replicates', 1000), settings.get('level', 0.95)
+
+    tables = [_interval_table(date, pair, index_list, 'jm', *bootstrap_jm(values_p, values_q, replicates, rng), level)]
+
+    for method in settings.get('ovl_methods', ['histogram']):
+
+        estimate, result = bootstrap_ovl(values_p, values_q, edges[method], replicates, rng, method, settings.get('rule', 'silverman'))
+
+        tables.append(_interval_table(date, pair, index_list, 'ovl' if method == 'histogram' else 'ovl_kde', estimate, result, level, 'basic'))
+
+    return pd.concat(tables, ignore_index=True)
+
+def _bootstrap_params(task):
+
+    date, pair, paths, index_list, _, settings, seed = task
+
+    rng = np.random.default_rng(seed)
+
+    params_p, params_q = (None if path is None else lognorm_params(pd.read_csv(path), index_list) for path in paths)
+
+    estimate, result = bootstrap_rejection_rate(params_p, params_q, settings.get('replicates', 1000), rng,
+                                                settings.get('alpha', 0.05), settings.get('m', 400), settings.get('n', 400))
+
+    return _interval_table(date, pair, index_list, 'rejection_rate', estimate, result, settings.get('level', 0.95))
+
+def _dated_files(path, date_pattern):
+
+    return {re.search(date_pattern, file).group(1): os.path.join(path, file)
+            for file in sorted(os.listdir(path)) if file.endswith('.csv') and re.search(date_pattern, file)}
+
+def bootstrap_run(tasks, function, workers=4):
+
+    """
+    Runs bootstrap tasks in a process pool and joins their interval tables
+    """
+
+    tables = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        for future in as_completed([executor.submit(function, task) for task in tasks]):
+
+            table = future.result()
+            tables.append(table)
+
+            print(f"{table['pair'].iloc[0]} {table['date'].iloc[0]} {table['metric'].iloc[0]} bootstrap done!")
+
+    return pd.concat(tables, ignore_index=True).sort_values(['pair', 'metric', 'index', 'date'], kind='stable').reset_index(drop=True)
+
+def bootstrap_separability(class_paths, pair, index_list, edges, settings, seed=0, workers=4, date_pattern=r'(\d{8})'):
+
+    """
+    Bootstrap intervals of the JM and OVL of one class pair for every date and index
+
+    Args:
+    class_paths (dict) = {class name: folder of the per-date sample csv files}
+    pair (tuple) = (class 1, class 2)
+    index_list (list) = index columns
+    edges (dict) = shared bin edges (indices, bins + 1) of each OVL method {'histogram': ..., 'kde': ...}
+    settings (dict) = replicates (1000), level (0.95), ovl_methods (['histogram']), rule ('silverman')
+    seed (int) = seed of the generators of the dates. Default = 0
+    workers (int) = processes. Default = 4
+    date_pattern (string) = regex that extracts the date from the file names. Default = 8 digits
+
+    Returns:
+        tidy DataFrame (date, pair, index, metric, estimate, bias, estimate_bc (OVL), ci_low, ci_high)
+    """
+
+    files_p, files_q = _dated_files(class_paths[pair[0]], date_pattern), _dated_files(class_paths[pair[1]], date_pattern)
+    dates = sorted(set(files_p) & set(files_q))
+
+    seeds = np.random.SeedSequence(seed).spawn(len(dates))
+
+    tasks = [(date, f'{pair[0]}_{pair[1]}', (files_p[date], files_q[date]), list(index_list), edges, settings, s) for date, s in zip(dates, seeds)]
+
+    return bootstrap_run(tasks, _bootstrap_samples, workers)
+
+def bootstrap_rates(param_paths, pair, index_list, settings, seed=0, workers=4, date_pattern=r'(\d{8})'):
+
+    """
+    Bootstrap intervals of the symmetric KL rejection rates of one class pair (or one class when both
+    names are the same) for every date and index
+
+    Args:
+    param_paths (dict) = {class name: folder of the per-date lognormal parameter csv files}
+    pair (tuple) = (class 1, class 2)
+    index_list (list) = index names of the parameter columns (ex. ['dprvi', 'prvi'])
+    settings (dict) = replicates (1000), level (0.95), alpha (0.05), m (400), n (400)
+    seed, workers, date_pattern = see bootstrap_separability
+
+    Returns:
+        tidy DataFrame (date, pair, index, metric, estimate, bias, estimate_bc (OVL), ci_low, ci_high)
+    """
+
+    files_p, files_q = _dated_files(param_paths[pair[0]], date_pattern), _dated_files(param_paths[pair[1]], date_pattern)
+    dates = sorted(set(files_p) & set(files_q))
+
+    seeds = np.random.SeedSequence(seed).spawn(len(dates))
+    intra = pair[0] == pair[1]
+
+    tasks = [(date, f'{pair[0]}_{pair[1]}', (files_p[date], None if intra else files_q[date]), list(index_list), None, settings, s)
+             for date, s in zip(dates, seeds)]
+
+    return bootstrap_run(tasks, _bootstrap_params, workers)
+
+def _main(settings):
+
+    tables = []
+
+    # Shared bin edges of every OVL method, from the global range of the samples of all the classes
+    edges = {method: build_histogram_cache(settings['class_paths'], settings['indices'],
+                                           os.path.join(settings['output_path'], f'histograms_{bins}_bins.npz'), bins=bins)['edges']
+             for method, bins in (('histogram', settings.get('bins', 500)), ('kde', settings.get('kde_bins', 2048)))}
+
+    for pair in settings.get('pairs', []):
+        tables.append(bootstrap_separability(settings['class_paths'], pair, settings['indices'], edges, settings,
+                                             settings.get('seed', 0), settings.get('workers', 4)))
+
+    for pair in settings.get('rate_pairs', []):
+        tables.append(bootstrap_rates(settings['param_paths'], pair, settings['param_indices'], settings,
+                                      settings.get('seed', 0), settings.get('workers', 4)))
+
+    pd.concat(tables, ignore_index=True).to_csv(os.path.join(settings['output_path'], 'bootstrap_ci.csv'), sep=',', index=False)
+
+    print('bootstrap intervals saved!')
+
+if __name__ == "__main__":
+
+    import json
+
+    args = _get_args()
+
+    file = open(args.json)
+
+    params = json.load(file)
+
+    _main(params)
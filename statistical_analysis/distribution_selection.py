@@ -0,0 +1,148 @@
+'''
+Distribution selection
+
+Scores candidate distribution families against a sample as fitter.Fitter does (density histogram with
+100 bins, SSE between the histogram and the fitted pdf at the bin centers, log-likelihood, AIC, BIC and
+Kolmogorov-Smirnov test), but with one histogram and one sorted copy of the sample shared by every family,
+and the scores computed in array form.
+'''
+
+import os
+import re
+import numpy as np
+import pandas as pd
+import scipy.stats
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy.stats import kstwo, kstwobign
+
+def shared_histogram(data, bins=100):
+
+    """
+    Density histogram of a sample (bin centers and densities), as fitter.Fitter builds it
+    """
+
+    density, edges = np.histogram(data, bins=bins, density=True)
+
+    return (edges[:-1] + edges[1:]) / 2, density
+
+def _ks_test(sorted_data, cdf):
+
+    """
+    Two-sided one-sample KS statistic and p-value from the sorted sample and its fitted cdf
+    (exact distribution up to 10000 samples, asymptotic above, as scipy.stats.kstest)
+    """
+
+    n = sorted_data.size
+
+    d_plus = np.max(np.arange(1, n + 1) / n - cdf)
+    d_minus = np.max(cdf - np.arange(n) / n)
+    statistic = max(d_plus, d_minus)
+
+    p_value = kstwo.sf(statistic, n) if n <= 10000 else kstwobign.sf(statistic * np.sqrt(n))
+
+    return statistic, float(np.clip(p_value, 0, 1))
+
+def score_distributions(data, distributions=('norm', 'lognorm'), bins=100):
+
+    """
+    Fits and scores candidate families on one sample
+
+    Args:
+    data (array) = 1-D sample (NaN are dropped)
+    distributions (list) = scipy.stats family names. Default = ('norm', 'lognorm')
+    bins (int) = histogram bins of the SSE score. Default = 100
+
+    Returns:
+        DataFrame (dist, sumsquare_error, aic, bic, loglik, ks_statistic, ks_pvalue, params), sorted by sumsquare_error
+    """
+
+    data = np.asarray(data, dtype=np.float64)
+    data = data[~np.isnan(data)]
+
+    n = data.size
+    centers, density = shared_histogram(data, bins)
+    sorted_data = np.sort(data)
+
+    rows = []
+
+    for name in distributions:
+
+        dist = getattr(scipy.stats, name)
+        params = dist.fit(data)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+
+            sse = float(np.sum(np.square(dist.pdf(centers, *params) - density)))
+            loglik = float(np.sum(dist.logpdf(sorted_data, *params)))
+
+        k = len(params)
+
+        ks_statistic, ks_pvalue = _ks_test(sorted_data, dist.cdf(sorted_data, *params))
+
+        names = (dist.shapes.split(', ') if dist.shapes else []) + ['loc', 'scale']
+
+        rows.append({'dist': name, 'sumsquare_error': sse, 'aic': 2 * k - 2 * loglik, 'bic': k * np.log(n) - 2 * loglik,
+                     'loglik': loglik, 'ks_statistic': ks_statistic, 'ks_pvalue': ks_pvalue,
+                     'params': dict(zip(names, (float(p) for p in params)))})
+
+    return pd.DataFrame(rows).sort_values('sumsquare_error', kind='stable').reset_index(drop=True)
+
+def _score_file(task):
+
+    class_name, date, path, index_list, distributions, bins = task
+
+    # Only the index columns of this class file are read
+    samples = pd.read_csv(path, usecols=index_list)
+
+    tables = []
+
+    for index in index_list:
+
+        table = score_distributions(samples[index].to_numpy(), distributions, bins)
+        table.insert(0, 'rank', np.arange(1, len(table) + 1))
+        table.insert(0, 'index', index)
+        table.insert(0, 'date', date)
+        table.insert(0, 'class', class_name)
+
+        tables.append(table)
+
+    return pd.concat(tables, ignore_index=True)
+
+def distribution_selection_run(class_paths, index_list, distributions=('norm', 'lognorm'), bins=100, date_pattern=r'(\d{8})', workers=4):
+
+    """
+    Scores the candidate families of every (class, index, date) sample in a process pool
+
+    Args:
+    class_paths (dict) = {class name: folder of the per-date sample csv files}
+    index_list (list) = index columns to test (ex. ['DpRVI', 'DPSVI'])
+    distributions, bins = see score_distributions
+    date_pattern (string) = regex that extracts the date from the file names. Default = 8 digits
+    workers (int) = processes. Default = 4
+
+    Returns:
+        one goodness-of-fit DataFrame (class, date, index, rank, dist, scores..., params)
+    """
+
+    tasks = []
+
+    for class_name, path in class_paths.items():
+        for file in sorted(os.listdir(path)):
+
+            found = re.search(date_pattern, file)
+
+            if file.endswith('.csv') and found:
+                tasks.append((class_name, found.group(1), os.path.join(path, file), list(index_list), tuple(distributions), bins))
+
+    tables = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        for future in as_completed([executor.submit(_score_file, task) for task in tasks]):
+
+            table = future.result()
+            tables.append(table)
+
+            print(f"{table['class'].iloc[0]} {table['date'].iloc[0]} fit tests done!")
+
+    return pd.concat(tables, ignore_index=True).sort_values(['class', 'index', 'date', 'rank'], kind='stable').reset_index(drop=True)
@@ -0,0 +1,182 @@
+import argparse
+import itertools
+import os
+import re
+import sys
+import pandas as pd
+
+from skl_tests import lognorm_params, rejection_rates
+
+# Gaussian JM (jm_analysis/jm_engine.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'jm_analysis'))
+from jm_engine import build_moments_cache, summary_moments_cache, jm_table
+
+# Overlap coefficients (ovl_analysis/ovl_engine.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ovl_analysis'))
+from ovl_engine import build_histogram_cache, summary_histogram_cache, ovl_table
+
+def _get_args():
+
+    '''
+    Input parameters parser
+    '''
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-j', '--json',
+    help='The input json file cotaining the separability settings',
+    type=str)
+
+    args = parser.parse_args()
+
+    return args
+
+def class_params(param_path, param_indices, date_pattern=r'(\d{8})'):
+
+    """
+    Lognormal (shape, scale) arrays (indices x patches) of every date of one class
+
+    Returns:
+        dict {date: (shape, scale)}
+    """
+
+    return {re.search(date_pattern, file).group(1): lognorm_params(pd.read_csv(os.path.join(param_path, file)), param_indices)
+            for file in sorted(os.listdir(param_path)) if file.endswith('.csv') and re.search(date_pattern, file)}
+
+def rate_table(param_paths, pairs, param_indices, index_list, alpha=0.05, m=400, n=400, date_pattern=r'(\d{8})'):
+
+    """
+    Symmetric KL rejection rates of class pairs (intra-class when both names are the same)
+
+    The parameters of each class are read once and shared by all its pairs.
+
+    Args:
+    param_paths (dict) = {class name: folder of the per-date lognormal parameter csv files}
+    pairs (list) = class pairs
+    param_indices (list) = index names of the parameter columns (ex. ['dprvi', 'prvi'])
+    index_list (list) = index names written to the table, in the same order
+    alpha, m, n = see skl_tests.rejection_rate
+    date_pattern (string) = regex that extracts the date from the file names. Default = 8 digits
+
+    Returns:
+        tidy DataFrame (date, pair, index, metric, value)
+    """
+
+    params = {class_name: class_params(param_paths[class_name], param_indices, date_pattern) for class_name in set(itertools.chain(*pairs))}
+
+    tables = []
+
+    for p, q in pairs:
+
+        dates = sorted(set(params[p]) & set(params[q]))
+
+        # (dates, indices) - the dates with the same number of patches are computed in one batch
+        rates = rejection_rates([params[p][date] for date in dates], None if p == q else [params[q][date] for date in dates], alpha, m, n)
+
+        table = pd.DataFrame(rates, columns=index_list)
+        table.insert(0, 'date', dates)
+
+        table = table.melt(id_vars='date', var_name='index', value_name='value')
+        table.insert(1, 'pair', f'{p}_{q}')
+        table.insert(3, 'metric', 'rejection_rate')
+
+        tables.append(table)
+
+        print(f'{p}_{q} rejection rates done!')
+
+    return pd.concat(tables, ignore_index=True)
+
+def separability_table(settings):
+
+    """
+    JM, Bhattacharyya, OVL and symmetric KL rejection rates of every class pair, index and date
+
+    Each class is reduced once (moment and histogram caches, or the sampling summaries when summary_path
+    is given) and every metric is computed for all the pairs and dates from the caches.
+
+    Args:
+    settings (dict) = classes, indices, cache_path, and class_paths (sample csv folders) or summary_path,
+                      optional jm_subsets, bins (500), kde_bins (0 = no KDE OVL; with summary_path the KDE
+                      uses the summary bins), rule ('silverman'),
+                      param_paths + param_indices (rejection rates), intra_rates (false), alpha, m, n
+
+    Returns:
+        tidy DataFrame (date, pair, index, metric, value)
+    """
+
+    index_list = settings['indices']
+    classes = settings['classes']
+    pairs = list(itertools.combinations(classes, 2))
+
+    os.makedirs(settings['cache_path'], exist_ok=True)
+
+    subsets = [[index] for index in index_list] + settings.get('jm_subsets', [])
+
+    tables = []
+
+    if settings.get('summary_path'):
+
+        moments = summary_moments_cache(settings['summary_path'], classes, index_list, subsets)
+        histograms = {'ovl': summary_histogram_cache(settings['summary_path'], classes, index_list)}
+
+        if settings.get('kde_bins', 0):
+
+            # The summary histograms (fixed at sampling) are the KDE binning grid
+            histograms['ovl_kde'] = histograms['ovl']
+
+            bins = histograms['ovl']['counts'].shape[-1]
+
+            if bins != settings['kde_bins']:
+                print(f"KDE OVL on the {bins} summary histogram bins (kde_bins = {settings['kde_bins']} applies to sample csv files only)!")
+
+    else:
+
+        class_paths = {class_name: settings['class_paths'][class_name] for class_name in classes}
+
+        moments = build_moments_cache(class_paths, index_list, os.path.join(settings['cache_path'], 'moments.npz'), subsets)
+
+        histograms = {'ovl': build_histogram_cache(class_paths, index_list, os.path.join(settings['cache_path'], f'histograms_{settings.get("bins", 500)}_bins.npz'), bins=settings.get('bins', 500))}
+
+        if settings.get('kde_bins', 0):
+            histograms['ovl_kde'] = build_histogram_cache(class_paths, index_list, os.path.join(settings['cache_path'], f'histograms_{settings["kde_bins"]}_bins.npz'), bins=settings['kde_bins'])
+
+    jm = jm_table(moments, subsets, pairs).rename(columns={'indices': 'index'})
+    tables.append(jm.melt(id_vars=['date', 'pair', 'index'], value_vars=['jm', 'bhattacharyya'], var_name='metric', value_name='value'))
+
+    print('JM distances done!')
+
+    for metric, cache in histograms.items():
+
+        ovl = ovl_table(cache, pairs, method='histogram' if metric == 'ovl' else 'kde', rule=settings.get('rule', 'silverman'))
+        tables.append(ovl.rename(columns={'ovl': 'value'}).assign(metric=metric)[['date', 'pair', 'index', 'metric', 'value']])
+
+        print(f'{metric} coefficients done!')
+
+    if settings.get('param_paths'):
+
+        rate_pairs = pairs + ([(class_name, class_name) for class_name in classes] if settings.get('intra_rates', False) else [])
+
+        tables.append(rate_table(settings['param_paths'], rate_pairs, settings['param_indices'], index_list,
+                                 settings.get('alpha', 0.05), settings.get('m', 400), settings.get('n', 400)))
+
+    return pd.concat(tables, ignore_index=True).sort_values(['metric', 'pair', 'index', 'date'], kind='stable').reset_index(drop=True)
+
+def _main(settings):
+
+    table = separability_table(settings)
+
+    table.to_csv(settings['output_path'], sep=',', index=False)
+
+    print(f"{settings['output_path']} saved!")
+
+if __name__ == "__main__":
+
+    import json
+
+    args = _get_args()
+
+    file = open(args.json)
+
+    params = json.load(file)
+
+    _main(params)
@@ -0,0 +1,140 @@
+'''
+Symmetric Kullback-Leibler tests between lognormal patches
+
+For two lognormal distributions with mu = log(scale) and var = shape^2, the symmetrized KL distance is
+
+    dskl = (var_p (mu_p - mu_q)^2 + var_q (mu_q - mu_p)^2 + (var_p - var_q)^2) / (4 var_p var_q)
+
+and s = 2mn / (m + n) * dskl is tested against a chi-square with 2 degrees of freedom. All the patch pairs
+are computed at once by broadcasting, with any leading batch dimensions (ex. indices, dates).
+'''
+
+import numpy as np
+from scipy.stats import chi2
+
+def skl_statistic(shape_p, scale_p, shape_q, scale_q, m=400, n=400):
+
+    """
+    Symmetric KL test statistic of every (p, q) patch pair
+
+    Args:
+    shape_p, scale_p (arrays) = lognormal parameters of the first patch set (..., P)
+    shape_q, scale_q (arrays) = lognormal parameters of the second patch set (..., Q)
+    m, n (int) = sample sizes of the patches. Default = 400
+
+    Returns:
+        statistic matrix (..., P, Q)
+    """
+
+    mu_p, mu_q = np.log(np.asarray(scale_p, dtype=np.float64))[..., :, None], np.log(np.asarray(scale_q, dtype=np.float64))[..., None, :]
+    var_p, var_q = np.square(np.asarray(shape_p, dtype=np.float64))[..., :, None], np.square(np.asarray(shape_q, dtype=np.float64))[..., None, :]
+
+    dskl = ((var_p + var_q) * np.square(mu_p - mu_q) + np.square(var_p - var_q)) / (4 * var_p * var_q)
+
+    return (2 * m * n) / (m + n) * dskl
+
+def skl_test(shape_p, scale_p, shape_q, scale_q, m=400, n=400):
+
+    """
+    Symmetric KL statistic and chi-square (df = 2) p-value matrices of every (p, q) patch pair
+
+    Returns:
+        statistic, p_value (arrays, ..., P, Q)
+    """
+
+    statistic = skl_statistic(shape_p, scale_p, shape_q, scale_q, m, n)
+
+    return statistic, chi2.sf(statistic, df=2)
+
+def rejection_rate(shape_p, scale_p, shape_q=None, scale_q=None, alpha=0.05, m=400, n=400, block=1024):
+
+    """
+    Rate of rejected pairs (p-value <= alpha) outside the diagonal (i = j pairs are excluded)
+
+    Intra-class when shape_q/scale_q are not given (the patch set against itself). The pair matrix is
+    computed in blocks of rows, so thousands of patches fit in memory. Pairs with a NaN statistic (patches
+    without parameters for an index) are left out of both counts.
+
+    Args:
+    shape_p, scale_p (arrays) = lognormal parameters of the first patch set (..., P)
+    shape_q, scale_q (arrays) = lognormal parameters of the second patch set (..., Q). Default = None (intra-class)
+    alpha (float) = significance level. Default = 0.05
+    m, n (int) = sample sizes of the patches. Default = 400
+    block (int) = rows of the pair matrix computed at once. Default = 1024
+
+    Returns:
+        rejection rate (array with the leading batch dimensions)
+    """
+
+    if shape_q is None:
+        shape_q, scale_q = shape_p, scale_p
+
+    shape_p, scale_p = np.asarray(shape_p), np.asarray(scale_p)
+    shape_q, scale_q = np.asarray(shape_q), np.asarray(scale_q)
+
+    # p-value <= alpha  <=>  statistic >= chi-square critical value
+    critical = chi2.isf(alpha, df=2)
+
+    P, Q = shape_p.shape[-1], shape_q.shape[-1]
+
+    rejected = np.zeros(np.broadcast_shapes(shape_p.shape[:-1], shape_q.shape[:-1]))
+    pairs = np.zeros_like(rejected)
+
+    for start in range(0, P, block):
+
+        stop = min(start + block, P)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            statistic = skl_statistic(shape_p[..., start:stop], scale_p[..., start:stop], shape_q, scale_q, m, n)
+
+        off_diagonal = np.arange(start, stop)[:, None] != np.arange(Q)[None, :]
+
+        rejected += np.sum((statistic >= critical) & off_diagonal, axis=(-2, -1))
+        pairs += np.sum(~np.isnan(statistic) & off_diagonal, axis=(-2, -1))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return rejected / pairs
+
+def lognorm_params(df, index_list):
+
+    """
+    Shape and scale arrays (indices x patches) of a lognormal parameter table (<index>_shape, <index>_scale columns)
+    """
+
+    shape = np.stack([df[f'{index}_shape'].to_numpy(dtype=np.float64) for index in index_list])
+    scale = np.stack([df[f'{index}_scale'].to_numpy(dtype=np.float64) for index in index_list])
+
+    return shape, scale
+
+def rejection_rates(params_p, params_q=None, alpha=0.05, m=400, n=400):
+
+    """
+    Rejection rates of many dates at once - the dates with the same number of patches are stacked in one batch
+
+    Args:
+    params_p (list) = (shape, scale) arrays (indices x patches) of the first class, one per date
+    params_q (list) = same for the second class. Default = None (intra-class)
+    alpha, m, n = see rejection_rate
+
+    Returns:
+        array (dates, indices)
+    """
+
+    params_q = params_p if params_q is None else params_q
+
+    rates = [None] * len(params_p)
+
+    groups = {}
+
+    for k, ((shape_p, _), (shape_q, _)) in enumerate(zip(params_p, params_q)):
+        groups.setdefault((shape_p.shape, shape_q.shape), []).append(k)
+
+    for members in groups.values():
+
+        shape_p, scale_p = (np.stack([params_p[k][i] for k in members]) for i in (0, 1))
+        shape_q, scale_q = (np.stack([params_q[k][i] for k in members]) for i in (0, 1))
+
+        for k, rate in zip(members, rejection_rate(shape_p, scale_p, shape_q, scale_q, alpha, m, n)):
+            rates[k] = rate
+
+    return np.array(rates)
@@ -4,11 +4,21 @@ import rasterio as rst
 from rasterio.mask import mask
 
 import geopandas as gpd
+import pandas as pd
 
 import os
+import sys
 import time
 from functools import wraps
 
+from roi_pixels import roi_flat_index, gather, scatter
+from index_registry import compile_indices
+from datacube import append_to_cube
+
+# Scene statistics sidecars (SAR/scene_stats.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SAR'))
+from scene_stats import load_scene_stats
+
 def _get_args():
 
     '''
@@ -55,67 +65,6 @@ def conv2d(matrix, window):
 
     return filtered
 
-# GRD indices
-@timing
-def rvi_grd_index(vv, vh):
-
-    """
-    RVI - Radar Vegetation Index (Dual Polarization)
-
-    Args:
-    VV (array) = Vertical-Vertical polarization
-    VH (array) = Vertical-Horizontal polarization
-    
-    Returns:
-        RVI (array) 
-    """
-
-    rvi = (4 * vh) / (vv + vh)
-
-    return rvi.astype(np.float32)
-
-@timing
-def dpsvi_index(vv, vh):
-
-    """
-    DPSVI - Dual Polarization SAR Vegetation Index
-
-    Bibliographic reference here
-
-    Args:
-    VV (array) = Vertical-Vertical polarization
-    VH (array) = Vertical-Horizontal polarization
-    
-    Returns:
-        DPSVI (array)
-    """
-
-    
-    # np.nanmax(vv) # Maybe use a solver to determine this number
-
-    dpsvi = vh * (5 * vh - vv * vh + np.power(vh, 2) + 5  * vv - np.power(vv, 2) + vh * vv) / (1.4142 * vv)
-
-    return dpsvi.astype(np.float32)
-
-@timing
-def dpsvim_index(vv, vh):
-
-    """
-    DPSVIm - Modified Dual-Pol SAR Vegetation Index
-
-    Args:
-
-    VV (array) = Vertical-Vertical polarization \n
-    VH (array) = Vertical-Horizontal polarization
-    
-    Returns:
-        DPSVIm (array)
-    """
-    
-    dpsvim = (np.power(vv, 2) + (vv * vh)) / (1.4142)
-
-    return dpsvim.astype(np.float32)
-
 # SLC indices    
 @timing
 def dprvi_index(c11, c12_real, c12_imag, c22, window_size):
@@ -223,6 +172,8 @@ def _main(settings):
 
     geometries = [geom for geom in roi.geometry]
 
+    grd_evaluator = compile_indices(settings.get('grd_indices', ['DPSVI', 'DPSVIm', 'RVI']), settings.get('index_backend'))
+
     for i, _ in enumerate(os.listdir(settings['slc_image'])):
 
         indices_list = []
@@ -260,39 +211,70 @@ def _main(settings):
                 vh = grd_image[0]
                 vv = grd_image[1]
     
-        # DpRVI
-        dprvi = dprvi_index(c11, c12_real, c12_imag, c22, window_size=5)
-        indices_list.append(dprvi)
+        if settings.get('roi_only', False):
+
+            # Compact ROI vectors - the GRD indices are computed only over the in-ROI pixels
+            flat_index = roi_flat_index(geometries, c11.shape, slc_transform, settings.get('roi_index_cache'))
+
+            vv = gather(vv, flat_index)
+            vh = gather(vh, flat_index)
+
+            # DpRVI and PRVI depend on the moving window, so they are computed on the grid and then gathered
+            dprvi = gather(dprvi_index(c11, c12_real, c12_imag, c22, window_size=5), flat_index)
+            indices_list.append(dprvi)
+
+            prvi = gather(prvi_index(c11, c12_real, c12_imag, c22, window_size=5), flat_index)
+            indices_list.append(prvi)
+
+        else:
+
+            # DpRVI
+            dprvi = dprvi_index(c11, c12_real, c12_imag, c22, window_size=5)
+            indices_list.append(dprvi)
 
-        # PRVI
-        prvi = prvi_index(c11, c12_real, c12_imag, c22, window_size=5)
-        indices_list.append(prvi)
+            # PRVI
+            prvi = prvi_index(c11, c12_real, c12_imag, c22, window_size=5)
+            indices_list.append(prvi)
             
-        # DPSVI
-        dpsvi = dpsvi_index(vv, vh)
-        indices_list.append(dpsvi)
+        # GRD indices (DPSVI, DPSVIm, RVI) in a single fused pass
+        # VV max: fixed value or 'scene' to read it from the GRD statistics sidecar (computed if missing)
+        vv_max = settings.get('vv_max', 5)
 
-        # DPSVIm
-        dpsvim = dpsvim_index(vv, vh)
-        indices_list.append(dpsvim)
+        if vv_max == 'scene':
+            vv_max = load_scene_stats(grd_file)['VV']['max']
 
-        # RVI_GRD
-        rvi_grd = rvi_grd_index(vv, vh)
-        indices_list.append(rvi_grd)
+        grd_results = grd_evaluator(vv=vv, vh=vh, vv_max=vv_max)
+        indices_list.extend(grd_results.values())
+
+        if settings.get('roi_only', False):
+
+            if settings.get('samples_outpath'):
+
+                df_samples = pd.DataFrame({'pixel': flat_index, 'DpRVI': dprvi, 'PRVI': prvi, **grd_results})
+                df_samples.to_parquet(settings['samples_outpath'] + '/' + date + '_samples.parquet', index=False)
+
+            indices_list = [scatter(indice, flat_index, c11.shape) for indice in indices_list]
     
         out_meta = slc.meta
 
         out_meta.update({
                         "driver": "GTiff",
-                        "height": dpsvi.shape[0],
-                        "width": dpsvi.shape[1],
+                        "height": indices_list[0].shape[0],
+                        "width": indices_list[0].shape[1],
                         "transform": slc_transform,
                         "count": len(indices_list)
                         })
 
-        with rst.open(settings['indices_outpath'] + '/' + date + '.tif', "w", **out_meta) as dest:
-            for id, indice in enumerate(indices_list, start=1):
-                dest.write(indice, id)
+        # Output mode: per-date GeoTIFF ('gtiff'), time-stacked Zarr cube ('cube') or both
+        output = settings.get('output', 'gtiff')
+
+        if output in ('gtiff', 'both'):
+            with rst.open(settings['indices_outpath'] + '/' + date + '.tif', "w", **out_meta) as dest:
+                for id, indice in enumerate(indices_list, start=1):
+                    dest.write(indice, id)
+
+        if output in ('cube', 'both'):
+            append_to_cube(settings['cube_path'], date, indices_list, ['DpRVI', 'PRVI'] + list(grd_results), out_meta['transform'], slc.crs)
         
         print(f'{date} indices processed!')
 
@@ -0,0 +1,99 @@
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import zarr
+from xarray.coding.times import encode_cf_datetime
+
+# Default cube chunking (time, band, y, x): a few dates per chunk keeps time-series reads cheap
+# while 256 x 256 tiles keep single-date spatial reads small
+CHUNKS = (16, 1, 256, 256)
+
+def _grid_coords(transform, height, width):
+
+    """
+    Pixel-center coordinates of a north-up raster grid
+    """
+
+    x = transform.c + transform.a * (np.arange(width) + 0.5)
+    y = transform.f + transform.e * (np.arange(height) + 0.5)
+
+    return y, x
+
+def append_to_cube(cube_path, date, indices, band_names, transform, crs, chunks=CHUNKS):
+
+    """
+    Appends one processed date to a chunked, compressed (time, band, y, x) Zarr datacube
+
+    The cube is created on the first call. Later calls add the date along time, after checking that
+    the grid and the band names match, keeping the time axis sorted: a date older than the last stored
+    one is appended and moved into place by shifting the later dates one slot (one date in memory at a
+    time). Dates already stored are skipped.
+
+    Args:
+    cube_path (string) = path to the .zarr store
+    date (string) = image date (YYYYMMDD)
+    indices (list) = 2-D index arrays, one per band
+    band_names (list) = names of the bands (ex. ['DpRVI', 'PRVI', ...])
+    transform (Affine) = affine transform of the index rasters
+    crs (CRS) = coordinate reference system of the index rasters
+    chunks (tuple) = (time, band, y, x) chunk sizes. Default = CHUNKS
+
+    Returns:
+        True if the date was appended, False if it was already in the cube
+    """
+
+    time = pd.to_datetime(date.split('T')[0], format='%Y%m%d')
+
+    data = np.stack(indices).astype(np.float32)[np.newaxis]
+
+    y, x = _grid_coords(transform, data.shape[2], data.shape[3])
+
+    cube = xr.Dataset(
+        {'indices': (('time', 'band', 'y', 'x'), data)},
+        coords={'time': [time], 'band': list(band_names), 'y': y, 'x': x},
+        attrs={'crs': str(crs), 'transform': [transform.a, transform.b, transform.c, transform.d, transform.e, transform.f]}
+    )
+
+    if not os.path.exists(cube_path):
+
+        encoding = {'indices': {'chunks': (chunks[0],) + tuple(min(c, n) for c, n in zip(chunks[1:], data.shape[1:]))}}
+
+        cube.to_zarr(cube_path, mode='w', encoding=encoding)
+
+        return True
+
+    with xr.open_zarr(cube_path) as stored:
+
+        assert list(stored['band'].values) == list(band_names), f'Band names do not match the cube! {list(band_names)}'
+        assert stored.sizes['y'] == len(y) and stored.sizes['x'] == len(x), 'Raster grid does not match the cube!'
+        assert np.allclose(stored['x'].values, x) and np.allclose(stored['y'].values, y), 'Raster grid does not match the cube!'
+
+        times = pd.DatetimeIndex(stored['time'].values)
+
+        if time in times:
+            return False
+
+    cube.to_zarr(cube_path, append_dim='time')
+
+    position = int(times.searchsorted(time))
+
+    # Out of order date: shift the later dates one slot and write the new one in its place
+    for k in range(len(times), position, -1):
+
+        with xr.open_zarr(cube_path) as stored:
+            moved = stored[['indices']].isel(time=[k - 1]).drop_vars(['band', 'y', 'x']).load()
+
+        moved.to_zarr(cube_path, region={'time': slice(k, k + 1)})
+
+    if position < len(times):
+
+        cube[['indices']].drop_vars(['band', 'y', 'x']).to_zarr(cube_path, region={'time': slice(position, position + 1)})
+
+        # Region writes leave the time index as appended, so its encoded values are rewritten in order
+        group = zarr.open_group(cube_path, mode='r+')
+        attrs = group['time'].attrs
+
+        group['time'][:] = encode_cf_datetime(times.insert(position, time), attrs['units'], attrs.get('calendar'), group['time'].dtype)[0]
+
+    return True
@@ -6,9 +6,14 @@ from rasterio.mask import mask
 import geopandas as gpd
 
 import os
+import sys
 import time
 from functools import wraps
 
+# Shared datacube writer (veg_indices/datacube.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from datacube import append_to_cube
+
 def _get_args():
 
     '''
@@ -165,9 +170,16 @@ def _main(settings):
                         "count": len(indices_list)
                         })
 
-        with rst.open(settings['indices_outpath'] + '/' + 'dprvi_parameters_' + date + '.tif', "w", **out_meta) as dest:
-            for id, indice in enumerate(indices_list, start=1):
-                dest.write(indice, id)
+        # Output mode: per-date GeoTIFF ('gtiff'), time-stacked Zarr cube ('cube') or both
+        output = settings.get('output', 'gtiff')
+
+        if output in ('gtiff', 'both'):
+            with rst.open(settings['indices_outpath'] + '/' + 'dprvi_parameters_' + date + '.tif', "w", **out_meta) as dest:
+                for id, indice in enumerate(indices_list, start=1):
+                    dest.write(indice, id)
+
+        if output in ('cube', 'both'):
+            append_to_cube(settings['cube_path'], date, indices_list, ['DpRVI', 'DOP', 'Lambda1', 'Lambda2', 'Beta'], out_meta['transform'], slc.crs)
         
         print(f'{date} indices processed!')
 
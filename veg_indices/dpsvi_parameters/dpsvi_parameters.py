@@ -6,10 +6,20 @@ from rasterio.mask import mask
 import geopandas as gpd
 
 import os
+import sys
 
 import time
 from functools import wraps
 
+# Shared index registry and datacube writer (veg_indices/)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from index_registry import compile_indices
+from datacube import append_to_cube
+
+# Scene statistics sidecars (SAR/scene_stats.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'SAR'))
+from scene_stats import load_scene_stats
+
 def _get_args():
 
     '''
@@ -36,48 +46,6 @@ def timing(func): # Processing time decorator
         return result
     return processing_time
 
-@timing
-def idpdd_index(vv, vh):
-
-    idpdd = ((5 - vv) + vh) / 1.4142
-
-    return idpdd.astype(np.float32)
-
-@timing
-def vddpi_index(vv, vh):
-
-    vddpi = (vv + vh) / vv
-
-    return vddpi.astype(np.float32)
-
-
-@timing
-def dpsvi_index(vv, vh):
-
-    """
-    DPSVI - Dual Polarization SAR Vegetation Index
-
-    Bibliographic reference here
-
-    Args:
-    VV (array) = Vertical-Vertical polarization
-    VH (array) = Vertical-Horizontal polarization
-    
-    Returns:
-        DPSVI (array)
-    """
-
-    idpdd = ((5 - vv) + vh) / 1.4142
-
-    vddpi = (vv + vh) / vv
-    
-    # np.nanmax(vv) # Maybe use a solver to determine this number
-
-    dpsvi = idpdd * vddpi * vh
-
-    return dpsvi.astype(np.float32)
-
-
 @timing
 def _main(settings):
 
@@ -85,6 +53,8 @@ def _main(settings):
 
     geometries = [geom for geom in roi.geometry]
 
+    evaluator = compile_indices(settings.get('indices', ['IDPDD', 'VDDPI', 'DPSVI']), settings.get('index_backend'))
+
     for i, _ in enumerate(os.listdir(settings['grd_image'])):
 
         indices_list = []
@@ -106,31 +76,36 @@ def _main(settings):
                 vv = grd_image[1]
                 
 
-        # IDPDD
-        idpdd = idpdd_index(vv, vh)
-        indices_list.append(idpdd)
-        
-        # VDDPI
-        vddpi = vddpi_index(vv, vh)
-        indices_list.append(vddpi)
+        # VV max: fixed value or 'scene' to read it from the GRD statistics sidecar (computed if missing)
+        vv_max = settings.get('vv_max', 5)
 
-        # DPSVI
-        dpsvi = dpsvi_index(vv, vh)
-        indices_list.append(dpsvi)
+        if vv_max == 'scene':
+            vv_max = load_scene_stats(grd_file)['VV']['max']
+
+        # IDPDD, VDDPI and DPSVI in a single fused pass
+        results = evaluator(vv=vv, vh=vh, vv_max=vv_max)
+        indices_list.extend(results.values())
 
         out_meta = grd.meta
 
         out_meta.update({
                         "driver": "GTiff",
-                        "height": dpsvi.shape[0],
-                        "width": dpsvi.shape[1],
+                        "height": indices_list[0].shape[0],
+                        "width": indices_list[0].shape[1],
                         "transform": grd_transform,
                         "count": len(indices_list)
                         })
 
-        with rst.open(settings['indices_outpath'] + '/' + 'dpsvi_parameters_' + date + '.tif', "w", **out_meta) as dest:
-            for id, indice in enumerate(indices_list, start=1):
-                dest.write(indice, id)
+        # Output mode: per-date GeoTIFF ('gtiff'), time-stacked Zarr cube ('cube') or both
+        output = settings.get('output', 'gtiff')
+
+        if output in ('gtiff', 'both'):
+            with rst.open(settings['indices_outpath'] + '/' + 'dpsvi_parameters_' + date + '.tif', "w", **out_meta) as dest:
+                for id, indice in enumerate(indices_list, start=1):
+                    dest.write(indice, id)
+
+        if output in ('cube', 'both'):
+            append_to_cube(settings['cube_path'], date, indices_list, list(results), out_meta['transform'], grd.crs)
 
 if __name__ == "__main__":
 
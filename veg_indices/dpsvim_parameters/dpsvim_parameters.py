@@ -6,10 +6,16 @@ from rasterio.mask import mask
 import geopandas as gpd
 
 import os
+import sys
 
 import time
 from functools import wraps
 
+# Shared index registry and datacube writer (veg_indices/)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from index_registry import compile_indices
+from datacube import append_to_cube
+
 def _get_args():
 
     '''
@@ -36,41 +42,6 @@ def timing(func): # Processing time decorator
         return result
     return processing_time
 
-@timing
-def dpdd_index(vv, vh):
-
-    dpdd = (vv + vh) / 1.4142
-
-    return dpdd.astype(np.float32)
-
-@timing
-def cr_index(vv, vh):
-
-    cr = vv / vh
-
-    return cr.astype(np.float32)
-
-
-@timing
-def dpsvim_index(vv, vh):
-
-    """
-    DPSVIm - Modified Dual-Pol SAR Vegetation Index
-
-    Args:
-
-    VV (array) = Vertical-Vertical polarization \n
-    VH (array) = Vertical-Horizontal polarization
-    
-    Returns:
-        DPSVIm (array)
-    """
-    
-    dpsvim = (np.power(vv, 2) + (vv * vh)) / (1.4142)
-
-    return dpsvim.astype(np.float32)
-
-
 @timing
 def _main(settings):
 
@@ -78,6 +49,8 @@ def _main(settings):
 
     geometries = [geom for geom in roi.geometry]
 
+    evaluator = compile_indices(settings.get('indices', ['DPDD', 'CR', 'DPSVIm']), settings.get('index_backend'))
+
     for i, _ in enumerate(os.listdir(settings['grd_image'])):
 
         indices_list = []
@@ -99,32 +72,30 @@ def _main(settings):
                 vv = grd_image[1]
                
 
-        # DPDD
-        dpdd = dpdd_index(vv, vh)
-        indices_list.append(dpdd)
-        
-        # CR
-        cr = cr_index(vv, vh)
-        indices_list.append(cr)
-
-        # DPSVIm
-        dpsvim = dpsvim_index(vv, vh)
-        indices_list.append(dpsvim)
-
+        # DPDD, CR and DPSVIm in a single fused pass
+        results = evaluator(vv=vv, vh=vh, vv_max=settings.get('vv_max', 5))
+        indices_list.extend(results.values())
 
         out_meta = grd.meta
 
         out_meta.update({
                         "driver": "GTiff",
-                        "height": dpdd.shape[0],
-                        "width": dpdd.shape[1],
+                        "height": indices_list[0].shape[0],
+                        "width": indices_list[0].shape[1],
                         "transform": grd_transform,
                         "count": len(indices_list)
                         })
 
-        with rst.open(settings['indices_outpath'] + '/' + 'dpsvim_parameters_' + date + '.tif', "w", **out_meta) as dest:
-            for id, indice in enumerate(indices_list, start=1):
-                dest.write(indice, id)
+        # Output mode: per-date GeoTIFF ('gtiff'), time-stacked Zarr cube ('cube') or both
+        output = settings.get('output', 'gtiff')
+
+        if output in ('gtiff', 'both'):
+            with rst.open(settings['indices_outpath'] + '/' + 'dpsvim_parameters_' + date + '.tif', "w", **out_meta) as dest:
+                for id, indice in enumerate(indices_list, start=1):
+                    dest.write(indice, id)
+
+        if output in ('cube', 'both'):
+            append_to_cube(settings['cube_path'], date, indices_list, list(results), out_meta['transform'], grd.crs)
 
 if __name__ == "__main__":
 
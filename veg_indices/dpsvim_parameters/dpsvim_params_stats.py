@@ -2,59 +2,30 @@ import numpy as np
 import geopandas as gpd
 import pandas as pd
 import os
+import sys
 
-from rasterstats import zonal_stats
+# Zonal statistics engine (sampling/zonal_engine.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'sampling'))
+from zonal_engine import zonal_statistics_run, write_class_tables
 
 form_florestal = gpd.read_file('D:/thesis_data/ROI/classes/form_florestal_30m_32723_buffer.GEOJSON')
 form_savanica = gpd.read_file('D:/thesis_data/ROI/classes/form_savanica_30m_32723_buffer.GEOJSON')
 form_campestre = gpd.read_file('D:/thesis_data/ROI/classes/form_campestre_30m_32723_buffer.GEOJSON')
 
+class_geometries = {'florestal': [geom for geom in form_florestal.geometry],
+                    'savanica': [geom for geom in form_savanica.geometry],
+                    'campestre': [geom for geom in form_campestre.geometry]}
+
 images_path = 'D:/thesis_data/VEG_INDICES/dpsvim_parameters/raster/'
-image_list = os.listdir(images_path)
 
 indices_list = ['DPDD', 'CR', 'DPSVIm']
 
-id = 3
-
-indice = 'DPSVIm'
-
-df_florestal_stats = pd.DataFrame()
-df_savanica_stats = pd.DataFrame()
-df_campestre_stats = pd.DataFrame()
-
-for index, image in enumerate(image_list, start=0):
-
-    date = image_list[index].split('_')[2].split('.')[0]
-
-    florestal = zonal_stats(form_florestal, images_path + image, band=id, nodata=np.nan, stats=['median', 'percentile_25', 'percentile_75', 'std'])
-
-    florestal_stats = pd.DataFrame(florestal)
-    florestal_stats['date'] = pd.to_datetime(int(date), format='%Y%m%d')
-    df_florestal_stats = pd.concat([florestal_stats, df_florestal_stats])
-
-    print(f'{indice} - {date} florestal data collected')
-
-    savanica = zonal_stats(form_savanica, images_path + image, band=id, nodata=np.nan, stats=['median', 'percentile_25', 'percentile_75', 'std'])
-
-    savanica_stats = pd.DataFrame(savanica)
-    savanica_stats['date'] = pd.to_datetime(int(date), format='%Y%m%d')
-    df_savanica_stats = pd.concat([savanica_stats, df_savanica_stats])
-
-    print(f'{indice} - {date} savanica data collected!')
-
-    campestre = zonal_stats(form_campestre, images_path + image, band=id, nodata=np.nan, stats=['median', 'percentile_25', 'percentile_75', 'std'])
-
-    campestre_stats = pd.DataFrame(campestre)
-    campestre_stats['date'] = pd.to_datetime(int(date), format='%Y%m%d')
-    df_campestre_stats = pd.concat([campestre_stats, df_campestre_stats])
-
-    print(f'{indice} - {date} campestre data collected!')
+stats = ['median', 'percentile_25', 'percentile_75', 'std']
 
-df_florestal_stats.to_csv('D:/thesis_data/VEG_INDICES/dpsvim_parameters/stats/' + 'florestal_' + indice + '.csv', sep=',', index=False)
-print(f'{indice} florestal csv file saved!')
+# Every raster is read once and all the dpsvim_parameters bands and class polygons are computed in the same pass
+df_stats = zonal_statistics_run(images_path, indices_list, class_geometries, 'D:/thesis_data/VEG_INDICES/zone_index/classes_30m_buffer/', stats)
 
-df_savanica_stats.to_csv('D:/thesis_data/VEG_INDICES/dpsvim_parameters/stats/' + 'savanica_' + indice + '.csv', sep=',', index=False)
-print(f'{indice} savanica csv file saved!')
+df_stats.to_csv('D:/thesis_data/VEG_INDICES/dpsvim_parameters/stats/' + 'zonal_stats_dpsvim_parameters.csv', sep=',', index=False)
+print('Zonal statistics csv file saved!')
 
-df_campestre_stats.to_csv('D:/thesis_data/VEG_INDICES/dpsvim_parameters/stats/' + 'campestre_' + indice + '.csv', sep=',', index=False)
-print(f'{indice} campestre csv file saved!')
\ No newline at end of file
+write_class_tables(df_stats, 'D:/thesis_data/VEG_INDICES/dpsvim_parameters/stats/', stats)
\ No newline at end of file
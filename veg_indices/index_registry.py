@@ -0,0 +1,152 @@
+import re
+import numpy as np
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# Input bands (arrays) and scalar parameters accepted by the expressions
+BANDS = ('vv', 'vh')
+SCALARS = ('vv_max',)
+
+# Shared subexpressions, evaluated at most once per pass
+SUBEXPRESSIONS = {
+    'q': 'vh / vv',
+    's': 'vv + vh',
+}
+
+# GRD index registry - each index is an expression over the bands, scalars, subexpressions or other indices
+INDICES = {
+    'RVI': '(4 * vh) / s',
+    'DPSVIm': '(vv ** 2 + vv * vh) / 1.4142',
+    'DpRVIc': '(q * (q + 3)) / (q + 1) ** 2',
+    'RVIc': '(4 * q) / (1 + q)',
+    'IDPDD': '((vv_max - vv) + vh) / 1.4142',
+    'VDDPI': 's / vv',
+    'DPSVI': 'IDPDD * VDDPI * vh',
+    'DPDD': 's / 1.4142',
+    'CR': 'vv / vh',
+}
+
+_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+def _dependencies(expr):
+
+    return [name for name in _NAME.findall(expr) if name in SUBEXPRESSIONS or name in INDICES]
+
+def _plan(indices):
+
+    """
+    Orders the subexpressions and indices needed to compute the selected indices (dependencies first)
+    """
+
+    steps = []
+
+    def visit(name):
+
+        if name in steps:
+            return
+
+        expr = INDICES[name] if name in INDICES else SUBEXPRESSIONS[name]
+
+        for dependency in _dependencies(expr):
+            visit(dependency)
+
+        steps.append(name)
+
+    for name in indices:
+
+        assert name in INDICES, f'Unknown index! {name}'
+
+        visit(name)
+
+    return [(name, INDICES[name] if name in INDICES else SUBEXPRESSIONS[name]) for name in steps]
+
+def _numba_kernel(plan, indices):
+
+    """
+    Generates a single-pass Numba kernel that computes every step of the plan per pixel
+    """
+
+    lines = [f'def kernel({", ".join(BANDS + SCALARS)}, out):',
+             '    for i in prange(vv.size):']
+
+    lines += [f'        {band}_i = {band}[i]' for band in BANDS]
+
+    for name, expr in plan:
+
+        expr = _NAME.sub(lambda m: m.group(0) + '_i' if m.group(0) in BANDS else m.group(0), expr)
+
+        lines.append(f'        {name} = {expr}')
+
+    lines += [f'        out[{k}, i] = {name}' for k, name in enumerate(indices)]
+
+    namespace = {'prange': prange}
+    exec('\n'.join(lines), namespace)
+
+    return njit(parallel=True, error_model='numpy')(namespace['kernel'])
+
+def compile_indices(indices, backend=None):
+
+    """
+    Compiles the selected indices into a single fused evaluator
+
+    Backends: 'numba' (generated per-pixel kernel), 'numexpr' and 'numpy'.
+    If none is given, the fastest installed one is used.
+
+    Args:
+    indices (list) = names of the indices to compute (see INDICES)
+    backend (string) = evaluation backend. Default = None
+
+    Returns:
+        evaluator (function) - evaluator(vv=..., vh=..., vv_max=...) returns a dict {index: float32 array}
+    """
+
+    if backend is None:
+        backend = 'numba' if njit is not None else 'numexpr' if ne is not None else 'numpy'
+
+    assert backend in ('numba', 'numexpr', 'numpy'), f'Unknown backend! {backend}'
+    assert backend != 'numba' or njit is not None, 'numba is not installed'
+    assert backend != 'numexpr' or ne is not None, 'numexpr is not installed'
+
+    indices = list(indices)
+    plan = _plan(indices)
+
+    if backend == 'numba':
+
+        kernel = _numba_kernel(plan, indices)
+
+        def evaluator(vv, vh, vv_max=5.0):
+
+            vv = np.asarray(vv, dtype=np.float32)
+            vh = np.asarray(vh, dtype=np.float32)
+
+            out = np.empty((len(indices), vv.size), dtype=np.float32)
+            kernel(vv.ravel(), vh.ravel(), np.float32(vv_max), out)
+
+            return {name: out[k].reshape(vv.shape) for k, name in enumerate(indices)}
+
+        return evaluator
+
+    codes = [(name, expr if backend == 'numexpr' else compile(expr, name, 'eval')) for name, expr in plan]
+
+    def evaluator(vv, vh, vv_max=5.0):
+
+        env = {'vv': np.asarray(vv, dtype=np.float32), 'vh': np.asarray(vh, dtype=np.float32), 'vv_max': np.float32(vv_max)}
+
+        for name, code in codes:
+
+            if backend == 'numexpr':
+                env[name] = ne.evaluate(code, local_dict=env)
+            else:
+                env[name] = eval(code, {'__builtins__': {}}, env)
+
+        return {name: env[name].astype(np.float32, copy=False) for name in indices}
+
+    return evaluator
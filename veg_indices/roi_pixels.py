@@ -0,0 +1,95 @@
+import os
+import numpy as np
+from rasterio.features import geometry_mask
+
+# In-memory cache of ROI flat indices, keyed by grid (shape + affine transform)
+_flat_index_cache = {}
+
+def _grid_key(out_shape, coefs):
+
+    return (tuple(int(n) for n in out_shape), tuple(round(float(c), 6) for c in coefs))
+
+def roi_flat_index(geometries, out_shape, transform, cache_path=None):
+
+    """
+    ROI flat index - positions of the in-ROI pixels of a raster grid
+
+    The index is computed once per grid and cached in memory (and optionally on disk as .npz),
+    so every date cropped to the same grid reuses it.
+
+    Args:
+    geometries (list) = ROI geometries in the raster CRS
+    out_shape (tuple) = (rows, cols) of the cropped raster
+    transform (Affine) = affine transform of the cropped raster
+    cache_path (string) = optional .npz file to persist the index between runs
+
+    Returns:
+        flat index (1-D int64 array) of the pixels inside the ROI
+    """
+
+    key = _grid_key(out_shape, (transform.a, transform.b, transform.c, transform.d, transform.e, transform.f))
+
+    if key in _flat_index_cache:
+        return _flat_index_cache[key]
+
+    if cache_path is not None and os.path.exists(cache_path):
+
+        cached = np.load(cache_path)
+
+        if _grid_key(cached['shape'], cached['transform']) == key:
+            _flat_index_cache[key] = cached['flat_index']
+            return cached['flat_index']
+
+    inside = geometry_mask(geometries, out_shape=key[0], transform=transform, invert=True)
+
+    flat_index = np.flatnonzero(inside)
+
+    if cache_path is not None:
+        np.savez(cache_path, flat_index=flat_index, shape=np.array(key[0]), transform=np.array(key[1]))
+
+    _flat_index_cache[key] = flat_index
+
+    return flat_index
+
+def gather(band, flat_index):
+
+    """
+    Gathers the in-ROI pixels of a band into a compact 1-D float32 vector
+
+    Complex bands (ex. the dprvi eigenvalue ratio) keep their real part.
+
+    Args:
+    band (array) = 2-D raster band
+    flat_index (array) = ROI flat index (see roi_flat_index)
+
+    Returns:
+        compact vector (1-D float32 array)
+    """
+
+    values = band.reshape(-1)[flat_index]
+
+    # Explicit real part: casting a complex array to float32 warns and silently drops the imaginary part
+    if np.iscomplexobj(values):
+        values = values.real
+
+    return values.astype(np.float32, copy=False)
+
+def scatter(values, flat_index, out_shape, fill=np.nan):
+
+    """
+    Scatters a compact vector back into a 2-D raster band
+
+    Args:
+    values (array) = compact 1-D vector
+    flat_index (array) = ROI flat index (see roi_flat_index)
+    out_shape (tuple) = (rows, cols) of the output raster
+    fill (float) = value of the pixels outside the ROI. Default = NaN
+
+    Returns:
+        raster band (2-D float32 array)
+    """
+
+    band = np.full(out_shape, fill, dtype=np.float32)
+    band.reshape(-1)[flat_index] = values
+
+    return band
@@ -6,10 +6,17 @@ from rasterio.mask import mask
 import geopandas as gpd
 
 import os
+import sys
 
 import time
 from functools import wraps
 
+from index_registry import compile_indices
+
+# Scene statistics sidecars (SAR/scene_stats.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SAR'))
+from scene_stats import load_scene_stats
+
 def _get_args():
 
     '''
@@ -130,86 +137,6 @@ def conv2d(matrix, window):
 
     return filtered
 
-# GRD indices
-@timing
-def rvi_grd_index(vv, vh):
-
-    """
-    RVI - Radar Vegetation Index (Dual Polarization)
-
-    Args:
-    VV (array) = Vertical-Vertical polarization
-    VH (array) = Vertical-Horizontal polarization
-    
-    Returns:
-        RVI (array) 
-    """
-
-    rvi = (4 * vh) / (vv + vh)
-
-    return rvi.astype(np.float32)
-
-@timing
-def dpsvi_index(vv, vh):
-
-    """
-    DPSVI - Dual Polarization SAR Vegetation Index
-
-    Bibliographic reference here
-
-    Args:
-    VV (array) = Vertical-Vertical polarization
-    VH (array) = Vertical-Horizontal polarization
-    
-    Returns:
-        DPSVI (array)
-    """
-
-    VV_max = np.nanmax(vv)
-    
-    # np.nanmax(vv) # Maybe use a solver to determine this number
-
-    dpsvi = vh * (VV_max * vh - vv * vh + np.power(vh, 2) + VV_max * vv - np.power(vv, 2) + vh * vv) / (1.4142 * vv)
-
-    return dpsvi.astype(np.float32)
-
-@timing
-def dpsvim_index(vv, vh):
-
-    """
-    DPSVIm - Modified Dual-Pol SAR Vegetation Index
-
-    Args:
-
-    VV (array) = Vertical-Vertical polarization \n
-    VH (array) = Vertical-Horizontal polarization
-    
-    Returns:
-        DPSVIm (array)
-    """
-    
-    dpsvim = (np.power(vv, 2) + (vv * vh)) / (1.4142)
-
-    return dpsvim.astype(np.float32)
-
-@timing
-def dprvic_index(vh, vv):
-
-    q = vh/vv
-
-    dprvic = (q * (q + 3)) / np.power((q + 1), 2)
-
-    return dprvic.astype(np.float32)
-
-@ timing
-def rvic_index(vh, vv):
-
-    q = vh/vv
-
-    rvic = (4 * q) / (1 + q)
-
-    return rvic.astype(np.float32)
-
 # SLC indices    
 @timing
 def dprvi_index(c11, c12_real, c12_imag, c22, window_size):
@@ -398,15 +325,17 @@ def _main(settings):
     # PRVI
     prvi = prvi_index(c11, c12_real, c12_imag, c22, window_size=1)
     indices_list.append(prvi)
-    # DPSVI
-    dpsvi = dpsvi_index(vv, vh)
-    indices_list.append(dpsvi)
-    # DPSVIm
-    dpsvim = dpsvim_index(vv, vh)
-    indices_list.append(dpsvim)
-    # RVI_GRD
-    rvi_grd = rvi_grd_index(vv, vh)
-    indices_list.append(rvi_grd)
+    # GRD indices (DPSVI, DPSVIm, RVI) in a single fused pass (veg_indices/index_registry.py)
+    # VV max: None for the ROI max of VV, a fixed value or 'scene' to read it from the GRD statistics sidecar
+    vv_max = settings.get('vv_max')
+
+    if vv_max is None:
+        vv_max = np.nanmax(vv)
+    elif vv_max == 'scene':
+        vv_max = load_scene_stats(settings['grd_image'])['VV']['max']
+
+    grd_evaluator = compile_indices(settings.get('grd_indices', ['DPSVI', 'DPSVIm', 'RVI']), settings.get('index_backend'))
+    indices_list.extend(grd_evaluator(vv=vv, vh=vh, vv_max=vv_max).values())
     
     out_meta = slc.meta
 